@@ -0,0 +1,7 @@
+"""
+Platform-independent building blocks shared by the win-ax, mac-ax and
+linux-ax parsers (serving, traversal, output formats).
+
+Nothing in this package imports a platform accessibility API, so all of it
+can be tested and benchmarked on any OS.
+"""
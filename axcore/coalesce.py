@@ -0,0 +1,277 @@
+"""
+Coalescing and rate limiting of UI events in front of a LiveTree.
+
+Busy applications (terminals, video players, live dashboards) raise
+thousands of value and bounds changes per second, mostly on the same few
+elements. EventCoalescer sits between a backend's event callbacks and
+LiveTree.apply():
+
+1. put() only appends to a bounded inbox, so backend event threads never
+   block or call back into the accessibility API. When the inbox is full
+   (the consumer stalled), further events are discarded and the mirror is
+   reloaded instead: memory stays bounded and the tree ends up correct.
+2. The consumer merges inbox events into one pending entry per element.
+   Property values merge with the latest winning, and a re-read (no value)
+   wins over carried values. A structure event supersedes property events,
+   and focus keeps only the latest element.
+3. A structure entry marks its element's subtree dirty. Pending and later
+   events on descendants are absorbed, since the re-walk reads them anyway.
+4. An entry is delivered once its element has been quiet for `window`
+   seconds, or `max_delay` after its first event, at most `max_rate`
+   entries per second. Entries held back keep coalescing.
+5. Past max_pending elements, events on new elements are escalated to a
+   structure event on their top-level window (or, for elements not in the
+   mirror, to a reload). Pending entries are thus bounded by max_pending
+   plus the number of windows.
+"""
+
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from axcore.events import UIEvent
+
+FOCUS_KEY = ('focus',)
+DESKTOP_KEY = ('desktop',)
+RELOAD_KEY = ('reload',)
+RELOAD = 'reload'
+
+
+class _Pending:
+    __slots__ = ('kind', 'element', 'properties', 'first', 'last')
+
+    def __init__(self, kind, element, properties, when):
+        self.kind = kind
+        self.element = element
+        self.properties = dict(properties) if properties is not None else None
+        self.first = when
+        self.last = when
+
+
+class EventCoalescer:
+    """
+    Debouncing, coalescing and rate-limiting stage feeding a LiveTree.
+
+    put() may be called from any thread. drain() runs on a single consumer
+    thread, either the one started by start() or the caller's (tests and
+    benchmarks drive it with an injected clock).
+
+    Args:
+        live: axcore.events.LiveTree receiving the coalesced events
+        window: Seconds an element must be quiet before its entry is delivered
+        max_delay: Seconds after an entry's first event it is delivered anyway
+        max_rate: Maximum entries delivered per second (None = unlimited)
+        max_pending: Pending elements before new ones are escalated to windows
+        max_inbox: Undrained events before put() discards and forces a reload
+        clock: Monotonic time source, injectable for tests
+    """
+
+    def __init__(self, live, window=0.05, max_delay=0.5, max_rate=None, max_pending=10000, max_inbox=100000,
+                 clock=time.monotonic):
+        self.live = live
+        self.window = window
+        self.max_delay = max_delay
+        self.max_rate = max_rate
+        self.max_pending = max_pending
+        self.max_inbox = max_inbox
+        self.clock = clock
+        self.pending = {}  # key -> _Pending, in order of first event
+        self.dirty = set()  # keys of pending structure entries
+        self.counts = Counter()
+        self.delays = deque(maxlen=10000)  # seconds from first event to delivery
+        self.discarded = 0
+        self._inbox = []
+        self._overflow = False
+        self._lock = threading.Lock()  # inbox
+        self._state_lock = threading.Lock()  # everything drain() touches, for stats()
+        self._tokens = float(self._burst())
+        self._refilled = clock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _burst(self):
+        return max(1.0, self.max_rate * self.window) if self.max_rate else 0.0
+
+    def put(self, event):
+        """Queue an event without blocking; returns False if it was discarded"""
+        with self._lock:
+            if len(self._inbox) >= self.max_inbox:
+                self._overflow = True
+                self.discarded += 1
+                return False
+            self._inbox.append((event, self.clock()))
+            return True
+
+    def _key(self, event):
+        if event.kind == UIEvent.FOCUS:
+            return FOCUS_KEY
+        if event.element is None:
+            return DESKTOP_KEY
+        try:
+            identity = self.live.provider.identity(event.element)
+        except Exception:
+            identity = None
+        return identity if identity is not None else ('unkeyed', id(event))
+
+    def _under_dirty(self, key):
+        if RELOAD_KEY in self.pending:
+            return True
+        if not self.dirty:
+            return False
+        return any(ancestor in self.dirty for ancestor in self.live.ancestry(key))
+
+    def _escalate(self, key, event):
+        """Replace an event on a new element by a structure event on its window, a reload, or nothing"""
+        self.counts['escalated'] += 1
+        if key in self.live:
+            window = (self.live.ancestry(key) or [key])[-1]
+            return window, UIEvent(UIEvent.STRUCTURE, self.live.element(window))
+        if event.kind == UIEvent.PROPERTY:
+            return None, None  # the mirror ignores property events on elements it does not hold
+        return RELOAD_KEY, UIEvent(RELOAD)
+
+    def _merge(self, event, when):
+        key = self._key(event)
+        if key is not FOCUS_KEY and self._under_dirty(key):
+            self.counts['absorbed'] += 1
+            return
+        entry = self.pending.get(key)
+        if entry is None and len(self.pending) >= self.max_pending and key not in (FOCUS_KEY, DESKTOP_KEY):
+            key, event = self._escalate(key, event)
+            if key is None or (key is not RELOAD_KEY and self._under_dirty(key)):
+                self.counts['absorbed'] += 1
+                return
+            entry = self.pending.get(key)
+
+        if entry is None:
+            self.pending[key] = _Pending(event.kind, event.element, event.properties, when)
+            if event.kind in (UIEvent.STRUCTURE, RELOAD):
+                self.dirty.add(key)
+            return
+
+        self.counts['coalesced'] += 1
+        entry.last = when
+        entry.element = event.element
+        if entry.kind in (UIEvent.STRUCTURE, RELOAD):
+            return
+        if event.kind == UIEvent.STRUCTURE:
+            entry.kind, entry.properties = UIEvent.STRUCTURE, None
+            self.dirty.add(key)
+        elif event.kind == UIEvent.PROPERTY and entry.properties is not None:
+            if event.properties is None:
+                entry.properties = None
+            else:
+                entry.properties.update(event.properties)
+
+    def _budget(self, now):
+        if not self.max_rate:
+            return len(self.pending)
+        self._tokens = min(self._burst(), self._tokens + (now - self._refilled) * self.max_rate)
+        self._refilled = now
+        return int(self._tokens)
+
+    def drain(self, now=None, flush=False):
+        """
+        Merge queued events and deliver the entries that are due (all of
+        them with flush, ignoring windows and the rate cap). Returns the
+        number of entries delivered.
+        """
+        with self._lock:
+            inbox, self._inbox = self._inbox, []
+            overflow, self._overflow = self._overflow, False
+        with self._state_lock:
+            return self._deliver(inbox, overflow, self.clock() if now is None else now, flush)
+
+    def _deliver(self, inbox, overflow, now, flush):
+        if overflow:
+            # Events were lost: rebuild the mirror once instead of trusting the rest
+            self.pending = {RELOAD_KEY: _Pending(RELOAD, None, None, now)}
+            self.dirty = {RELOAD_KEY}
+            self.counts['overflows'] += 1
+        else:
+            for event, when in inbox:
+                self._merge(event, when)
+        self.counts['received'] += len(inbox)
+
+        budget = len(self.pending) if flush else self._budget(now)
+        due = []
+        covered = []
+        for key, entry in self.pending.items():
+            if len(due) >= budget:
+                break
+            if self.dirty and key not in self.dirty and self._under_dirty(key):
+                covered.append(key)  # arrived before its ancestor's structure event
+            elif flush or now - entry.last >= self.window or now - entry.first >= self.max_delay:
+                due.append(key)
+        for key in covered:
+            del self.pending[key]
+        self.counts['absorbed'] += len(covered)
+
+        delivered = 0
+        walked = set()
+        for key in due:
+            entry = self.pending.pop(key, None)
+            if entry is None:
+                continue
+            self.dirty.discard(key)
+            self.delays.append(now - entry.first)
+            delivered += 1
+            if entry.kind == RELOAD:
+                self.live.load()
+                self.counts['reloads'] += 1
+                self.pending.clear()
+                self.dirty.clear()
+                break
+            if entry.kind == UIEvent.STRUCTURE:
+                walked.add(key)
+            self.live.apply(UIEvent(entry.kind, entry.element, entry.properties))
+
+        if walked and self.pending:
+            # Entries inside re-walked subtrees were read by the walk
+            for key in [k for k in self.pending if any(a in walked for a in self.live.ancestry(k))]:
+                del self.pending[key]
+                self.dirty.discard(key)
+                self.counts['absorbed'] += 1
+
+        if self.max_rate and not flush:
+            self._tokens -= delivered
+        self.counts['delivered'] += delivered
+        return delivered
+
+    def start(self, tick=None):
+        """Drain on a daemon thread every tick seconds (default: half the window)"""
+        tick = tick if tick is not None else max(self.window / 2, 0.001)
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(tick):
+                try:
+                    self.drain()
+                except Exception as e:
+                    self.counts['errors'] += 1
+                    print(f"Error draining events: {e}", file=sys.stderr)
+            self.drain(flush=True)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop the drain thread after delivering everything still pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Counters, pending entries and delivery delay percentiles in milliseconds"""
+        with self._lock:
+            inbox = len(self._inbox)
+        with self._state_lock:
+            delays = sorted(self.delays)
+            stats = dict(self.counts, pending=len(self.pending), inbox=inbox, discarded=self.discarded)
+        if delays:
+            stats['delay_p50_ms'] = round(delays[len(delays) // 2] * 1000, 3)
+            stats['delay_p99_ms'] = round(delays[min(len(delays) - 1, int(len(delays) * 0.99))] * 1000, 3)
+        return stats
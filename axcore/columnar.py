@@ -0,0 +1,201 @@
+"""
+Columnar (struct-of-arrays) export of snapshot trees for analytics.
+
+to_columns flattens the tree of any parser's output (a plain tree list, the
+win-ax {"tree", ...} document, or an -e event) into NumPy arrays indexed by
+preorder node number:
+
+    bbox            int32 (N, 4)  x, y, width, height (rounded)
+    parent          int32         parent node, -1 for top-level nodes
+    depth           int32         0 for top-level nodes
+    first_child     int32         -1 for leaves
+    next_sibling    int32         -1 for last children
+    child_count     int32
+    subtree_end     int32         one past the last node of the subtree
+    window          int32         top-level ancestor (the window/application)
+    role            int32         code into role_categories
+    role_categories str           distinct roles in order of first appearance
+    {name,description,value}_offsets int64 (N + 1) into {...}_data (UTF-8 bytes)
+    state_<key>     int8          1 / 0, or -1 where the node has no such state
+
+Missing names and values (null in linux-ax output) become empty strings.
+Event outputs also carry time and duration as 0-d arrays. A subtree is the
+contiguous range [i, subtree_end[i]), so e.g. all enabled buttons overlapping
+a region inside window 2 is a handful of vectorised comparisons.
+
+numpy is only needed for this module; run it directly to convert saved JSON:
+
+    python -m axcore.columnar snapshot.json -o snapshot.npz
+"""
+
+import argparse
+import json
+import sys
+
+from axcore.compact import tree_path
+
+STRING_FIELDS = ('name', 'description', 'value')
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("numpy is required for columnar export (pip install numpy)")
+    return numpy
+
+
+def _int(value):
+    try:
+        return int(round(value))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def to_columns(output):
+    """Flatten the tree of a parser's output into a dict of NumPy arrays"""
+    np = _numpy()
+    path = tree_path(output)
+    tree = output
+    for key in path or ():
+        tree = tree[key]
+    if path is None or tree is None:
+        tree = []
+
+    bbox = []
+    parent = []
+    depth = []
+    window = []
+    roles = {}
+    role = []
+    strings = {field: [] for field in STRING_FIELDS}
+    states = {}
+
+    stack = [(node, -1, 0, -1) for node in reversed(list(tree))]
+    while stack:
+        node, parent_index, level, top = stack.pop()
+        index = len(parent)
+        parent.append(parent_index)
+        depth.append(level)
+        window.append(index if top < 0 else top)
+
+        box = node.get('bbox') or {}
+        bbox.append((_int(box.get('x', 0)), _int(box.get('y', 0)),
+                     _int(box.get('width', 0)), _int(box.get('height', 0))))
+        role.append(roles.setdefault(node.get('role') or '', len(roles)))
+        for field in STRING_FIELDS:
+            text = node.get(field)
+            strings[field].append(text if isinstance(text, str) else '' if text is None else str(text))
+        for key, flag in (node.get('states') or {}).items():
+            column = states.get(key)
+            if column is None:
+                column = states[key] = []
+            column.append((index, flag))
+
+        children = node.get('children') or []
+        stack.extend((child, index, level + 1, window[index]) for child in reversed(children))
+
+    count = len(parent)
+    parent = np.asarray(parent, dtype=np.int32)
+    columns = {
+        'bbox': np.asarray(bbox, dtype=np.int32).reshape(count, 4),
+        'parent': parent,
+        'depth': np.asarray(depth, dtype=np.int32),
+        'window': np.asarray(window, dtype=np.int32),
+        'role': np.asarray(role, dtype=np.int32),
+        'role_categories': np.asarray(list(roles), dtype=str),
+    }
+
+    # In preorder the children of a node appear in order of increasing index
+    first_child = np.full(count, -1, dtype=np.int32)
+    next_sibling = np.full(count, -1, dtype=np.int32)
+    child_count = np.bincount(parent[parent >= 0], minlength=count).astype(np.int32)
+    previous = {}
+    for child, p in enumerate(parent.tolist()):
+        if p in previous:
+            next_sibling[previous[p]] = child
+        elif p >= 0:
+            first_child[p] = child
+        previous[p] = child
+
+    # The subtree of i ends at the next node with depth <= depth[i]
+    subtree_end = np.full(count, count, dtype=np.int32)
+    open_nodes = []
+    for index, level in enumerate(depth):
+        while open_nodes and depth[open_nodes[-1]] >= level:
+            subtree_end[open_nodes.pop()] = index
+        open_nodes.append(index)
+
+    columns.update(first_child=first_child, next_sibling=next_sibling, child_count=child_count,
+                   subtree_end=subtree_end)
+
+    for field in STRING_FIELDS:
+        encoded = [text.encode('utf-8', 'surrogatepass') for text in strings[field]]
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        columns[f'{field}_offsets'] = offsets
+        columns[f'{field}_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    for key, values in states.items():
+        column = np.full(count, -1, dtype=np.int8)
+        if values:
+            indices, flags = zip(*values)
+            column[list(indices)] = [1 if flag else 0 for flag in flags]
+        columns[f'state_{key}'] = column
+
+    if isinstance(output, dict) and isinstance(output.get('data'), dict):
+        for key in ('time', 'duration'):
+            value = output.get(key, output['data'].get(key))
+            if value is not None:
+                columns[key] = np.asarray(value, dtype=np.int64)
+    return columns
+
+
+def column_string(columns, field, index):
+    """Decode one string of a name/description/value pool"""
+    offsets = columns[f'{field}_offsets']
+    return columns[f'{field}_data'][offsets[index]:offsets[index + 1]].tobytes().decode('utf-8', 'surrogatepass')
+
+
+def column_strings(columns, field):
+    """Decode a whole name/description/value pool into a list"""
+    offsets = columns[f'{field}_offsets'].tolist()
+    data = columns[f'{field}_data'].tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode('utf-8', 'surrogatepass') for i in range(len(offsets) - 1)]
+
+
+def save_columns(path, columns, compressed=True):
+    """Save columns as an .npz archive"""
+    np = _numpy()
+    (np.savez_compressed if compressed else np.savez)(path, **columns)
+
+
+def load_columns(path):
+    """Load an .npz archive written by save_columns into a dict of arrays"""
+    np = _numpy()
+    with np.load(path) as archive:
+        return {key: archive[key] for key in archive.files}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert snapshot JSON from any parser into columnar .npz')
+    parser.add_argument('input', help='Snapshot JSON file (- for stdin)')
+    parser.add_argument('-o', '--out', help='Output .npz path', required=True)
+    parser.add_argument('--uncompressed', help='Store arrays without zip compression', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        if args.input == '-':
+            output = json.load(sys.stdin)
+        else:
+            with open(args.input, encoding='utf-8') as f:
+                output = json.load(f)
+        save_columns(args.out, to_columns(output), not args.uncompressed)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
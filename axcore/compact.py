@@ -0,0 +1,308 @@
+"""
+Compact binary snapshot format.
+
+Node dicts are flattened in preorder into variable-length records; every
+string (roles, names, descriptions, values, serialised states, ...) is
+stored once in a per-snapshot string table and referenced by index. A file
+is laid out so that it can be written in one streaming pass and read back
+through mmap without decoding more than is asked for:
+
+    b'AXTB' u32 version
+    node records
+    string blob (UTF-8)
+    string offsets: u32 * (string_count + 1), relative to the blob
+    footer: u32 node_count, u32 string_count, u64 nodes_start,
+            u64 blob_start, u64 offsets_start, u32 envelope, b'AXTB'
+
+A node record is a sequence of unsigned LEB128 varints:
+
+    parent distance   index - parent index (0 for top-level nodes)
+    shape             string index of the node's key layout
+    one field per key of the shape, by kind:
+        "s"  string index of a str value
+        "b"  x, y, width, height as zigzag varints (int bbox dicts)
+        "j"  string index of the JSON-encoded value
+        "c"  nothing; children follow as later records
+
+The shape, e.g. [["name","s"],["role","s"],...,["children","c"]], is
+itself an interned string, so key names cost nothing per node and node dicts
+round-trip with their original key order. The envelope string holds the
+rest of the output document as JSON with the tree replaced by null, plus the
+path of keys leading to the tree.
+"""
+
+import json
+import mmap
+import struct
+
+from axcore.jsonstream import iter_json
+
+MAGIC = b'AXTB'
+VERSION = 1
+HEADER = struct.Struct('<4sI')
+FOOTER = struct.Struct('<IIQQQI4s')
+OFFSET = struct.Struct('<I')
+BBOX_KEYS = ('x', 'y', 'width', 'height')
+
+
+def tree_path(output):
+    """Keys leading to the tree list in a parser's output, or None"""
+    if isinstance(output, dict):
+        if 'tree' in output:
+            return ['tree']
+        data = output.get('data')
+        if isinstance(data, dict) and 'tree' in data:
+            return ['data', 'tree']
+        return None
+    return []
+
+
+def _kind(key, value):
+    if key == 'children' and isinstance(value, list) and all(isinstance(c, dict) for c in value):
+        return 'c'
+    if type(value) is str:
+        return 's'
+    if (key == 'bbox' and isinstance(value, dict) and tuple(value) == BBOX_KEYS and
+            all(type(v) is int for v in value.values())):
+        return 'b'
+    return 'j'
+
+
+def _varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value, out):
+    _varint(value * 2 if value >= 0 else -value * 2 - 1, out)
+
+
+class _StringTable:
+    def __init__(self):
+        self.index = {}
+        self.blob = bytearray()
+        self.offsets = [0]
+
+    def add(self, text):
+        found = self.index.get(text)
+        if found is None:
+            found = self.index[text] = len(self.offsets) - 1
+            self.blob += text.encode('utf-8', 'surrogatepass')
+            self.offsets.append(len(self.blob))
+        return found
+
+
+def write_compact(output, write, sanitize=None, chunk_size=1 << 16):
+    """
+    Stream output in the compact format to a binary write callable.
+
+    The tree may be any iterable of node dicts (e.g. a generator of window
+    trees); it is consumed once. sanitize is applied to every string as in
+    axcore.jsonstream. Returns the number of bytes written.
+    """
+    path = tree_path(output)
+    tree = output
+    for key in path or ():
+        tree = tree.get(key)
+    if path is None or tree is None:
+        # Nothing to flatten; keep the whole output in the envelope
+        path, tree = None, ()
+
+    strings = _StringTable()
+    shapes = {}
+    encode = json.dumps if sanitize is None else (lambda value: ''.join(iter_json(value, sanitize)))
+    out = bytearray(HEADER.pack(MAGIC, VERSION))
+    written = 0
+    count = 0
+
+    for top in tree:
+        stack = [(top, -1)]
+        while stack:
+            node, parent = stack.pop()
+            _varint(0 if parent < 0 else count - parent, out)
+
+            layout = tuple((key, _kind(key, value)) for key, value in node.items())
+            shape = shapes.get(layout)
+            if shape is None:
+                shape = shapes[layout] = strings.add(json.dumps([list(field) for field in layout]))
+            _varint(shape, out)
+
+            for key, kind in layout:
+                value = node[key]
+                if kind == 's':
+                    _varint(strings.add(sanitize(value) if sanitize else value), out)
+                elif kind == 'b':
+                    _zigzag(value['x'], out)
+                    _zigzag(value['y'], out)
+                    _zigzag(value['width'], out)
+                    _zigzag(value['height'], out)
+                elif kind == 'j':
+                    _varint(strings.add(encode(value)), out)
+                else:
+                    stack.extend((child, count) for child in reversed(value))
+            count += 1
+
+            if len(out) >= chunk_size:
+                write(bytes(out))
+                written += len(out)
+                out.clear()
+
+    # Everything but the tree, which is rebuilt from the node records
+    document = output
+    if path:
+        document = dict(output)
+        inner = document
+        for key in path[:-1]:
+            inner[key] = dict(inner[key])
+            inner = inner[key]
+        inner[path[-1]] = None
+    elif path is not None:
+        document = None
+    envelope = strings.add(encode({"path": path, "document": document}))
+
+    nodes_start = HEADER.size
+    blob_start = written + len(out)
+    out += strings.blob
+    offsets_start = written + len(out)
+    for offset in strings.offsets:
+        out += OFFSET.pack(offset)
+    out += FOOTER.pack(count, len(strings.offsets) - 1, nodes_start, blob_start, offsets_start, envelope, MAGIC)
+    write(bytes(out))
+    return written + len(out)
+
+
+def dumps_compact(output, sanitize=None):
+    """Encode output in the compact format and return the bytes"""
+    chunks = []
+    write_compact(output, chunks.append, sanitize)
+    return b''.join(chunks)
+
+
+class CompactReader:
+    """
+    Memory-mapped reader for compact snapshot files.
+
+    Strings are decoded on first use and node records only as they are
+    iterated, so scanning for a few attributes never builds the full tree.
+    """
+
+    def __init__(self, path=None, data=None):
+        self.file = None
+        if data is None:
+            self.file = open(path, 'rb')
+            data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = data
+        magic, version = HEADER.unpack_from(data, 0)
+        footer = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        if magic != MAGIC or footer[6] != MAGIC:
+            raise ValueError(f"Not a compact snapshot: {path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported compact snapshot version {version}: {path}")
+        (self.node_count, self.string_count, self.nodes_start, self.blob_start,
+         self.offsets_start, self.envelope, _) = footer
+        self.strings = {}
+        self.shapes = {}
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.node_count
+
+    def string(self, index):
+        text = self.strings.get(index)
+        if text is None:
+            start, end = struct.unpack_from('<II', self.data, self.offsets_start + index * OFFSET.size)
+            raw = self.data[self.blob_start + start:self.blob_start + end]
+            text = self.strings[index] = raw.decode('utf-8', 'surrogatepass')
+        return text
+
+    def _shape(self, index):
+        shape = self.shapes.get(index)
+        if shape is None:
+            shape = self.shapes[index] = [tuple(field) for field in json.loads(self.string(index))]
+        return shape
+
+    def __iter__(self):
+        """Yield (index, parent index or -1, node dict with empty children) in preorder"""
+        data = self.data
+        pos = self.nodes_start
+        for index in range(self.node_count):
+            values = []
+            fields = None
+            shape = None
+            while fields is None or len(values) < fields:
+                value = shift = 0
+                while True:
+                    byte = data[pos]
+                    pos += 1
+                    value |= (byte & 0x7f) << shift
+                    if byte < 0x80:
+                        break
+                    shift += 7
+                values.append(value)
+                if len(values) == 2:
+                    shape = self._shape(value)
+                    fields = 2 + sum(4 if kind == 'b' else 0 if kind == 'c' else 1 for _, kind in shape)
+
+            node = {}
+            i = 2
+            for key, kind in shape:
+                if kind == 's':
+                    node[key] = self.string(values[i])
+                    i += 1
+                elif kind == 'b':
+                    x, y, w, h = [v >> 1 if not v & 1 else -(v >> 1) - 1 for v in values[i:i + 4]]
+                    node[key] = {"x": x, "y": y, "width": w, "height": h}
+                    i += 4
+                elif kind == 'j':
+                    node[key] = json.loads(self.string(values[i]))
+                    i += 1
+                else:
+                    node[key] = []
+            yield index, (index - values[0] if values[0] else -1), node
+
+    def tree(self):
+        """Rebuild the nested list of top-level nodes"""
+        roots = []
+        nodes = []
+        for index, parent, node in self:
+            nodes.append(node)
+            (roots if parent < 0 else nodes[parent]["children"]).append(node)
+        return roots
+
+    def document(self):
+        """Rebuild the full output document the file was written from"""
+        envelope = json.loads(self.string(self.envelope))
+        path, document = envelope["path"], envelope["document"]
+        if path is None:
+            return document
+        if not path:
+            return self.tree()
+        inner = document
+        for key in path[:-1]:
+            inner = inner[key]
+        inner[path[-1]] = self.tree()
+        return document
+
+
+def load_compact(path):
+    """Read a compact snapshot file back into the parser's output document"""
+    with CompactReader(path) as reader:
+        return reader.document()
+
+
+def loads_compact(data):
+    """Decode compact snapshot bytes back into the output document"""
+    return CompactReader(data=data).document()
@@ -0,0 +1,447 @@
+"""
+Event-driven mirror of the accessibility tree for watch modes.
+
+Backends translate their native notifications (UIA structure/property/focus
+changed handlers, AXObserver notifications) into backend-neutral UIEvents
+and feed them to a LiveTree, which keeps an in-memory copy of the window
+trees current without re-walking them:
+
+- a PROPERTY event updates one node, from the values carried by the event
+  or by re-reading that element alone;
+- a STRUCTURE event re-walks the subtree of the element it was raised on
+  (or of its nearest known ancestor when the element is new), removes the
+  node when the element is gone, and re-lists the top-level windows when
+  raised on the desktop itself (element None);
+- a FOCUS event records the focused element.
+
+Published nodes are never mutated: an update copies the changed node and
+its ancestors (path copying) and shares every other node with the previous
+version. snapshot() therefore hands out the current tree without copying
+it, and it stays consistent however many events are applied afterwards.
+
+Every change is also appended to a bounded change feed:
+
+    {"seq": 12, "op": "set", "path": [0, 3, 1], "attrs": {"name": "Saved"}}
+    {"seq": 13, "op": "replace", "path": [0, 3], "node": {...subtree...}}
+    {"seq": 14, "op": "remove", "path": [0, 3, 2]}
+    {"seq": 15, "op": "add", "path": [2], "node": {...new window...}}
+    {"seq": 16, "op": "focus", "path": [0, 3, 1]}
+
+Paths are child indices from the top-level list at the time of the change,
+so apply_change() replays the feed onto a copy of an earlier snapshot.
+"""
+
+import copy
+import sys
+import threading
+from collections import Counter, deque
+
+# Ancestors walked up from an unknown element looking for a mirrored one
+MAX_ANCESTORS = 64
+
+
+class UIEvent:
+    """
+    One accessibility event in backend-neutral form.
+
+    Args:
+        kind: UIEvent.STRUCTURE, UIEvent.PROPERTY or UIEvent.FOCUS
+        element: Backend element the event was raised on (None for a
+            STRUCTURE event on the desktop: windows opened or closed)
+        properties: For PROPERTY events, the new values in output schema
+            keys ("name", "value", "bbox", ...); None re-reads the element
+    """
+
+    STRUCTURE = 'structure'
+    PROPERTY = 'property'
+    FOCUS = 'focus'
+
+    __slots__ = ('kind', 'element', 'properties')
+
+    def __init__(self, kind, element=None, properties=None):
+        self.kind = kind
+        self.element = element
+        self.properties = properties
+
+    def __repr__(self):
+        return f"UIEvent({self.kind!r}, {self.element!r}, {self.properties!r})"
+
+
+def _index(nodes, node):
+    """Position of node (by identity) in a children list"""
+    for i, candidate in enumerate(nodes):
+        if candidate is node:
+            return i
+    raise LookupError("node is not a child of its recorded parent")
+
+
+class LiveTree:
+    """
+    In-memory window trees kept current by applying UIEvents.
+
+    apply() and the read methods are thread-safe, so events can be applied
+    from a backend's callback thread while snapshot() and changes() serve
+    requests. Elements are tracked by provider identity; elements without
+    one get a private identity and are only updated through their ancestors.
+    Top-level windows without one are keyed by their bounds (and their order
+    among windows with the same bounds), so that re-listing the windows
+    finds them again.
+
+    Args:
+        provider: axcore.walker.Provider of the backend; parent() is used to
+            place structure events raised on elements not yet mirrored
+        roots: Callable returning the top-level elements (windows) to mirror
+        feed_size: Number of changes kept for changes(); older consumers
+            have to resynchronise from a snapshot
+    """
+
+    def __init__(self, provider, roots, feed_size=10000):
+        self.provider = provider
+        self.roots = roots
+        self.feed = deque(maxlen=feed_size)
+        self.sequence = 0
+        self.base = 0  # sequence of the last load(); older changes are gone
+        self.tree = []
+        self.focused = None
+        self.counts = Counter()
+        self._nodes = {}     # identity -> published node
+        self._parents = {}   # identity -> parent identity (None for top-level)
+        self._children = {}  # identity -> child identities
+        self._elements = {}  # identity -> backend element
+        self._top = []       # identities of the top-level nodes, in tree order
+        self._anonymous = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """(Re)build the mirror with a full walk of the roots"""
+        with self._lock:
+            self._nodes.clear()
+            self._parents.clear()
+            self._children.clear()
+            self._elements.clear()
+            self._top = []
+            tree = []
+            for key, element in self._top_keys(self.roots()):
+                identity, node = self._walk(element, None, key)
+                if node is not None:
+                    self._top.append(identity)
+                    tree.append(node)
+            self.tree = tree
+            self.feed.clear()
+            self.base = self.sequence
+            self.counts['loads'] += 1
+            return len(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def snapshot(self):
+        """The current tree with its sequence number and focused element path, without copying"""
+        with self._lock:
+            return {"sequence": self.sequence, "tree": self.tree, "focused": self._focused_path()}
+
+    def changes(self, since=0):
+        """
+        Changes after sequence `since`, in order.
+
+        "changes" is None when the feed no longer reaches back to `since`
+        (or the mirror was reloaded); the consumer should take a new snapshot.
+        """
+        with self._lock:
+            if since > self.sequence:
+                raise ValueError(f"Sequence {since} is ahead of the tree ({self.sequence})")
+            first = self.sequence - len(self.feed)
+            if since < first or since < self.base:
+                return {"sequence": self.sequence, "changes": None}
+            return {"sequence": self.sequence, "changes": list(self.feed)[since - first:]}
+
+    def stats(self):
+        """Event and read counters"""
+        with self._lock:
+            return dict(self.counts, nodes=len(self._nodes), sequence=self.sequence)
+
+    def __contains__(self, identity):
+        return identity in self._nodes
+
+    def ancestry(self, identity):
+        """Identities of identity's mirrored ancestors, nearest first (empty for top-level or unknown)"""
+        chain = []
+        parent = self._parents.get(identity)
+        while parent is not None:
+            chain.append(parent)
+            parent = self._parents.get(parent)
+        return chain
+
+    def element(self, identity):
+        """Backend element last seen for identity, or None"""
+        return self._elements.get(identity)
+
+    def apply(self, event):
+        """Apply one event, returning the change records it produced"""
+        with self._lock:
+            self.counts[event.kind] += 1
+            if event.element is None:
+                if event.kind == UIEvent.STRUCTURE:
+                    return self._reconcile()
+                self.counts['ignored'] += 1
+                return []
+
+            identity = self._identity(event.element)
+            if event.kind == UIEvent.FOCUS:
+                self.focused = identity
+                return [self._record('focus', path=self._focused_path())]
+
+            if identity not in self._nodes:
+                if event.kind == UIEvent.PROPERTY:
+                    self.counts['ignored'] += 1
+                    return []
+                identity = self._known_ancestor(event.element)
+                if identity is None:
+                    return self._reconcile()
+                element = self._elements[identity]
+            else:
+                element = event.element
+                self._elements[identity] = element
+
+            if event.kind == UIEvent.PROPERTY:
+                return self._update(identity, element, event.properties)
+            return self._rewalk(identity, element)
+
+    def consume(self, events):
+        """Apply events from an iterable (e.g. iter(queue.get, None)) until it is exhausted"""
+        for event in events:
+            try:
+                self.apply(event)
+            except Exception as e:
+                self.counts['errors'] += 1
+                print(f"Error applying {event.kind} event: {e}", file=sys.stderr)
+
+    def _identity(self, element):
+        try:
+            return self.provider.identity(element)
+        except Exception:
+            return None
+
+    def _top_keys(self, elements):
+        """(identity, element) of top-level elements, keying anonymous ones by their bounds"""
+        keys = []
+        seen = Counter()
+        for element in elements:
+            identity = self._identity(element)
+            if identity is None:
+                try:
+                    bounds = self.provider.bounds(element)
+                    bounds = tuple(bounds) if bounds is not None else None
+                except Exception:
+                    bounds = None
+                identity = ('window', bounds, seen[bounds])
+                seen[bounds] += 1
+            keys.append((identity, element))
+        return keys
+
+    def _known_ancestor(self, element):
+        for _ in range(MAX_ANCESTORS):
+            try:
+                element = self.provider.parent(element)
+            except Exception:
+                return None
+            if element is None:
+                return None
+            identity = self._identity(element)
+            if identity in self._nodes:
+                return identity
+        return None
+
+    def _focused_path(self):
+        return self._path(self.focused) if self.focused in self._nodes else None
+
+    def _record(self, op, **fields):
+        self.sequence += 1
+        record = {"seq": self.sequence, "op": op}
+        record.update(fields)
+        self.feed.append(record)
+        return record
+
+    def _walk(self, element, parent_identity, key=None):
+        """
+        Read element's subtree into new nodes and register them; returns
+        (identity, node). key replaces the provider identity of the element.
+        """
+        root_identity = root = None
+        queue = deque([(element, parent_identity, None)])
+        while queue:
+            element, parent_identity, parent = queue.popleft()
+            try:
+                node = self.provider.read(element)
+            except Exception as e:
+                if parent is not None:
+                    print(f"Error processing element: {e}", file=sys.stderr)
+                continue
+            self.counts['reads'] += 1
+
+            identity = key if parent is None and key is not None else self._identity(element)
+            if identity is None or identity in self._nodes:
+                self._anonymous += 1
+                identity = ('anonymous', self._anonymous)
+            self._nodes[identity] = node
+            self._parents[identity] = parent_identity
+            self._children[identity] = []
+            self._elements[identity] = element
+            if parent is None:
+                root_identity, root = identity, node
+            else:
+                parent["children"].append(node)
+                self._children[parent_identity].append(identity)
+
+            try:
+                for child in self.provider.children(element):
+                    queue.append((child, identity, node))
+            except Exception as e:
+                print(f"Error processing children: {e}", file=sys.stderr)
+        return root_identity, root
+
+    def _forget(self, identity):
+        """Unregister identity and its whole subtree"""
+        stack = [identity]
+        while stack:
+            current = stack.pop()
+            stack.extend(self._children.pop(current, ()))
+            self._nodes.pop(current, None)
+            self._parents.pop(current, None)
+            self._elements.pop(current, None)
+
+    def _path(self, identity):
+        """Child indices from the top-level list down to identity's node"""
+        path = []
+        node = self._nodes[identity]
+        parent = self._parents[identity]
+        while parent is not None:
+            parent_node = self._nodes[parent]
+            path.append(_index(parent_node["children"], node))
+            node, parent = parent_node, self._parents[parent]
+        path.append(_index(self.tree, node))
+        path.reverse()
+        return path
+
+    def _publish(self, identity, old, new):
+        """
+        Swap old (identity's published node) for new, or remove it when new
+        is None, copying its ancestors. Returns the path of the change.
+        """
+        path = []
+        parent = self._parents.get(identity)
+        while parent is not None:
+            parent_old = self._nodes[parent]
+            children = list(parent_old["children"])
+            index = _index(children, old)
+            if new is None:
+                del children[index]
+            else:
+                children[index] = new
+            path.append(index)
+            new = dict(parent_old, children=children)
+            self._nodes[parent] = new
+            old, parent = parent_old, self._parents[parent]
+
+        tree = list(self.tree)
+        index = _index(tree, old)
+        if new is None:
+            del tree[index]
+        else:
+            tree[index] = new
+        path.append(index)
+        self.tree = tree
+        path.reverse()
+        return path
+
+    def _update(self, identity, element, properties):
+        old = self._nodes[identity]
+        if properties is None:
+            try:
+                fresh = self.provider.read(element)
+            except Exception:
+                # The element is gone; its parent's structure event may follow
+                return self._remove(identity)
+            self.counts['reads'] += 1
+            properties = {k: v for k, v in fresh.items() if k != "children"}
+        attrs = {k: v for k, v in properties.items() if k != "children" and old.get(k) != v}
+        if not attrs:
+            self.counts['unchanged'] += 1
+            return []
+        new = dict(old, **attrs)
+        self._nodes[identity] = new
+        return [self._record('set', path=self._publish(identity, old, new), attrs=attrs)]
+
+    def _rewalk(self, identity, element):
+        old = self._nodes[identity]
+        parent = self._parents[identity]
+        self._forget(identity)
+        new_identity, new = self._walk(element, parent)
+        if new is None:
+            self._nodes[identity], self._parents[identity] = old, parent
+            return self._remove(identity)
+
+        self._relink(identity, new_identity, parent)
+        path = self._publish(new_identity, old, new)
+        return [self._record('replace', path=path, node=new)]
+
+    def _relink(self, identity, new_identity, parent):
+        """Point the parent (or the top-level list) at the re-walked subtree's identity"""
+        siblings = self._top if parent is None else self._children[parent]
+        siblings[siblings.index(identity)] = new_identity
+
+    def _remove(self, identity):
+        old = self._nodes[identity]
+        parent = self._parents[identity]
+        path = self._publish(identity, old, None)
+        siblings = self._top if parent is None else self._children[parent]
+        siblings.remove(identity)
+        self._forget(identity)
+        return [self._record('remove', path=path)]
+
+    def _reconcile(self):
+        """Re-list the top-level elements: drop closed windows, append new ones"""
+        try:
+            elements = list(self.roots())
+        except Exception as e:
+            print(f"Error listing top-level elements: {e}", file=sys.stderr)
+            return []
+        present = {}
+        for identity, element in self._top_keys(elements):
+            present.setdefault(identity, element)
+
+        records = []
+        for identity in [i for i in self._top if i not in present]:
+            records.extend(self._remove(identity))
+        for identity, element in present.items():
+            if identity in self._nodes:
+                continue
+            new_identity, node = self._walk(element, None, identity)
+            if node is None:
+                continue
+            self._top.append(new_identity)
+            self.tree = self.tree + [node]
+            records.append(self._record('add', path=[len(self.tree) - 1], node=node))
+        return records
+
+
+def apply_change(tree, change):
+    """Apply one change record to a mutable copy of a snapshot tree (list of top-level nodes)"""
+    op, path = change["op"], change["path"]
+    if op == 'focus':
+        return tree
+    siblings = tree
+    for index in path[:-1]:
+        siblings = siblings[index]["children"]
+    index = path[-1]
+    if op == 'set':
+        siblings[index].update(copy.deepcopy(change["attrs"]))
+    elif op == 'replace':
+        siblings[index] = copy.deepcopy(change["node"])
+    elif op == 'add':
+        siblings.insert(index, copy.deepcopy(change["node"]))
+    elif op == 'remove':
+        del siblings[index]
+    else:
+        raise ValueError(f"Unknown change op: {op}")
+    return tree
@@ -0,0 +1,515 @@
+"""
+Fake accessibility elements for exercising the parsers off-platform.
+
+FakeControl mimics the part of the pywinauto UIA wrapper surface that
+win-ax/uia_extractors.py relies on and counts every call made on it; its
+element_info.element mimics the raw IUIAutomationElement caching API.
+SyntheticProvider generates arbitrarily large trees for axcore.walker
+without materialising them, SyntheticWindows splits one into top-level
+windows for axcore.procwalk, and synthetic_events() a stream of UIEvents
+describing random changes to one. FakeAXProvider mimics the AXProvider interface
+of mac-ax/ax_extractors.py over FakeAXElement trees, with per-app latency
+and hangs.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+
+from axcore.events import UIEvent
+from axcore.walker import Provider, walk_tree
+
+SYNTHETIC_ROLES = ['Pane', 'Button', 'Text', 'Edit', 'List', 'ListItem', 'MenuItem', 'Hyperlink']
+
+# Subset of UIA control type ids, as in pywinauto's IUIA().known_control_type_ids
+FAKE_CONTROL_TYPES = {50000: 'Button', 50004: 'Edit', 50020: 'Text', 50032: 'Window', 50033: 'Pane'}
+FAKE_CONTROL_TYPE_IDS = {name: type_id for type_id, name in FAKE_CONTROL_TYPES.items()}
+
+# AXError codes returned by FakeAXProvider
+_AX_SUCCESS = 0
+_AX_CANNOT_COMPLETE = -25204
+_AX_NO_VALUE = -25212
+
+# UIA property ids the fake cache answers (IsValuePatternAvailable, ValueValue)
+_VALUE_PATTERN_AVAILABLE = 30043
+_VALUE_VALUE = 30045
+
+
+class FakeRect:
+    def __init__(self, left, top, right, bottom):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def width(self):
+        return self.right - self.left
+
+    def height(self):
+        return self.bottom - self.top
+
+
+class FakeElementInfo:
+    _next_runtime_id = 0
+
+    def __init__(self, name='', control_type='', description=''):
+        self.name = name
+        self.control_type = control_type
+        self.description = description
+        FakeElementInfo._next_runtime_id += 1
+        self.runtime_id = (42, FakeElementInfo._next_runtime_id)
+
+
+class FakeElementArray:
+    """Stand-in for IUIAutomationElementArray"""
+
+    def __init__(self, elements):
+        self._elements = elements
+
+    @property
+    def Length(self):
+        return len(self._elements)
+
+    def GetElement(self, index):
+        return self._elements[index]
+
+
+class FakeCachedElement:
+    """IUIAutomationElement returned by BuildUpdatedCache or FindAllBuildCache with its properties cached"""
+
+    def __init__(self, control):
+        info = control.element_info
+        self.control = control
+        self.calls = control.calls
+        self.CachedName = info.name
+        self.CachedControlType = FAKE_CONTROL_TYPE_IDS.get(info.control_type, 0)
+        self.CachedHelpText = info.description
+        self.CachedBoundingRectangle = FakeRect(*control._rect)
+        self.CachedIsEnabled = True
+        self.CachedIsOffscreen = not control._visible
+        self.CachedHasKeyboardFocus = False
+        self.CachedIsKeyboardFocusable = False
+        self._properties = {_VALUE_PATTERN_AVAILABLE: bool(control._value), _VALUE_VALUE: control._value}
+
+    def GetCachedPropertyValue(self, property_id):
+        self.calls['GetCachedPropertyValue'] += 1
+        return self._properties.get(property_id, False)
+
+    def FindAllBuildCache(self, scope, condition, cache_request):
+        """The children (only TreeScope_Children is modelled) with their properties cached"""
+        self.calls['FindAllBuildCache'] += 1
+        return FakeElementArray([FakeCachedElement(child) for child in self.control._children])
+
+
+class FakeUIAElement:
+    """Raw IUIAutomationElement behind a FakeControl"""
+
+    def __init__(self, control):
+        self.control = control
+
+    def BuildUpdatedCache(self, cache_request):
+        self.control.calls['BuildUpdatedCache'] += 1
+        return FakeCachedElement(self.control)
+
+    def GetCurrentPropertyValue(self, property_id):
+        if self.control.patterns is None:
+            raise NotImplementedError("live property reads are not modelled")
+        self.control.calls['GetCurrentPropertyValue'] += 1
+        return property_id in self.control.patterns
+
+
+class FakeControl:
+    """
+    Stand-in for pywinauto.controls.uiawrapper.UIAWrapper.
+
+    Args:
+        name, control_type, description: element_info fields
+        rect: (left, top, right, bottom)
+        children: List of child FakeControls
+        value: Returned by get_value()
+        visible: Returned by is_visible()
+        calls: Shared Counter that records every method call by name
+        handle: Native window handle
+        patterns: Pattern availability property ids the live element reports
+            (None: the element does not answer live property reads)
+    """
+
+    def __init__(self, name='', control_type='Pane', description='', rect=(0, 0, 0, 0),
+                 children=None, value='', visible=True, calls=None, handle=None, patterns=None):
+        self.element_info = FakeElementInfo(name, control_type, description)
+        self.element_info.element = FakeUIAElement(self)
+        self._rect = rect
+        self._children = list(children or [])
+        self._parent = None
+        for child in self._children:
+            child._parent = self
+        self._value = value
+        self._visible = visible
+        self.calls = calls if calls is not None else Counter()
+        self.handle = handle
+        self.patterns = patterns
+
+    def rectangle(self):
+        self.calls['rectangle'] += 1
+        return FakeRect(*self._rect)
+
+    def children(self):
+        self.calls['children'] += 1
+        return list(self._children)
+
+    def parent(self):
+        self.calls['parent'] += 1
+        return self._parent
+
+    def get_value(self):
+        self.calls['get_value'] += 1
+        return self._value
+
+    def window_text(self):
+        self.calls['window_text'] += 1
+        return self.element_info.name
+
+    def is_visible(self):
+        self.calls['is_visible'] += 1
+        return self._visible
+
+    def is_enabled(self):
+        self.calls['is_enabled'] += 1
+        return True
+
+
+class FakeDesktop:
+    """Stand-in for pywinauto.Desktop exposing a fixed list of top-level windows"""
+
+    def __init__(self, windows):
+        self._windows = list(windows)
+
+    def windows(self):
+        return list(self._windows)
+
+
+def build_fake_tree(depth, fanout, calls=None, name='node', rect=(0, 0, 100, 100), handle=None):
+    """Build a complete FakeControl tree of the given depth and fan-out"""
+    calls = calls if calls is not None else Counter()
+    children = []
+    if depth > 1:
+        children = [
+            build_fake_tree(depth - 1, fanout, calls, f"{name}.{i}", rect)
+            for i in range(fanout)
+        ]
+    return FakeControl(name=name, control_type='Pane' if children else 'Button',
+                       rect=rect, children=children, calls=calls, handle=handle)
+
+
+class SyntheticProvider(Provider):
+    """
+    Provider over an implicit complete tree of the given depth and fan-out.
+
+    Elements are (depth, index) tuples generated on demand, so trees with
+    millions of nodes cost no memory until walked. Every provider call is
+    counted in `calls` and optionally delayed by `latency` seconds to model
+    cross-process round-trips; with an `apartment` lock the delays are
+    serialised like COM calls into a single-threaded apartment. rename(),
+    remove() and restore() mutate the tree between walks, and elements are
+    their own identity for incremental walks.
+    """
+
+    def __init__(self, depth, fanout, latency=0.0, apartment=None):
+        self.depth = depth
+        self.fanout = fanout
+        self.latency = latency
+        self.apartment = apartment
+        self.calls = Counter()
+        self.renamed = {}
+        self.removed = set()
+
+    def rename(self, element, name):
+        self.renamed[element] = name
+
+    def remove(self, element):
+        self.removed.add(element)
+
+    def restore(self, element):
+        self.removed.discard(element)
+
+    @property
+    def root(self):
+        return (0, 0)
+
+    @property
+    def size(self):
+        """Total number of nodes in the tree"""
+        return sum(self.fanout ** level for level in range(self.depth))
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            if self.apartment is not None:
+                with self.apartment:
+                    time.sleep(self.latency)
+            else:
+                time.sleep(self.latency)
+
+    def children(self, element):
+        self._call('children')
+        depth, index = element
+        if depth + 1 >= self.depth:
+            return []
+        first = index * self.fanout
+        children = [(depth + 1, first + i) for i in range(self.fanout)]
+        return [c for c in children if c not in self.removed]
+
+    def parent(self, element):
+        self._call('parent')
+        depth, index = element
+        return (depth - 1, index // self.fanout) if depth else None
+
+    def role(self, element):
+        self._call('role')
+        depth, index = element
+        return SYNTHETIC_ROLES[(depth + index) % len(SYNTHETIC_ROLES)]
+
+    def name(self, element):
+        self._call('name')
+        return self.renamed.get(element, f"Element {element[0]}.{element[1]}")
+
+    def value(self, element):
+        self._call('value')
+        return str(element[1]) if element[1] % 3 == 0 else ''
+
+    def description(self, element):
+        self._call('description')
+        return ''
+
+    def bounds(self, element):
+        self._call('bounds')
+        depth, index = element
+        return (index % 64 * 20, depth * 30, 200 - depth, 24)
+
+    def states(self, element):
+        self._call('states')
+        return {"enabled": True, "visible": True, "focused": element == (0, 0)}
+
+    def identity(self, element):
+        return element
+
+
+class SyntheticWindows:
+    """
+    axcore.procwalk backend whose top-level windows are the first `windows`
+    children of a SyntheticProvider's root, keyed "0", "1", ..., each with
+    `depth` levels. Each instance (one per worker process) serialises its
+    provider calls through its own apartment lock.
+    """
+
+    def __init__(self, windows, depth, fanout, latency=0.0):
+        if windows > fanout:
+            raise ValueError("windows must not exceed fanout")
+        self.windows = windows
+        self.provider = SyntheticProvider(depth + 1, fanout, latency, threading.Lock())
+
+    def keys(self):
+        return [str(i) for i in range(self.windows)]
+
+    def walk(self, key, deadline=None, max_nodes=None, stats=None, prune=None):
+        index = int(key)
+        if index >= self.windows:
+            return None
+        return walk_tree(self.provider, (1, index), deadline=deadline, stats=stats, max_nodes=max_nodes, prune=prune)
+
+
+def synthetic_events(provider, count, seed=0, structure=0.05, focus=0.05, carry_values=True, hot=None):
+    """
+    Yield count UIEvents for random changes to a SyntheticProvider's tree.
+
+    Each change is made on the provider just before its event is yielded,
+    like a backend notification arriving after the UI changed: renames
+    (PROPERTY, carrying the new name unless carry_values is False), removals
+    (STRUCTURE on the parent, like UIA's ChildRemoved), restorations
+    (STRUCTURE on the restored element, like ChildAdded) and focus moves.
+    structure and focus are the fractions of those event kinds. With hot=N
+    all events hit the same N random elements, like a terminal or a ticker
+    updating a few controls continuously.
+    """
+    rng = random.Random(seed)
+
+    def pick():
+        depth = rng.randrange(1, provider.depth)
+        return (depth, rng.randrange(provider.fanout ** depth))
+
+    hot_elements = [pick() for _ in range(hot)] if hot else None
+    for n in range(count):
+        element = rng.choice(hot_elements) if hot_elements else pick()
+        roll = rng.random()
+        if roll < focus:
+            yield UIEvent(UIEvent.FOCUS, element)
+        elif roll < focus + structure:
+            if element in provider.removed:
+                provider.restore(element)
+                yield UIEvent(UIEvent.STRUCTURE, element)
+            else:
+                provider.remove(element)
+                yield UIEvent(UIEvent.STRUCTURE, provider.parent(element))
+        else:
+            name = f"Renamed {n}"
+            provider.rename(element, name)
+            yield UIEvent(UIEvent.PROPERTY, element, {"name": name} if carry_values else None)
+
+
+class FakeAXElement:
+    """
+    Stand-in for an AXUIElementRef: a dict of AX attribute values.
+
+    Positions and sizes are (x, y) / (width, height) tuples. Elements belong
+    to the FakeAXApp whose windows contain them (app is set by FakeAXApp,
+    which also numbers its windows like CGWindowIDs).
+    """
+
+    def __init__(self, role='AXGroup', title='', value=None, description='', position=(0, 0), size=(0, 0),
+                 children=None):
+        self.attributes = {
+            'AXRole': role,
+            'AXTitle': title,
+            'AXValue': value,
+            'AXDescription': description,
+            'AXPosition': position,
+            'AXSize': size,
+            'AXChildren': list(children or []),
+        }
+        self.app = None
+        self.number = None
+
+
+class FakeAXApp(FakeAXElement):
+    """
+    Application element with windows.
+
+    Args:
+        title: Application name
+        windows: List of window FakeAXElements
+        latency: Seconds each AX call on the app takes; calls slower than
+            the messaging timeout fail with kAXErrorCannotComplete after it
+        hang: Calls block (ignoring the messaging timeout) until the
+            provider's release() is called
+    """
+
+    _next_pid = 100
+    _next_window_number = 1000
+
+    def __init__(self, title, windows=(), latency=0.0, hang=False):
+        super().__init__(role='AXApplication', title=title)
+        self.attributes['AXWindows'] = list(windows)
+        self.latency = latency
+        self.hang = hang
+        self.app = self
+        FakeAXApp._next_pid += 1
+        self.pid = FakeAXApp._next_pid
+        for window in windows:
+            FakeAXApp._next_window_number += 1
+            window.number = FakeAXApp._next_window_number
+        stack = list(windows)
+        while stack:
+            element = stack.pop()
+            element.app = self
+            stack.extend(element.attributes['AXChildren'])
+
+
+def build_fake_ax_window(depth, fanout, title='window', position=(0, 0), size=(800, 600)):
+    """Build a complete FakeAXElement window tree of the given depth and fan-out"""
+    children = []
+    if depth > 1:
+        children = [build_fake_ax_window(depth - 1, fanout, f"{title}.{i}", position, (40, 20))
+                    for i in range(fanout)]
+    return FakeAXElement(role='AXWindow' if title == 'window' else 'AXButton', title=title,
+                         position=position, size=size, children=children)
+
+
+class FakeAXProvider:
+    """
+    Fake accessibility API over FakeAXApp trees.
+
+    Every round-trip is counted in `calls`: per attribute for copy_attribute,
+    as 'multiple' for copy_multiple_attributes. With batched=False the
+    latter falls back to one copy_attribute per attribute, modelling the
+    pre-batching extractor. set_messaging_timeout is honoured for slow apps.
+    """
+
+    def __init__(self, apps, error=_AX_SUCCESS, batched=True):
+        self.apps = list(apps)
+        self.error = error
+        self.batched = batched
+        self.calls = Counter()
+        self.timeouts = {}
+        self.released = threading.Event()
+        self._lock = threading.Lock()
+
+    def release(self):
+        """Unblock the calls of hanging apps"""
+        self.released.set()
+
+    def applications(self):
+        if self.error != _AX_SUCCESS:
+            return self.error, None
+        return _AX_SUCCESS, list(self.apps)
+
+    def set_messaging_timeout(self, element, seconds):
+        self.timeouts[id(element.app)] = seconds
+        return _AX_SUCCESS
+
+    def pid(self, app):
+        return _AX_SUCCESS, app.pid
+
+    def window_number(self, window):
+        return window.number
+
+    def window_list(self):
+        """CGWindowList entries of every app window, titled like the AX window"""
+        return [{'pid': app.pid, 'number': window.number,
+                 'bounds': window.attributes['AXPosition'] + window.attributes['AXSize'],
+                 'title': window.attributes['AXTitle'], 'layer': 0}
+                for app in self.apps for window in app.attributes['AXWindows']]
+
+    def _round_trip(self, element, name):
+        """Count and delay one call, returning an AXError if it fails"""
+        with self._lock:
+            self.calls[name] += 1
+        app = element.app
+        if app is not None and app.hang:
+            self.released.wait()
+            return _AX_CANNOT_COMPLETE
+        if app is not None and app.latency:
+            limit = self.timeouts.get(id(app))
+            time.sleep(app.latency if limit is None else min(app.latency, limit))
+            if limit is not None and app.latency > limit:
+                return _AX_CANNOT_COMPLETE
+        return _AX_SUCCESS
+
+    def copy_attribute(self, element, attribute):
+        err = self._round_trip(element, attribute)
+        if err != _AX_SUCCESS:
+            return err, None
+        value = element.attributes.get(attribute)
+        if value is None:
+            return _AX_NO_VALUE, None
+        return _AX_SUCCESS, value
+
+    def copy_multiple_attributes(self, element, attributes):
+        if not self.batched:
+            values = []
+            for attribute in attributes:
+                err, value = self.copy_attribute(element, attribute)
+                if err == _AX_CANNOT_COMPLETE:
+                    return err, None
+                values.append(value)
+            return _AX_SUCCESS, values
+        err = self._round_trip(element, 'multiple')
+        if err != _AX_SUCCESS:
+            return err, None
+        return _AX_SUCCESS, [element.attributes.get(attribute) for attribute in attributes]
+
+    def point(self, value):
+        return value
+
+    def size(self, value):
+        return value
@@ -0,0 +1,185 @@
+"""
+Streaming JSON serialisation for snapshot output.
+
+iter_json yields the same text as json.dumps(value) with the default
+separators, but without building the whole string: containers are walked
+iteratively, so arbitrarily deep trees do not hit the recursion limit, and
+any iterator (e.g. a generator of window trees) is consumed lazily as a JSON
+array. An optional sanitize callable is applied to strings as they are
+emitted, matching the output of cleaning the value first with a recursive
+copy that descends into dicts and lists only (dict keys and tuples are left
+as they are).
+
+Without sanitize, small shallow containers (leaf nodes, bboxes, state
+lists: at most MAX_FAST_ITEMS items, nesting only flat containers) are
+handed whole to json's C encoder. Anything larger, such as a node with
+children or an event wrapping a tree, goes through the iterative path, so
+chunks stay about one leaf node long however big the tree is.
+"""
+
+import json
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+INFINITY = float('inf')
+DEFAULT_SEPARATORS = (', ', ': ')
+COMPACT_SEPARATORS = (',', ':')
+# Largest container (and nested container) encoded in one call to json.dumps
+MAX_FAST_ITEMS = 64
+
+
+def _float(value):
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return float.__repr__(value)
+
+
+def _key(key):
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return _float(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(key).__name__}")
+
+
+def _flat(items):
+    for item in items:
+        if isinstance(item, (dict, list, tuple)) or hasattr(item, '__next__'):
+            return False
+    return True
+
+
+def _dumps(value, ensure_ascii, separators):
+    """
+    JSON text of a small shallow container from the C encoder, or None if it
+    needs the iterative path (too large, nested containers, iterators or
+    values json cannot encode).
+    """
+    if len(value) > MAX_FAST_ITEMS:
+        return None
+    for item in (value.values() if isinstance(value, dict) else value):
+        if isinstance(item, (dict, list, tuple)):
+            if len(item) > MAX_FAST_ITEMS or not _flat(item.values() if isinstance(item, dict) else item):
+                return None
+        elif hasattr(item, '__next__'):
+            return None
+    try:
+        return json.dumps(value, ensure_ascii=ensure_ascii, separators=separators)
+    except TypeError:
+        return None
+
+
+def iter_json(value, sanitize=None, ensure_ascii=True, separators=None):
+    """
+    Yield JSON text for value chunk by chunk.
+
+    Args:
+        value: Object to serialise; dicts, lists, tuples and other iterators
+            become JSON containers
+        sanitize: Callable applied to every string inside dicts and lists
+        ensure_ascii: Escape non-ASCII characters, as json.dumps does by default
+        separators: (item separator, key separator) as for json.dumps
+            (default: (', ', ': '); COMPACT_SEPARATORS drops the spaces)
+    """
+    encode = encode_basestring_ascii if ensure_ascii else encode_basestring
+    separators = separators or DEFAULT_SEPARATORS
+    item_separator, key_separator = separators
+    stack = []  # [iterator, is_dict, first, sanitize]
+    clean = sanitize
+    while True:
+        if isinstance(value, str):
+            yield encode(clean(value) if clean else value)
+        elif value is None:
+            yield 'null'
+        elif value is True:
+            yield 'true'
+        elif value is False:
+            yield 'false'
+        elif isinstance(value, int):
+            yield int.__repr__(value)
+        elif isinstance(value, float):
+            yield _float(value)
+        elif isinstance(value, dict):
+            text = None if clean else _dumps(value, ensure_ascii, separators)
+            if text is not None:
+                yield text
+            else:
+                stack.append([iter(value.items()), True, True, clean])
+                yield '{'
+        elif isinstance(value, tuple):
+            stack.append([iter(value), False, True, None])
+            yield '['
+        elif isinstance(value, list):
+            text = None if clean else _dumps(value, ensure_ascii, separators)
+            if text is not None:
+                yield text
+            else:
+                stack.append([iter(value), False, True, clean])
+                yield '['
+        elif hasattr(value, '__next__'):
+            stack.append([iter(value), False, True, clean])
+            yield '['
+        else:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+        while stack:
+            frame = stack[-1]
+            try:
+                item = next(frame[0])
+            except StopIteration:
+                stack.pop()
+                yield '}' if frame[1] else ']'
+                continue
+            separator = '' if frame[2] else item_separator
+            frame[2] = False
+            clean = frame[3]
+            if frame[1]:
+                key, value = item
+                separator += encode(_key(key)) + key_separator
+            else:
+                value = item
+            # Strings dominate node dicts; emit them without a trip through the outer loop
+            if type(value) is str:
+                yield separator + encode(clean(value) if clean else value)
+                continue
+            if separator:
+                yield separator
+            break
+        else:
+            return
+
+
+def write_json(value, write, sanitize=None, ensure_ascii=True, buffer_size=1 << 16, separators=None):
+    """
+    Stream JSON for value to a write callable (e.g. file.write).
+
+    Chunks are joined into writes of about buffer_size characters, so memory
+    is bounded by the buffer and the value itself rather than the full text.
+    Returns the number of characters written.
+    """
+    buffered = []
+    size = 0
+    total = 0
+    for chunk in iter_json(value, sanitize, ensure_ascii, separators):
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            write(''.join(buffered))
+            total += size
+            buffered = []
+            size = 0
+    if buffered:
+        write(''.join(buffered))
+        total += size
+    return total
@@ -0,0 +1,182 @@
+"""
+Per-snapshot instrumentation shared by the dumpers.
+
+A Metrics object collects, for one snapshot:
+
+    phases   milliseconds per named phase (enumerate, focus, points, walk,
+             serialize, write, ...). Phases may nest and are
+             reported exclusive of the phases nested in them, so streamed
+             output (the walk runs inside serialize, which runs around
+             write) still splits cleanly. Repeated phases accumulate.
+    windows  node counts per top-level window (by window key)
+    calls    provider calls and milliseconds by attribute
+    errors   counts by error type
+
+The dumpers put as_dict() in -e output as data.metrics (phases up to the
+walk; the output is serialised after that) and, with --metrics FILE,
+append the complete record including serialize and write as one JSON line
+per snapshot with write_metrics().
+
+profiled() wraps a snapshot in cProfile (calling thread only) or in a
+sampling profiler that covers the walker threads too.
+"""
+
+import cProfile
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Instrumentation of one snapshot; phase() and error() may be used from
+    several threads (each thread nests its own phases).
+
+    Args:
+        clock: Time source in seconds, injectable for tests
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = {}  # name -> exclusive seconds, in order of first use
+        self.windows = None
+        self.calls = None
+        self.errors = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the block as phase name, excluding phases nested in it"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        frame = [0.0]  # time spent in nested phases
+        stack.append(frame)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed - frame[0]
+
+    def timed(self, name, iterable):
+        """Iterate, timing only the production of each item as phase name"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def timed_call(self, name, function):
+        """Wrap function so that its calls are timed as phase name"""
+        def call(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return call
+
+    def error(self, error, count=1):
+        """Count an exception (by class name) or an error type given as a string"""
+        kind = error if isinstance(error, str) else type(error).__name__
+        with self._lock:
+            self.errors[kind] += count
+
+    def as_dict(self):
+        metrics = {"phases": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}}
+        if self.windows is not None:
+            metrics["windows"] = self.windows
+        if self.calls is not None:
+            metrics["calls"] = self.calls
+        metrics["errors"] = dict(self.errors)
+        return metrics
+
+
+def write_metrics(path, record):
+    """Append a metrics record to a JSON-lines file"""
+    try:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except IOError as e:
+        print(f"Error writing metrics to {path}: {e}", file=sys.stderr)
+
+
+class StackSampler:
+    """
+    Sampling profiler: every `interval` seconds a background thread records
+    the stack of every other thread. write() saves them in collapsed-stack
+    format ("outer;inner;leaf count" lines, as read by flamegraph.pl and
+    speedscope).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.replace(';', ':')}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profiled(path, interval=0.005):
+    """
+    Profile the block into path: pstats from cProfile for a .prof path
+    (calling thread only), collapsed stacks of all threads otherwise.
+    Does nothing without a path.
+    """
+    if not path:
+        yield
+        return
+    if path.endswith('.prof'):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+    else:
+        sampler = StackSampler(interval)
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            sampler.write(path)
@@ -0,0 +1,349 @@
+"""
+Keyframe + delta encoding of the -e event stream.
+
+A patch log is a JSON-lines file with one record per snapshot event:
+
+    {"time": T, "type": "keyframe", "data": {...full event data...}}
+    {"time": T, "type": "delta", "data": {...event data except tree...}, "ops": [...]}
+
+Node ids are implicit, so they cost no bytes in the log: a keyframe numbers
+the nodes of `data.tree` in preorder from 1 (0 is the virtual root holding
+the tree list), and every node added by a delta takes the next ids in op
+order, preorder within the added subtree. Writer and reader assign ids the
+same way, so ops can refer to them:
+
+    {"op": "remove", "id": 12}
+    {"op": "add", "parent": 3, "index": 0, "node": {...subtree...}}
+    {"op": "move", "id": 7, "index": 2}
+    {"op": "set", "id": 5, "attrs": {"name": "New title"}, "unset": ["states"]}
+
+Children are matched between snapshots by (role, name) first and then by
+role alone, so a renamed node yields a `set` rather than remove + add.
+EventLogReader rebuilds the snapshot at any time by seeking to the nearest
+preceding keyframe and replaying the deltas after it.
+"""
+
+import bisect
+import json
+import os
+import re
+from collections import defaultdict, deque
+
+HEADER_PATTERN = re.compile(rb'^\{"time":\s*(-?\d+),\s*"type":\s*"(\w+)"')
+_MISSING = object()
+
+
+class _Node:
+    __slots__ = ('id', 'attrs', 'children')
+
+    def __init__(self, node_id, attrs):
+        self.id = node_id
+        self.attrs = attrs
+        self.children = []
+
+
+def _attrs(node):
+    return {k: v for k, v in node.items() if k != 'children'}
+
+
+class PatchState:
+    """Id-numbered mirror of the last snapshot tree, shared by writer and reader"""
+
+    def __init__(self):
+        self.root = None
+        self.next_id = 1
+        self.index = None  # id -> (node, parent), built on demand by apply()
+
+    def reset(self, tree):
+        """Start over from a keyframe tree (list of root nodes)"""
+        self.next_id = 1
+        self.root = _Node(0, {})
+        self.root.children = [self._track(node) for node in tree]
+        self.index = None
+
+    def _track(self, node):
+        """Mirror a node dict and its subtree, assigning ids in preorder"""
+        mirror = None
+        stack = [(node, None)]
+        while stack:
+            current, parent = stack.pop()
+            tracked = _Node(self.next_id, _attrs(current))
+            self.next_id += 1
+            if parent is None:
+                mirror = tracked
+            else:
+                parent.children.append(tracked)
+            for child in reversed(current.get('children', [])):
+                stack.append((child, tracked))
+        return mirror
+
+    def tree(self):
+        """Rebuild the snapshot tree as plain node dicts"""
+        out = []
+        stack = [(child, out) for child in reversed(self.root.children)]
+        while stack:
+            tracked, siblings = stack.pop()
+            node = dict(tracked.attrs)
+            node['children'] = []
+            siblings.append(node)
+            stack.extend((child, node['children']) for child in reversed(tracked.children))
+        return out
+
+    def diff(self, tree):
+        """Compute ops turning the current tree into `tree` and advance to it"""
+        ops = []
+        self.index = None
+        stack = [(self.root, tree)]
+        while stack:
+            old, new_children = stack.pop()
+            matches = _match_children(old.children, new_children)
+
+            matched = set(j for j in matches if j is not None)
+            for j, child in enumerate(old.children):
+                if j not in matched:
+                    ops.append({"op": "remove", "id": child.id})
+            working = [old.children[j] for j in sorted(matched)]
+
+            pending = []
+            for i, new in enumerate(new_children):
+                j = matches[i]
+                if j is None:
+                    ops.append({"op": "add", "parent": old.id, "index": i, "node": new})
+                    working.insert(i, self._track(new))
+                    continue
+
+                tracked = old.children[j]
+                if working[i] is not tracked:
+                    working.remove(tracked)
+                    working.insert(i, tracked)
+                    ops.append({"op": "move", "id": tracked.id, "index": i})
+
+                attrs = _attrs(new)
+                if attrs != tracked.attrs:
+                    changed = {k: v for k, v in attrs.items() if tracked.attrs.get(k, _MISSING) != v}
+                    unset = [k for k in tracked.attrs if k not in attrs]
+                    op = {"op": "set", "id": tracked.id, "attrs": changed}
+                    if unset:
+                        op["unset"] = unset
+                    ops.append(op)
+                    tracked.attrs = attrs
+                pending.append((tracked, new.get('children', [])))
+
+            old.children = working
+            stack.extend(reversed(pending))
+        return ops
+
+    def apply(self, ops):
+        """Apply ops produced by diff() to the current tree"""
+        if self.index is None:
+            self.index = {0: (self.root, None)}
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                for child in node.children:
+                    self.index[child.id] = (child, node)
+                    stack.append(child)
+
+        for op in ops:
+            kind = op["op"]
+            if kind == "remove":
+                node, parent = self.index[op["id"]]
+                parent.children.remove(node)
+                stack = [node]
+                while stack:
+                    current = stack.pop()
+                    del self.index[current.id]
+                    stack.extend(current.children)
+            elif kind == "add":
+                parent = self.index[op["parent"]][0]
+                node = self._track(op["node"])
+                parent.children.insert(op["index"], node)
+                self.index[node.id] = (node, parent)
+                stack = [node]
+                while stack:
+                    current = stack.pop()
+                    for child in current.children:
+                        self.index[child.id] = (child, current)
+                        stack.append(child)
+            elif kind == "move":
+                node, parent = self.index[op["id"]]
+                parent.children.remove(node)
+                parent.children.insert(op["index"], node)
+            elif kind == "set":
+                node = self.index[op["id"]][0]
+                node.attrs.update(op["attrs"])
+                for key in op.get("unset", ()):
+                    node.attrs.pop(key, None)
+            else:
+                raise ValueError(f"Unknown patch op: {kind}")
+
+
+def _match_children(old_children, new_children):
+    """For each new child, the index of its matching old child or None"""
+    matches = [None] * len(new_children)
+    if not old_children:
+        return matches
+
+    by_key = defaultdict(deque)
+    by_role = defaultdict(deque)
+    for j, child in enumerate(old_children):
+        by_key[(child.attrs.get('role'), child.attrs.get('name'))].append(j)
+        by_role[child.attrs.get('role')].append(j)
+
+    used = set()
+    for i, new in enumerate(new_children):
+        candidates = by_key.get((new.get('role'), new.get('name')))
+        if candidates:
+            j = candidates.popleft()
+            matches[i] = j
+            used.add(j)
+
+    for i, new in enumerate(new_children):
+        if matches[i] is not None:
+            continue
+        candidates = by_role.get(new.get('role'))
+        while candidates and candidates[0] in used:
+            candidates.popleft()
+        if candidates:
+            j = candidates.popleft()
+            matches[i] = j
+            used.add(j)
+    return matches
+
+
+class PatchEncoder:
+    """
+    Turns successive events into keyframe and delta records.
+
+    Args:
+        keyframe_interval: Emit a keyframe at least every this many events
+    """
+
+    def __init__(self, keyframe_interval=60):
+        self.keyframe_interval = keyframe_interval
+        self.state = PatchState()
+        self.since_keyframe = None
+
+    def encode(self, event):
+        data = dict(event["data"])
+        tree = data.pop("tree")
+        if self.since_keyframe is None or self.since_keyframe + 1 >= self.keyframe_interval:
+            self.state.reset(tree)
+            self.since_keyframe = 0
+            return {"time": event["time"], "type": "keyframe", "data": event["data"]}
+
+        ops = self.state.diff(tree)
+        self.since_keyframe += 1
+        return {"time": event["time"], "type": "delta", "data": data, "ops": ops}
+
+
+def _apply_record(state, record, build=True):
+    """Advance state by one record and return the reconstructed event"""
+    data = dict(record["data"])
+    if record["type"] == "keyframe":
+        state.reset(data["tree"])
+    else:
+        state.apply(record["ops"])
+        if build:
+            data["tree"] = state.tree()
+    return {"time": record["time"], "data": data}
+
+
+class EventLogReader:
+    """
+    Random access to snapshots in a patch log.
+
+    Only record headers are parsed when the file is opened; event() seeks to
+    the nearest keyframe at or before the requested event and replays from
+    there, or continues from the last reconstructed event when that is closer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []  # (time, type, byte offset)
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                match = HEADER_PATTERN.match(line)
+                if match:
+                    self.records.append((int(match.group(1)), match.group(2).decode(), offset))
+                offset += len(line)
+        self.state = PatchState()
+        self.position = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def times(self):
+        return [r[0] for r in self.records]
+
+    def _read(self, f, index):
+        f.seek(self.records[index][2])
+        return json.loads(f.readline())
+
+    def event(self, index):
+        """Reconstruct the index-th event"""
+        keyframe = index
+        while keyframe >= 0 and self.records[keyframe][1] != "keyframe":
+            keyframe -= 1
+        if keyframe < 0:
+            raise ValueError(f"No keyframe before event {index} in {self.path}")
+
+        if self.position is not None and keyframe <= self.position <= index:
+            start = self.position + 1
+        else:
+            start = keyframe
+
+        with open(self.path, 'rb') as f:
+            for i in range(start, index):
+                _apply_record(self.state, self._read(f, i), build=False)
+            record = self._read(f, index)
+            if start <= index:
+                event = _apply_record(self.state, record)
+            else:
+                event = {"time": record["time"], "data": dict(record["data"])}
+                event["data"]["tree"] = self.state.tree()
+        self.position = index
+        return event
+
+    def snapshot_at(self, time):
+        """Reconstruct the latest event at or before `time`, or None"""
+        index = bisect.bisect_right(self.times(), time) - 1
+        return None if index < 0 else self.event(index)
+
+    def __iter__(self):
+        state = PatchState()
+        with open(self.path, 'rb') as f:
+            for i in range(len(self.records)):
+                yield _apply_record(state, self._read(f, i))
+
+
+class EventLogWriter:
+    """
+    Appends events to a patch log, restoring encoder state from an existing
+    log so one-shot runs can keep extending the same file.
+
+    Args:
+        path: Log file path
+        keyframe_interval: Emit a keyframe at least every this many events
+        dumps: JSON encoder for each record line
+    """
+
+    def __init__(self, path, keyframe_interval=60, dumps=json.dumps):
+        self.path = path
+        self.dumps = dumps
+        self.encoder = PatchEncoder(keyframe_interval)
+        if os.path.exists(path) and os.path.getsize(path):
+            reader = EventLogReader(path)
+            if len(reader):
+                last = len(reader) - 1
+                reader.event(last)
+                self.encoder.state = reader.state
+                keyframes = [i for i, r in enumerate(reader.records) if r[1] == "keyframe"]
+                self.encoder.since_keyframe = last - keyframes[-1]
+
+    def write(self, event):
+        record = self.encoder.encode(event)
+        with open(self.path, 'a') as f:
+            f.write(self.dumps(record) + '\n')
+        return record
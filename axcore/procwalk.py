@@ -0,0 +1,135 @@
+"""
+Window walks on a pool of worker processes.
+
+Thread pools stop scaling after a few workers: the per-node Python work
+(node dicts, getters, string conversion) holds the GIL, and COM objects
+created on one apartment serialise their calls through it. ProcessWalker
+walks top-level windows in worker processes instead:
+
+1. Every worker builds its own backend once, from a picklable factory, so
+   each process has its own accessibility client (UIA apartment).
+2. Windows are sent by key (e.g. native handle) with their budget, and the
+   worker resolves the key with its own client. A budget starts when a
+   worker picks the window up and also ends at the snapshot deadline,
+   passed as wall-clock time so that it means the same in every process.
+3. Each window tree comes back pickled as one message. Pickle refers back
+   to strings it has already written (keys, roles, shared state names), and
+   the parent decodes it in C: decoding the axcore.compact format in Python
+   was ~8x slower, and it would run serially in the parent.
+4. The parent yields trees in z-order as soon as every window above has
+   been yielded, and fills in each WindowBudget like iter_windows_tree.
+
+A backend is any object with walk(key, deadline, max_nodes, stats)
+returning the window's node dict, or None if the key no longer resolves.
+Backends that support visibility pruning also take the window's
+VisibilityFilter (see axcore/visibility.py) as a fifth argument; it is only
+passed when the budget has one.
+"""
+
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from axcore.walker import Deadline, WalkStats
+
+_backend = None  # the worker process's backend
+
+
+def _start_worker(factory, args):
+    global _backend
+    _backend = factory(*args)
+
+
+def _walk_window(key, seconds, max_nodes, expires, prune=None):
+    """Walk one window in a worker; returns (tree or None, nodes, truncated, elapsed, errors, pruned)"""
+    snapshot = Deadline(max(0.0, expires - time.time())) if expires is not None else None
+    deadline = Deadline(seconds, parent=snapshot)
+    stats = WalkStats()
+    if prune is None:
+        tree = _backend.walk(key, deadline, max_nodes, stats)
+    else:
+        tree = _backend.walk(key, deadline, max_nodes, stats, prune)
+    stats.elapsed = deadline.elapsed()
+    return tree, stats.nodes, stats.truncated, stats.elapsed, dict(stats.errors), stats.pruned
+
+
+class ProcessWalker:
+    """
+    Walks planned windows on worker processes that each own a backend.
+
+    The pool is started on first use and kept for later snapshots; it is
+    restarted if a worker dies.
+
+    Args:
+        factory: Picklable callable building a worker's backend
+        args: Picklable arguments for factory
+        workers: Number of worker processes
+        context: multiprocessing context (default: spawn, as on Windows;
+            forking a process with live COM objects or threads is unsafe).
+            Frozen executables must call multiprocessing.freeze_support()
+            before parsing their arguments, or spawned workers re-run main()
+    """
+
+    def __init__(self, factory, args=(), workers=None, context=None):
+        self.factory = factory
+        self.args = tuple(args)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.context = context or multiprocessing.get_context('spawn')
+        self.pool = None
+
+    def start(self):
+        """Start the worker processes (done lazily by iter_windows_tree)"""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=self.context,
+                                            initializer=_start_worker, initargs=(self.factory, self.args))
+            # Spawn every worker now rather than one per submitted window
+            for future in [self.pool.submit(time.sleep, 0) for _ in range(self.workers)]:
+                future.result()
+        return self.pool
+
+    def iter_windows_tree(self, plan, snapshot_deadline=None, rank=None):
+        """
+        Walk the planned windows (WindowBudgets, submitted in plan order) and
+        yield their trees in the order of rank(budget) (default: plan order).
+        """
+        expires = None
+        if snapshot_deadline is not None and snapshot_deadline.remaining() is not None:
+            expires = time.time() + snapshot_deadline.remaining()
+        try:
+            pool = self.start()
+            futures = [pool.submit(_walk_window, budget.key, budget.seconds, budget.max_nodes, expires, budget.prune)
+                       for budget in plan]
+        except Exception as e:
+            print(f"Error submitting window tasks: {e}", file=sys.stderr)
+            self.close()
+            return
+
+        pending = list(zip(plan, futures))
+        if rank is not None:
+            pending.sort(key=lambda pair: rank(pair[0]))
+        for budget, future in pending:
+            try:
+                (budget.tree, budget.nodes, budget.truncated, budget.elapsed, budget.errors,
+                 budget.pruned) = future.result()
+            except BrokenProcessPool as e:
+                print(f"Window worker died: {e}", file=sys.stderr)
+                budget.errors = {type(e).__name__: 1}
+                self.close()
+                continue
+            except Exception as e:
+                print(f"Error processing window: {e}", file=sys.stderr)
+                budget.errors = {type(e).__name__: 1}
+                continue
+            if not budget.tree:
+                continue
+            if budget.truncated:
+                print(f"Truncated window after {budget.tree['elapsed_ms']} ms "
+                      f"({budget.tree['node_count']} nodes)", file=sys.stderr)
+            yield budget.tree
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
@@ -0,0 +1,204 @@
+"""
+Per-window budget scheduling for whole-desktop snapshots.
+
+Given a global snapshot budget, plan_budgets decides which windows are
+walked first and how much time and how many nodes each may use:
+
+1. Priority windows (foreground, under the cursor) are granted their
+   expected cost first.
+2. The remaining capacity is water-filled across the other windows in
+   ascending order of expected cost, so small windows always complete and
+   large ones share whatever is left equally.
+3. Any capacity still unused is spread evenly across all windows so that
+   underestimated windows can grow into it.
+
+Expected costs come from SizeHistory, which remembers node counts and
+per-node walk times by window key across snapshots, in memory for serve
+mode or in a small JSON stats file between one-shot runs. Windows not seen
+for a while are forgotten, so the history stays bounded in long sessions
+and a reused window handle does not inherit a long-closed window's size.
+Because walks
+are breadth-first, a window that exhausts its budget loses its deepest
+levels first.
+"""
+
+import json
+import os
+import sys
+
+# Grant a window this much more than its expected cost
+HEADROOM = 1.5
+
+
+class SizeHistory:
+    """
+    Historical node counts and walk cost per window key.
+
+    Args:
+        path: JSON file to load from and save to (None = memory only)
+        smoothing: Weight of the newest observation in the moving average
+        max_age: Snapshots (begin() calls) after which a window that was not
+            seen is forgotten
+    """
+
+    DEFAULT_NODES = 500
+    DEFAULT_SECONDS_PER_NODE = 0.001
+
+    def __init__(self, path=None, smoothing=0.5, max_age=50):
+        self.path = path
+        self.smoothing = smoothing
+        self.max_age = max_age
+        self.generation = 0
+        self.windows = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    saved = json.load(f)
+                if "generation" in saved and "windows" in saved:
+                    self.generation, self.windows = saved["generation"], saved["windows"]
+                else:  # stats files without generations
+                    self.windows = saved
+                    for entry in self.windows.values():
+                        entry["seen"] = 0
+            except (IOError, ValueError) as e:
+                print(f"Error loading window stats {path}: {e}", file=sys.stderr)
+
+    def begin(self, keys):
+        """Start a snapshot of the windows with these keys, forgetting windows unseen for max_age snapshots"""
+        self.generation += 1
+        for key in keys:
+            entry = self.windows.get(key)
+            if entry is not None:
+                entry["seen"] = self.generation
+        self.windows = {key: entry for key, entry in self.windows.items()
+                        if self.generation - entry["seen"] < self.max_age}
+
+    def expected_nodes(self, key):
+        entry = self.windows.get(key)
+        return entry["nodes"] if entry else self.DEFAULT_NODES
+
+    def seconds_per_node(self, key):
+        entry = self.windows.get(key)
+        if entry:
+            return entry["seconds_per_node"]
+        if self.windows:
+            costs = [e["seconds_per_node"] for e in self.windows.values()]
+            return sum(costs) / len(costs)
+        return self.DEFAULT_SECONDS_PER_NODE
+
+    def expected_seconds(self, key):
+        return self.expected_nodes(key) * self.seconds_per_node(key)
+
+    def record(self, key, nodes, seconds, truncated=False):
+        """Fold one walk into the history; truncated counts are lower bounds"""
+        if not nodes:
+            return
+        cost = seconds / nodes
+        entry = self.windows.get(key)
+        if entry is None:
+            self.windows[key] = {"nodes": nodes, "seconds_per_node": cost, "seen": self.generation}
+            return
+        a = self.smoothing
+        if truncated:
+            entry["nodes"] = max(entry["nodes"], nodes)
+        else:
+            entry["nodes"] = round(a * nodes + (1 - a) * entry["nodes"])
+        entry["seconds_per_node"] = a * cost + (1 - a) * entry["seconds_per_node"]
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({"generation": self.generation, "windows": self.windows}, f)
+        except IOError as e:
+            print(f"Error saving window stats {self.path}: {e}", file=sys.stderr)
+
+
+class WindowBudget:
+    """A window's planned budget, filled in with what its walk actually used"""
+
+    def __init__(self, window, key, seconds, max_nodes=None, priority=False):
+        self.window = window
+        self.key = key
+        self.seconds = seconds
+        self.max_nodes = max_nodes
+        self.priority = priority
+        self.prune = None  # axcore.visibility.VisibilityFilter of the window, if pruning
+        self.nodes = 0
+        self.reused = 0
+        self.pruned = 0
+        self.truncated = False
+        self.elapsed = 0.0
+        self.errors = {}
+        self.tree = None
+
+    def report(self):
+        return {
+            "key": self.key,
+            "priority": self.priority,
+            "budget_ms": round(self.seconds * 1000),
+            "max_nodes": self.max_nodes,
+            "nodes": self.nodes,
+            "reused_nodes": self.reused,
+            "pruned_subtrees": self.pruned,
+            "truncated": self.truncated,
+            "elapsed_ms": round(self.elapsed * 1000),
+            "errors": dict(self.errors),
+        }
+
+
+def fixed_budgets(windows, seconds, key):
+    """Legacy plan: every window gets the same time budget, in enumeration order"""
+    return [WindowBudget(w, key(w), seconds) for w in windows]
+
+
+def plan_budgets(windows, total_seconds, history, key, priority_keys=(), workers=1):
+    """
+    Plan per-window budgets for one snapshot.
+
+    Args:
+        windows: Top-level windows to walk
+        total_seconds: Wall-clock budget for the whole snapshot
+        history: SizeHistory used to estimate each window's cost
+        key: Callable returning a stable key for a window
+        priority_keys: Keys of windows to serve first (focused, under cursor)
+        workers: Number of windows walked concurrently
+
+    Returns:
+        WindowBudgets in the order they should be submitted
+    """
+    capacity = total_seconds * max(1, workers)
+    entries = []
+    for window in windows:
+        k = key(window)
+        entries.append((window, k, history.expected_seconds(k), k in priority_keys))
+
+    plan = []
+    for window, k, need, _ in [e for e in entries if e[3]]:
+        seconds = min(need * HEADROOM, capacity, total_seconds)
+        capacity -= seconds
+        plan.append(WindowBudget(window, k, seconds, priority=True))
+
+    rest = sorted((e for e in entries if not e[3]), key=lambda e: e[2])
+    for index, (window, k, need, _) in enumerate(rest):
+        share = max(capacity, 0) / (len(rest) - index)
+        seconds = min(need * HEADROOM, share, total_seconds)
+        capacity -= seconds
+        plan.append(WindowBudget(window, k, seconds))
+
+    leftover = capacity
+    growable = [b for b in plan if b.seconds < total_seconds]
+    while leftover > 1e-9 and growable:
+        extra = leftover / len(growable)
+        for budget in growable:
+            grant = min(extra, total_seconds - budget.seconds)
+            budget.seconds += grant
+            leftover -= grant
+        growable = [b for b in growable if total_seconds - b.seconds > 1e-9]
+
+    # Node budgets only where the per-node cost of this window is known
+    for budget in plan:
+        if budget.key in history.windows:
+            budget.max_nodes = max(1, int(budget.seconds / history.seconds_per_node(budget.key)))
+    return plan
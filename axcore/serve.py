@@ -0,0 +1,104 @@
+"""
+JSON-lines request loop used by the parsers' --serve mode.
+
+Each input line is either a JSON object such as
+    {"id": 1, "cmd": "point", "x": 10, "y": 20}
+or the same command in plain text form
+    point 10,20
+and produces exactly one JSON output line:
+    {"id": 1, "cmd": "point", "ok": true, "duration": 3.2, "result": {...}}
+
+`duration` is the handler wall time in milliseconds.
+"""
+
+import json
+import sys
+import time
+
+QUIT_COMMANDS = ('quit', 'exit')
+
+# Comma-separated integer arguments of the plain text commands
+TEXT_ARGUMENTS = {
+    'point': ('x', 'y'),
+    'hit': ('x', 'y'),
+    'rect': ('x', 'y', 'width', 'height'),
+    'changes': ('since',),
+}
+
+
+def parse_request(line):
+    """Parse one input line into a request dict with at least a `cmd` key"""
+    line = line.strip()
+    if line.startswith('{'):
+        request = json.loads(line)
+        if not isinstance(request, dict) or 'cmd' not in request:
+            raise ValueError("Request object must contain a 'cmd' field")
+        return request
+
+    cmd, _, rest = line.partition(' ')
+    request = {'cmd': cmd}
+    fields = TEXT_ARGUMENTS.get(cmd)
+    if fields:
+        values = rest.replace(' ', '').split(',')
+        if len(values) != len(fields):
+            raise ValueError(f"{cmd} takes {','.join(fields)}")
+        request.update(zip(fields, map(int, values)))
+    return request
+
+
+def handle_request(handlers, request):
+    """Run a parsed request against the handler table and build the response"""
+    response = {'cmd': request['cmd']}
+    if 'id' in request:
+        response['id'] = request['id']
+
+    handler = handlers.get(request['cmd'])
+    start = time.perf_counter()
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown command: {request['cmd']}")
+        args = {k: v for k, v in request.items() if k not in ('cmd', 'id')}
+        response['result'] = handler(**args)
+        response['ok'] = True
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = f"{type(e).__name__}: {e}"
+    response['duration'] = round((time.perf_counter() - start) * 1000, 3)
+    return response
+
+
+def serve(handlers, stdin=None, stdout=None, dumps=json.dumps):
+    """
+    Answer requests from stdin until EOF or a quit command.
+
+    Args:
+        handlers: Mapping of command name to a callable taking the request's
+            extra fields as keyword arguments
+        stdin: Line iterable to read requests from (defaults to sys.stdin)
+        stdout: Stream to write responses to (defaults to sys.stdout)
+        dumps: JSON encoder used for each response line
+
+    Returns:
+        Number of requests answered
+    """
+    stdin = stdin if stdin is not None else sys.stdin
+    stdout = stdout if stdout is not None else sys.stdout
+    served = 0
+
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = parse_request(line)
+        except Exception as e:
+            response = {'ok': False, 'error': f"Bad request: {e}"}
+        else:
+            if request['cmd'] in QUIT_COMMANDS:
+                break
+            response = handle_request(handlers, request)
+
+        stdout.write(dumps(response) + '\n')
+        stdout.flush()
+        served += 1
+
+    return served
@@ -0,0 +1,197 @@
+"""
+Spatial index over snapshot bboxes for offline hit-testing.
+
+SpatialIndex buckets every node of a snapshot tree into a uniform grid of
+cell_size pixels; nodes spanning more than MAX_CELLS cells (windows, large
+panes) are kept in a separate list, so building stays linear in the number
+of nodes. Buckets are sorted by hit priority, so a point query stops at the
+first node in its cell (and in the large list) that contains the point.
+
+Hit-testing follows stacking order:
+
+1. Top-level nodes (windows / applications) are ranked front to back, by
+   default in tree order, which is the enumeration order of EnumWindows and
+   CGWindowList; window_order overrides it.
+2. Among nodes containing the point, the frontmost window wins, then the
+   deepest node, then the later sibling in preorder (drawn on top).
+
+Zero-size nodes and nodes whose states say visible: false are never hit.
+The same index answers rect queries and works on saved JSON of any parser:
+
+    python -m axcore.spatial snapshot.json 100,200 640,480
+"""
+
+import argparse
+import json
+import sys
+
+from axcore.compact import tree_path
+
+MAX_CELLS = 64
+
+
+class SpatialIndex:
+    """
+    Grid index of a snapshot tree.
+
+    Args:
+        tree: List of top-level node dicts (or a parser's output, see from_output)
+        cell_size: Grid cell size in pixels
+        window_order: Top-level indices front to back (default: tree order)
+    """
+
+    def __init__(self, tree, cell_size=64, window_order=None):
+        self.cell_size = cell_size
+        self.nodes = []
+        self.parents = []
+        self.depths = []
+        self.ranks = []
+        self.boxes = []
+        self.grid = {}
+        self.large = []
+
+        tree = list(tree)
+        order = list(window_order) if window_order is not None else range(len(tree))
+        rank_of = {top: rank for rank, top in enumerate(order)}
+
+        stack = [(node, -1, 0, rank_of.get(i, len(tree) + i)) for i, node in reversed(list(enumerate(tree)))]
+        while stack:
+            node, parent, depth, rank = stack.pop()
+            index = len(self.nodes)
+            self.nodes.append(node)
+            self.parents.append(parent)
+            self.depths.append(depth)
+            self.ranks.append(rank)
+            self.boxes.append(self._box(node))
+            self._insert(index)
+            stack.extend((child, index, depth + 1, rank) for child in reversed(node.get('children') or []))
+
+        # Sort buckets in hit priority order so a point query stops at the first containing node
+        for bucket in list(self.grid.values()) + [self.large]:
+            bucket.sort(key=self._priority)
+
+    def _priority(self, index):
+        return (self.ranks[index], -self.depths[index], -index)
+
+    @classmethod
+    def from_output(cls, output, cell_size=64):
+        """Index the tree of any parser's output (tree list, document or -e event)"""
+        tree = output
+        for key in tree_path(output) or ():
+            tree = tree[key]
+        return cls(tree or [], cell_size)
+
+    @staticmethod
+    def _box(node):
+        """(left, top, right, bottom) of a hittable node, or None"""
+        states = node.get('states')
+        if states and states.get('visible') is False:
+            return None
+        bbox = node.get('bbox') or {}
+        try:
+            x, y, width, height = bbox['x'], bbox['y'], bbox['width'], bbox['height']
+        except (KeyError, TypeError):
+            return None
+        if not width or not height or width < 0 or height < 0:
+            return None
+        return (x, y, x + width, y + height)
+
+    def _cells(self, box):
+        size = self.cell_size
+        return (int(box[0] // size), int(box[1] // size),
+                int((box[2] - 1e-9) // size), int((box[3] - 1e-9) // size))
+
+    def _insert(self, index):
+        box = self.boxes[index]
+        if box is None:
+            return
+        x1, y1, x2, y2 = self._cells(box)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) > MAX_CELLS:
+            self.large.append(index)
+            return
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                self.grid.setdefault((cx, cy), []).append(index)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def hit_index(self, x, y):
+        """Index of the element drawn at (x, y), or -1"""
+        size = self.cell_size
+        boxes = self.boxes
+        best = -1
+        for candidates in (self.grid.get((int(x // size), int(y // size)), ()), self.large):
+            for index in candidates:
+                left, top, right, bottom = boxes[index]
+                if left <= x < right and top <= y < bottom:
+                    if best < 0 or self._priority(index) < self._priority(best):
+                        best = index
+                    break
+        return best
+
+    def hit(self, x, y):
+        """Deepest frontmost node dict at (x, y), or None"""
+        index = self.hit_index(x, y)
+        return self.nodes[index] if index >= 0 else None
+
+    def intersecting_indices(self, x, y, width, height):
+        """Indices of nodes whose bbox intersects the rect, front to back then in preorder"""
+        right, bottom = x + width, y + height
+        found = set(i for i in self.large if self._overlaps(i, x, y, right, bottom))
+        x1, y1, x2, y2 = self._cells((x, y, right, bottom))
+        for cx in range(x1, x2 + 1):
+            for cy in range(y1, y2 + 1):
+                for index in self.grid.get((cx, cy), ()):
+                    if index not in found and self._overlaps(index, x, y, right, bottom):
+                        found.add(index)
+        return sorted(found, key=lambda i: (self.ranks[i], i))
+
+    def intersecting(self, x, y, width, height):
+        """Node dicts whose bbox intersects the rect"""
+        return [self.nodes[i] for i in self.intersecting_indices(x, y, width, height)]
+
+    def _overlaps(self, index, left, top, right, bottom):
+        box = self.boxes[index]
+        return box[0] < right and left < box[2] and box[1] < bottom and top < box[3]
+
+    def ancestors(self, index):
+        """Indices from the top-level node down to index"""
+        chain = []
+        while index >= 0:
+            chain.append(index)
+            index = self.parents[index]
+        chain.reverse()
+        return chain
+
+
+def _summary(node):
+    return {k: v for k, v in node.items() if k != 'children'}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hit-test points against a saved snapshot')
+    parser.add_argument('input', help='Snapshot JSON file from any parser')
+    parser.add_argument('points', nargs='*', help='x,y points (default: read one per line from stdin)')
+    args = parser.parse_args()
+
+    try:
+        with open(args.input, encoding='utf-8') as f:
+            index = SpatialIndex.from_output(json.load(f))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for point in args.points or sys.stdin:
+        point = point.strip()
+        if not point:
+            continue
+        x, _, y = point.replace(' ', '').partition(',')
+        x, y = json.loads(x), json.loads(y)
+        hit = index.hit_index(x, y)
+        path = [_summary(index.nodes[i]) for i in index.ancestors(hit)] if hit >= 0 else []
+        print(json.dumps({"position": {"x": x, "y": y}, "path": path}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Content-addressed archive of snapshots with subtree deduplication.
+
+Recording sessions repeat the same toolbars, menus and sidebars in thousands
+of snapshots. SnapshotStore keeps them in one SQLite file where every
+subtree is stored once under its Merkle hash:
+
+    digest(node) = blake2b-128(child count, child digests, repr(attributes))
+
+The attributes are everything but "children", so two subtrees share a
+digest exactly when they are equal, and a change deep in a window only adds
+the changed node and its ancestors. Hashing uses repr(), about twice as
+fast as JSON encoding; only subtrees not stored yet are encoded as JSON.
+Ingest is bound by hashing every node, so repeated subtrees cost no writes. A snapshot
+is a row pointing at the digest of its tree list (a virtual root node with
+JSON `null` as attributes) plus the rest of the parser's output (the -e
+event's time, duration, focused element, metrics...) with the tree taken
+out.
+
+Any parser's output is accepted (a plain tree list, the win-ax {"tree", ...}
+document or an -e event; see axcore.compact.tree_path) as long as every tree
+node has a "children" list. Snapshots and subtrees are read back by id or
+digest, with one query per tree level.
+
+Run it directly to archive saved JSON snapshots:
+
+    python -m axcore.store session.db snapshot-*.json
+    python -m axcore.store session.db --get 12 > snapshot.json
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import struct
+import sys
+
+from axcore.compact import tree_path
+
+DIGEST_SIZE = 16
+# SQLite's default limit on host parameters is 999 before 3.32
+QUERY_CHUNK = 500
+# Digests remembered as stored to skip their inserts; forgotten past this many
+MAX_KNOWN = 1000000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subtrees (
+    digest BLOB PRIMARY KEY,
+    node TEXT NOT NULL,
+    children BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    time INTEGER,
+    root BLOB NOT NULL,
+    path TEXT,
+    document TEXT NOT NULL,
+    nodes INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_time ON snapshots (time);
+"""
+
+_dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def _digest(attrs, children, count):
+    text = 'null' if attrs is None else repr(attrs)
+    return hashlib.blake2b(struct.pack('<I', count) + children + text.encode('utf-8', 'surrogatepass'),
+                           digest_size=DIGEST_SIZE).digest()
+
+
+def _split(children):
+    return [children[i:i + DIGEST_SIZE] for i in range(0, len(children), DIGEST_SIZE)]
+
+
+def hash_tree(tree):
+    """
+    Merkle digests of a tree list, children before parents.
+
+    Returns (root digest, rows) where rows are the (digest, attributes,
+    children digests) of every node, the virtual root (attributes None)
+    holding the list last.
+    """
+    nodes = [None]
+    parents = [-1]
+    stack = [(node, 0) for node in reversed(list(tree))]
+    while stack:
+        node, parent = stack.pop()
+        index = len(nodes)
+        nodes.append(node)
+        parents.append(parent)
+        for child in reversed(node.get('children') or ()):
+            stack.append((child, index))
+
+    # Preorder: walking it backwards reaches every child before its parent,
+    # collecting each node's child digests last child first
+    child_digests = [[] for _ in nodes]
+    rows = []
+    for index in range(len(nodes) - 1, -1, -1):
+        node = nodes[index]
+        attrs = None if index == 0 else {k: v for k, v in node.items() if k != 'children'}
+        digests = child_digests[index]
+        digests.reverse()
+        children = b''.join(digests)
+        digest = _digest(attrs, children, len(digests))
+        rows.append((digest, attrs, children))
+        if index:
+            child_digests[parents[index]].append(digest)
+    return rows[-1][0], rows
+
+
+def subtree_digest(node):
+    """Hex digest under which a node and its subtree are stored"""
+    _, rows = hash_tree([node])
+    return rows[-2][0].hex()  # the node itself, hashed just before the virtual root
+
+
+class SnapshotStore:
+    """
+    SQLite archive of snapshots sharing identical subtrees.
+
+    Args:
+        path: Database file (created if missing), or ':memory:'
+
+    Digests are passed and returned as hex strings. Not thread-safe; use
+    one store per thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self._known = set()  # digests known to be stored, to skip their inserts
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put_tree(self, tree):
+        """Store a tree list; returns (root digest, number of nodes)"""
+        root, rows = hash_tree(tree)
+        new = {digest: (digest, _dumps(attrs), children) for digest, attrs, children in rows
+               if digest not in self._known}
+        if new:
+            with self.db:
+                self.db.executemany('INSERT OR IGNORE INTO subtrees VALUES (?, ?, ?)', new.values())
+            if len(self._known) + len(new) > MAX_KNOWN:
+                self._known.clear()
+            self._known.update(new)
+        return root.hex(), len(rows) - 1
+
+    def add(self, output, time=None):
+        """
+        Archive one parser output; returns (snapshot id, root digest).
+
+        time defaults to the event's "time" field when there is one.
+        """
+        path = tree_path(output)
+        tree = output
+        document = output
+        if path:
+            # Copy the dicts on the way to the tree to take it out
+            document = parent = dict(output)
+            for key in path[:-1]:
+                parent[key] = dict(parent[key])
+                parent = parent[key]
+            tree = parent[path[-1]]
+            parent[path[-1]] = None
+        elif path is None:
+            tree = []
+        if time is None and isinstance(output, dict):
+            time = output.get('time')
+
+        root, nodes = self.put_tree(tree or [])
+        with self.db:
+            cursor = self.db.execute(
+                'INSERT INTO snapshots (time, root, path, document, nodes) VALUES (?, ?, ?, ?, ?)',
+                (time, bytes.fromhex(root), json.dumps(path), _dumps(document) if path != [] else 'null', nodes))
+        return cursor.lastrowid, root
+
+    def _fetch(self, digests):
+        """{digest: (node JSON, children digests)} of the stored digests"""
+        rows = {}
+        digests = list(digests)
+        for start in range(0, len(digests), QUERY_CHUNK):
+            chunk = digests[start:start + QUERY_CHUNK]
+            query = f"SELECT digest, node, children FROM subtrees WHERE digest IN ({','.join('?' * len(chunk))})"
+            for digest, body, children in self.db.execute(query, chunk):
+                rows[digest] = (body, children)
+        return rows
+
+    def _build(self, root):
+        """Rebuild the node (or tree list, for a snapshot root) stored under a digest"""
+        rows = {}
+        pending = {root}
+        while pending:
+            fetched = self._fetch(pending)
+            missing = pending - fetched.keys()
+            if missing:
+                raise KeyError(f"Subtree {next(iter(missing)).hex()} is not in {self.path}")
+            rows.update(fetched)
+            pending = {child for _, children in fetched.values() for child in _split(children)} - rows.keys()
+
+        holder = []
+        stack = [(root, holder)]
+        while stack:
+            digest, siblings = stack.pop()
+            body, children = rows[digest]
+            node = json.loads(body)
+            if node is None:
+                node = child_list = []
+            else:
+                node['children'] = child_list = []
+            siblings.append(node)
+            for child in reversed(_split(children)):
+                stack.append((child, child_list))
+        # Children were pushed in reverse, so they come off the stack (and are appended) in order
+        return holder[0]
+
+    def subtree(self, digest):
+        """Node dict with its subtree stored under a hex digest (a list for snapshot roots)"""
+        return self._build(bytes.fromhex(digest))
+
+    def children(self, digest):
+        """Hex digests of the children stored under a digest (the windows, for a snapshot root)"""
+        rows = self._fetch([bytes.fromhex(digest)])
+        if not rows:
+            raise KeyError(f"Subtree {digest} is not in {self.path}")
+        return [child.hex() for child in _split(next(iter(rows.values()))[1])]
+
+    def snapshot(self, snapshot_id):
+        """The output archived under snapshot_id, as it was added"""
+        row = self.db.execute('SELECT root, path, document FROM snapshots WHERE id = ?', (snapshot_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No snapshot {snapshot_id} in {self.path}")
+        root, path, document = row
+        path = json.loads(path)
+        tree = self._build(root)
+        if path is None:
+            return json.loads(document)
+        if not path:
+            return tree
+        output = json.loads(document)
+        parent = output
+        for key in path[:-1]:
+            parent = parent[key]
+        parent[path[-1]] = tree
+        return output
+
+    def snapshots(self, start=None, end=None):
+        """(id, time, root digest) of the snapshots with start <= time <= end, in insertion order"""
+        query = 'SELECT id, time, root FROM snapshots'
+        clauses, params = [], []
+        if start is not None:
+            clauses.append('time >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('time <= ?')
+            params.append(end)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        return [(row[0], row[1], row[2].hex()) for row in self.db.execute(query + ' ORDER BY id', params)]
+
+    def stats(self):
+        """Snapshots, nodes added, unique subtrees stored, their ratio and the database size"""
+        snapshots, nodes = self.db.execute('SELECT COUNT(*), COALESCE(SUM(nodes), 0) FROM snapshots').fetchone()
+        subtrees = self.db.execute('SELECT COUNT(*) FROM subtrees').fetchone()[0]
+        page_count = self.db.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.db.execute('PRAGMA page_size').fetchone()[0]
+        return {
+            "snapshots": snapshots,
+            "nodes": nodes,
+            "subtrees": subtrees,
+            "dedup_ratio": round(nodes / subtrees, 2) if subtrees else None,
+            "bytes": page_count * page_size,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive snapshot JSON from any parser in a deduplicating store')
+    parser.add_argument('store', help='SQLite store path (created if missing)')
+    parser.add_argument('inputs', nargs='*', help='Snapshot JSON files to add (- for stdin)')
+    parser.add_argument('--get', type=int, help='Write the snapshot with this id to stdout', default=None)
+    args = parser.parse_args()
+
+    try:
+        with SnapshotStore(args.store) as store:
+            for name in args.inputs:
+                if name == '-':
+                    output = json.load(sys.stdin)
+                else:
+                    with open(name, encoding='utf-8') as f:
+                        output = json.load(f)
+                snapshot_id, root = store.add(output)
+                print(f"{name}: snapshot {snapshot_id} ({root})", file=sys.stderr)
+            if args.get is not None:
+                json.dump(store.snapshot(args.get), sys.stdout)
+                sys.stdout.write('\n')
+            else:
+                print(json.dumps(store.stats()))
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Visibility pruning shared by the walkers.
+
+Most of a desktop's elements cannot appear in a screen recording: collapsed
+menus and virtualised rows have empty bounds, scrolled-away list items and
+minimised windows lie outside every display, and background windows are
+hidden behind the windows in front of them. A VisibilityFilter tells the
+walkers (axcore.walker.walk_tree, mac-ax walk_passive) which elements to
+skip before their subtrees are walked:
+
+    empty      zero width or height
+    offscreen  no overlap with any display
+    occluded   entirely covered by the windows in front of the element's
+               own top-level window
+
+Elements are judged by their own bbox, so descendants drawn outside their
+ancestor's bounds are lost with it. Skipped elements are dropped, or kept
+as stubs marked "pruned" (the reason) with their "child_count" so consumers
+can tell something was there.
+
+ScreenLayout holds the display and top-level window rectangles of one
+snapshot, in z-order, and hands out the filter of each window.
+"""
+
+# Occlusion is decided by subtracting the covering rectangles; give up
+# (treat the element as visible) if the uncovered area fragments further
+MAX_FRAGMENTS = 64
+
+
+def rect_of(bbox):
+    """(x, y, width, height) of a bbox dict, or None"""
+    if not bbox:
+        return None
+    return bbox["x"], bbox["y"], bbox["width"], bbox["height"]
+
+
+def intersects(a, b):
+    """Whether two (x, y, width, height) rectangles overlap"""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def subtract(rect, cover):
+    """Parts of rect not covered by cover, as up to four rectangles"""
+    if not intersects(rect, cover):
+        return [rect]
+    x, y, w, h = rect
+    right, bottom = x + w, y + h
+    cx, cy = max(x, cover[0]), max(y, cover[1])
+    cright, cbottom = min(right, cover[0] + cover[2]), min(bottom, cover[1] + cover[3])
+    parts = []
+    if y < cy:
+        parts.append((x, y, w, cy - y))
+    if cbottom < bottom:
+        parts.append((x, cbottom, w, bottom - cbottom))
+    if x < cx:
+        parts.append((x, cy, cx - x, cbottom - cy))
+    if cright < right:
+        parts.append((cright, cy, right - cright, cbottom - cy))
+    return parts
+
+
+def covered(rect, covers):
+    """Whether rect lies entirely under the union of covers"""
+    remaining = [rect]
+    for cover in covers:
+        remaining = [part for piece in remaining for part in subtract(piece, cover)]
+        if not remaining:
+            return True
+        if len(remaining) > MAX_FRAGMENTS:
+            return False
+    return False
+
+
+class VisibilityFilter:
+    """
+    Decides which elements of one top-level window are skipped.
+
+    Args:
+        displays: Display rectangles (x, y, width, height)
+        occluders: Rectangles of the opaque windows in front of this one
+        stubs: Keep skipped elements as stubs instead of dropping them
+    """
+
+    def __init__(self, displays, occluders=(), stubs=False):
+        self.displays = [tuple(d) for d in displays]
+        self.occluders = [tuple(o) for o in occluders]
+        self.stubs = stubs
+
+    def reason(self, bbox):
+        """Why an element with this bbox dict is skipped (empty, offscreen, occluded), or None"""
+        rect = rect_of(bbox)
+        if rect is None:
+            return None  # bounds not read; keep
+        if rect[2] <= 0 or rect[3] <= 0:
+            return "empty"
+        if self.displays and not any(intersects(rect, display) for display in self.displays):
+            return "offscreen"
+        if self.occluders and covered(rect, self.occluders):
+            return "occluded"
+        return None
+
+    def __eq__(self, other):
+        return (isinstance(other, VisibilityFilter) and self.displays == other.displays and
+                self.occluders == other.occluders and self.stubs == other.stubs)
+
+    def stub(self, node, reason, child_count):
+        """Mark node as a pruned stub in place"""
+        node["pruned"] = reason
+        node["child_count"] = child_count
+        return node
+
+
+class ScreenLayout:
+    """
+    Displays and top-level windows of one snapshot.
+
+    Args:
+        displays: Display rectangles (x, y, width, height)
+        windows: (key, rectangle) of the opaque top-level windows, front to back
+        stubs: Passed on to the filters
+    """
+
+    def __init__(self, displays, windows=(), stubs=False):
+        self.displays = [tuple(d) for d in displays]
+        self.windows = [(key, tuple(rect)) for key, rect in windows]
+        self.stubs = stubs
+
+    def filter(self, key):
+        """VisibilityFilter for the window with this key, occluded by the windows in front of it"""
+        occluders = []
+        for other, rect in self.windows:
+            if other == key:
+                break
+            occluders.append(rect)
+        else:
+            occluders = []  # not in the z-order list: only judge against the displays
+        return VisibilityFilter(self.displays, occluders, self.stubs)
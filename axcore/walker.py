@@ -0,0 +1,486 @@
+"""
+Backend-agnostic accessibility tree walker.
+
+A backend only has to implement the narrow Provider interface below; the
+walker owns traversal order, error handling and construction of the node
+dicts in the shared output schema:
+
+    {"name", "role", "description", "value", "bbox", ["states",] "children"}
+
+A provider's `fields` restricts the attributes read per node to a subset of
+FIELDS; children are always walked. Strings are sanitised with clean_text
+as nodes are built, so serialisers can write them as they are, in ASCII or
+UTF-8.
+
+Walks are bounded cooperatively: a Deadline is checked between nodes, and a
+walk that runs out of time returns the partial tree with its root marked
+`truncated: true` instead of being abandoned on a background thread.
+
+Walks can skip what cannot be seen: given an axcore.visibility filter,
+elements with empty, offscreen or occluded bounds are not descended into.
+
+Walks can be incremental: given a SubtreeCache, elements whose provider
+identity and cheap fingerprint match the previous walk reuse their cached
+attributes instead of being read again. The walk still lists every
+element's children, so a change anywhere that shows in a fingerprint is
+picked up by the next walk.
+"""
+
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+EMPTY_BBOX = {"x": 0, "y": 0, "width": 0, "height": 0}
+FIELDS = ("name", "role", "description", "value", "bbox", "states")
+
+# Lone surrogates (not encodable as UTF-8) and control characters other than tab and newlines
+_UNSAFE_TEXT = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\ud800-\udfff]')
+_UNREAD = object()  # attribute not read yet
+
+
+def clean_text(text):
+    """Drop lone surrogates and control characters from a string read from a backend"""
+    if text.isascii() and text.isprintable():
+        return text
+    return _UNSAFE_TEXT.sub('', text)
+
+
+class Provider:
+    """
+    Accessibility backend interface consumed by walk_tree.
+
+    Elements are opaque to the walker. Attribute methods may raise: an
+    error from bounds() gives an empty bbox, while an error from any other
+    attribute fails read(), and the walker drops the element with its
+    subtree (as for elements destroyed during the walk). Subclasses that can
+    fetch several attributes in one round-trip should override read().
+    """
+
+    fields = None  # Subset of FIELDS read() fills in (None = all)
+
+    def children(self, element):
+        return []
+
+    def parent(self, element):
+        """Return the parent element, or None at the root"""
+        return None
+
+    def role(self, element):
+        return ''
+
+    def name(self, element):
+        return ''
+
+    def value(self, element):
+        return ''
+
+    def description(self, element):
+        return ''
+
+    def bounds(self, element):
+        """Return (x, y, width, height) or None when unknown"""
+        return None
+
+    def states(self, element):
+        """Return a dict of state flags, or None if the backend has none"""
+        return None
+
+    def identity(self, element):
+        """Return a stable hashable identity for incremental walks, or None"""
+        return None
+
+    def fingerprint(self, element, children):
+        """Cheap change signature compared before reusing a cached node"""
+        return (self.name(element), self.bounds(element), len(children))
+
+    def read(self, element, fingerprint=None):
+        """
+        Read the serialised attributes in `fields` of an element into a node dict.
+
+        fingerprint is the element's fingerprint() from the same walk (after
+        a cache miss); the name and bounds it holds are not read again.
+        """
+        name = bounds = _UNREAD
+        if fingerprint is not None and type(self).fingerprint is Provider.fingerprint:
+            name, bounds = fingerprint[0], fingerprint[1]
+        if self.fields is not None:
+            return self._read_fields(element, self.fields, name, bounds)
+        if bounds is _UNREAD:
+            try:
+                bounds = self.bounds(element)
+            except Exception as e:
+                print(f"Error getting bounds: {e}", file=sys.stderr)
+                bounds = None
+
+        node = {
+            "name": clean_text((self.name(element) if name is _UNREAD else name) or ''),
+            "role": clean_text(self.role(element) or ''),
+            "description": clean_text(self.description(element) or ''),
+            "value": clean_text(self.value(element) or ''),
+            "bbox": make_bbox(bounds),
+        }
+        states = self.states(element)
+        if states is not None:
+            node["states"] = states
+        node["children"] = []
+        return node
+
+    def _read_fields(self, element, fields, name=_UNREAD, bounds=_UNREAD):
+        node = {}
+        if "name" in fields:
+            node["name"] = clean_text((self.name(element) if name is _UNREAD else name) or '')
+        if "role" in fields:
+            node["role"] = clean_text(self.role(element) or '')
+        if "description" in fields:
+            node["description"] = clean_text(self.description(element) or '')
+        if "value" in fields:
+            node["value"] = clean_text(self.value(element) or '')
+        if "bbox" in fields:
+            if bounds is _UNREAD:
+                try:
+                    bounds = self.bounds(element)
+                except Exception as e:
+                    print(f"Error getting bounds: {e}", file=sys.stderr)
+                    bounds = None
+            node["bbox"] = make_bbox(bounds)
+        if "states" in fields:
+            states = self.states(element)
+            if states is not None:
+                node["states"] = states
+        node["children"] = []
+        return node
+
+
+class CountingProvider(Provider):
+    """
+    Wraps another provider and counts calls per interface method in `calls`
+    and the seconds spent in them in `seconds`. Safe to share between walks
+    on several threads.
+
+    read() is assembled from the counted attribute calls (honouring the
+    wrapped provider's fields), so wrap providers that read element by
+    element (not bulk-fetching ones).
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.fields = provider.fields
+        self.calls = Counter()
+        self.seconds = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return getattr(self.provider, method)(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.calls[method] += 1
+                self.seconds[method] += elapsed
+
+    def report(self, reset=False):
+        """{method: {"calls", "ms"}} in descending time order, optionally restarting the counts"""
+        with self._lock:
+            report = {method: {"calls": self.calls[method], "ms": round(seconds * 1000, 3)}
+                      for method, seconds in self.seconds.most_common()}
+            if reset:
+                self.calls.clear()
+                self.seconds.clear()
+        return report
+
+    def children(self, element):
+        return self._call('children', element)
+
+    def parent(self, element):
+        return self._call('parent', element)
+
+    def role(self, element):
+        return self._call('role', element)
+
+    def name(self, element):
+        return self._call('name', element)
+
+    def value(self, element):
+        return self._call('value', element)
+
+    def description(self, element):
+        return self._call('description', element)
+
+    def bounds(self, element):
+        return self._call('bounds', element)
+
+    def states(self, element):
+        return self._call('states', element)
+
+    def identity(self, element):
+        return self._call('identity', element)
+
+
+class Deadline:
+    """
+    Wall-clock budget checked cooperatively by the walker between nodes.
+
+    Args:
+        seconds: Budget from creation time (None = never expires)
+        clock: Monotonic time source, injectable for tests
+        parent: Enclosing Deadline (e.g. the whole snapshot) that also ends this one
+    """
+
+    def __init__(self, seconds, clock=time.monotonic, parent=None):
+        self.clock = clock
+        self.start = clock()
+        self.expires = None if seconds is None else self.start + seconds
+        self.parent = parent
+
+    def expired(self):
+        if self.parent is not None and self.parent.expired():
+            return True
+        return self.expires is not None and self.clock() >= self.expires
+
+    def remaining(self):
+        """Seconds left before expiry (None = unbounded)"""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - self.clock())
+
+    def elapsed(self):
+        return self.clock() - self.start
+
+
+class WalkStats:
+    """Counters filled in by walk_tree"""
+
+    def __init__(self):
+        self.nodes = 0
+        self.reused = 0
+        self.truncated = False
+        self.elapsed = 0.0
+        self.errors = Counter()  # exception class name -> count
+        self.pruned = 0
+
+
+class SubtreeCache:
+    """
+    Node attributes of the previous walk of one root, keyed by provider identity.
+
+    A node's attributes are reused when its fingerprint (by default name,
+    bounds and child count) is unchanged; the walk still descends into its
+    children. Attributes outside the fingerprint (value, states...) are
+    picked up when the entry expires after max_age walks, or earlier
+    through invalidate() by callers that know an element changed.
+
+    Args:
+        max_age: Walks after which a node is re-read even if unchanged
+    """
+
+    def __init__(self, max_age=10):
+        self.max_age = max_age
+        self.entries = {}  # identity -> [fingerprint, node, generation]
+        self.pending = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def begin(self):
+        self.generation += 1
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def commit(self):
+        self.entries = self.pending
+        self.pending = None
+
+    def abort(self):
+        """Keep the previous entries, e.g. after a truncated walk"""
+        self.pending = None
+
+    def invalidate(self, identity):
+        """Force the element to be re-read by the next walk"""
+        self.entries.pop(identity, None)
+
+    def reuse(self, identity, fingerprint):
+        """
+        Return a copy (without children) of the cached node for identity if
+        still valid, carrying its entry forward
+        """
+        entry = self.entries.get(identity)
+        if (entry is None or entry[0] != fingerprint or
+                self.generation - entry[2] >= self.max_age):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.pending[identity] = entry
+        node = dict(entry[1])
+        node["children"] = []
+        return node
+
+    def store(self, identity, fingerprint, node):
+        """Remember a freshly read node (its children are not used)"""
+        self.pending[identity] = [fingerprint, node, self.generation]
+
+
+def make_bbox(bounds):
+    """Convert an (x, y, width, height) tuple into a bbox dict"""
+    if not bounds:
+        return dict(EMPTY_BBOX)
+    x, y, width, height = bounds
+    return {"x": x, "y": y, "width": width, "height": height}
+
+
+def walk_tree(provider, root, max_depth=None, deadline=None, stats=None, max_nodes=None, cache=None, prune=None):
+    """
+    Breadth-first walk from root, returning the root node dict or None.
+
+    Args:
+        provider: Provider implementation for the backend
+        root: Backend element to start from
+        max_depth: Number of levels to include (None = unlimited)
+        deadline: Deadline checked before each node after the root; when it
+            expires the partial tree is returned with the root marked
+            truncated, node_count and elapsed_ms
+        stats: WalkStats to fill in
+        max_nodes: Node budget; reaching it truncates the walk like a deadline
+        cache: SubtreeCache of the previous walk of this root; unchanged
+            nodes reuse their attributes from it (counted in stats.reused,
+            not stats.nodes) and it is updated in place (left untouched
+            when the walk is truncated)
+        prune: axcore.visibility.VisibilityFilter; elements it rejects
+            (the root included) are not descended into and are dropped or
+            kept as stubs, and are never cached
+    """
+    stats = stats if stats is not None else WalkStats()
+    deadline = deadline if deadline is not None else Deadline(None)
+    queue = deque([(root, None, 0)])  # (element, parent node, depth)
+    root_node = None
+    if cache is not None:
+        cache.begin()
+
+    while queue:
+        if root_node is not None and (deadline.expired() or
+                                      (max_nodes is not None and stats.nodes + stats.reused >= max_nodes)):
+            stats.truncated = True
+            break
+
+        element, parent, depth = queue.popleft()
+        identity = fingerprint = children = None
+        if cache is not None:
+            try:
+                identity = provider.identity(element)
+                if identity is not None:
+                    children = provider.children(element)
+                    fingerprint = provider.fingerprint(element, children)
+            except Exception:
+                identity = fingerprint = children = None
+
+        cached = None
+        if identity is not None:
+            cached = cache.reuse(identity, fingerprint)
+        if cached is not None:
+            node = cached
+            stats.reused += 1
+        else:
+            try:
+                node = provider.read(element) if fingerprint is None else provider.read(element, fingerprint)
+            except Exception as e:
+                print(f"Error processing element: {e}", file=sys.stderr)
+                stats.errors[type(e).__name__] += 1
+                continue
+            stats.nodes += 1
+
+        pruned = None
+        if prune is not None:
+            pruned = prune.reason(node.get("bbox"))
+            if pruned is not None:
+                stats.pruned += 1
+                if not prune.stubs:
+                    continue
+                try:
+                    child_count = len(children if children is not None else provider.children(element))
+                except Exception:
+                    child_count = 0
+                prune.stub(node, pruned, child_count)
+
+        if parent is None:
+            root_node = node
+        else:
+            parent["children"].append(node)
+        if pruned is not None:
+            continue
+        if identity is not None and cached is None:
+            cache.store(identity, fingerprint, node)
+
+        if max_depth is not None and depth + 1 >= max_depth:
+            continue
+        try:
+            if children is None:
+                children = provider.children(element)
+            for child in children:
+                queue.append((child, node, depth + 1))
+        except Exception as e:
+            print(f"Error processing children: {e}", file=sys.stderr)
+            stats.errors[type(e).__name__] += 1
+
+    if cache is not None:
+        if stats.truncated:
+            cache.abort()
+        else:
+            cache.commit()
+    stats.elapsed = deadline.elapsed()
+    if stats.truncated and root_node is not None:
+        root_node["truncated"] = True
+        root_node["node_count"] = stats.nodes + stats.reused
+        root_node["elapsed_ms"] = round(stats.elapsed * 1000)
+    return root_node
+
+
+def ancestor_chain(provider, element, max_depth=None):
+    """
+    Node dicts (without children) of element's ancestors, from the top-level
+    window down to its parent. The root element (the desktop, whose parent is
+    None) is left out; max_depth limits how many ancestors are read.
+    """
+    elements = []
+    current = element
+    limit = None if max_depth is None else max_depth + 1
+    while limit is None or len(elements) < limit:
+        try:
+            current = provider.parent(current)
+        except Exception as e:
+            print(f"Error getting parent: {e}", file=sys.stderr)
+            break
+        if current is None:
+            if elements:
+                elements.pop()  # the root itself
+            break
+        elements.append(current)
+    else:
+        elements = elements[:max_depth]
+
+    chain = []
+    for ancestor in reversed(elements):
+        try:
+            node = provider.read(ancestor)
+        except Exception as e:
+            print(f"Error processing ancestor: {e}", file=sys.stderr)
+            continue
+        del node["children"]
+        chain.append(node)
+    return chain
+
+
+def count_nodes(node):
+    """Count nodes in a tree produced by walk_tree"""
+    if not node:
+        return 0
+    count = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        count += 1
+        stack.extend(current["children"])
+    return count
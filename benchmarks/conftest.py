@@ -0,0 +1,50 @@
+"""
+Shared helpers for the pytest-benchmark suite.
+
+Run with `python -m pytest benchmarks` (add `--benchmark-disable` for a quick
+smoke pass). Besides pytest-benchmark's own timing table, each benchmark
+records p50/p99 latency, throughput and peak traced memory in extra_info,
+visible with `--benchmark-json`.
+"""
+
+import time
+import tracemalloc
+
+import pytest
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+@pytest.fixture
+def snapshot_stats(benchmark):
+    """Measure latency percentiles and peak memory of fn and attach them to the benchmark"""
+    def measure(fn, rounds=10, nodes=None):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        stats = {
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p99_ms': round(percentile(samples, 99) * 1000, 3),
+            'peak_kib': round(peak / 1024, 1),
+        }
+        if nodes:
+            stats['nodes'] = nodes
+            stats['nodes_per_sec'] = round(nodes / percentile(samples, 50))
+        benchmark.extra_info.update(stats)
+        return stats
+    return measure
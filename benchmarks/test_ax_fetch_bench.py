@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from ax_extractors import extract_applications, extract_element_tree_passive, parse_fields, walk_passive
+from axcore.fake import FakeAXApp, FakeAXProvider, build_fake_ax_window
+
+DISPLAYS = [{'frame': {'x': 0, 'y': 0, 'width': 1920, 'height': 1080}}]
+
+# An Electron-style app: one window with deep, wide web content
+APPS = [FakeAXApp('Browser', [build_fake_ax_window(6, 4)])]
+
+
+@pytest.mark.parametrize('batched,fields', [(False, None), (True, None), (True, 'role,bbox')],
+                         ids=['per_attribute', 'batched', 'batched_role_bbox'])
+def test_passive_fetch_round_trips(benchmark, snapshot_stats, batched, fields):
+    provider = FakeAXProvider(APPS, batched=batched)
+    fields = parse_fields(fields) if fields else None
+
+    def snapshot():
+        return extract_applications(provider, APPS, DISPLAYS, fields=fields)
+
+    windows, reports = benchmark(snapshot)
+    nodes = reports[0].nodes
+    provider.calls.clear()
+    snapshot()
+    # Each round-trip is a Mach IPC message on macOS
+    benchmark.extra_info['round_trips'] = sum(provider.calls.values())
+    benchmark.extra_info['round_trips_per_node'] = round(sum(provider.calls.values()) / nodes, 2)
+    snapshot_stats(snapshot, nodes=nodes)
+
+
+def convert_to_legacy(passive):
+    """The former second pass over the intermediate {'attributes', 'children'} tree"""
+    attrs = passive['attributes']
+    node = {'role': attrs.get('role', ''), 'name': attrs.get('title', ''),
+            'description': attrs.get('description', ''), 'value': attrs.get('value', ''),
+            'bbox': attrs.get('bbox', {'x': 0, 'y': 0, 'width': 0, 'height': 0}),
+            'children': [n for child in passive['children'] for n in convert_to_legacy(child)]}
+    return [node] if node['role'] else []
+
+
+@pytest.mark.parametrize('single_pass', [False, True], ids=['two_pass', 'single_pass'])
+def test_legacy_tree_peak_memory(benchmark, snapshot_stats, single_pass):
+    window = APPS[0].attributes['AXWindows'][0]
+    provider = FakeAXProvider(APPS)
+
+    def snapshot():
+        if single_pass:
+            return walk_passive(provider, window)
+        return convert_to_legacy(extract_element_tree_passive(provider, window))
+
+    tree = benchmark(snapshot)
+    assert tree == walk_passive(provider, window)
+    snapshot_stats(snapshot, nodes=1365)
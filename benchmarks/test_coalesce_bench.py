@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.coalesce import EventCoalescer
+from axcore.events import LiveTree
+from axcore.fake import SyntheticProvider, synthetic_events
+
+
+def make_live():
+    provider = SyntheticProvider(6, 5)
+    live = LiveTree(provider, lambda: [provider.root])
+    live.load()
+    return provider, live
+
+
+@pytest.mark.parametrize('mode', ['direct', 'coalesced'])
+def test_storm_throughput(benchmark, snapshot_stats, mode):
+    # A terminal-like storm: 20k value changes on 16 elements, some re-reads and re-walks
+    provider, live = make_live()
+    events = list(synthetic_events(provider, 20000, seed=1, structure=0.001, focus=0.01, carry_values=True, hot=16))
+    coalescer = EventCoalescer(live, window=0.05)
+    runs = []
+
+    def run():
+        runs.append(1)
+        if mode == 'direct':
+            for event in events:
+                live.apply(event)
+        else:
+            for event in events:
+                coalescer.put(event)
+            coalescer.drain(flush=True)
+
+    applied = live.stats()
+    benchmark(run)
+    stats = snapshot_stats(run)
+    benchmark.extra_info['events'] = len(events)
+    benchmark.extra_info['events_per_sec'] = round(len(events) / (stats['p50_ms'] / 1000))
+    after = live.stats()
+    applied_per_round = sum(after[k] - applied.get(k, 0) for k in ('property', 'structure', 'focus')) / len(runs)
+    benchmark.extra_info['applied_per_round'] = round(applied_per_round)
+    # Every round applies at most one change per event (fewer when coalesced)
+    assert 0 < applied_per_round <= len(events)
+
+
+@pytest.mark.parametrize('window', [0.002, 0.02])
+def test_storm_latency_with_drain_thread(benchmark, window):
+    # Producer threads flood the stage while the drain thread applies to the live tree
+    def run():
+        provider, live = make_live()
+        coalescer = EventCoalescer(live, window=window, max_delay=window * 5)
+        streams = [list(synthetic_events(provider, 10000, seed=seed, structure=0, hot=64)) for seed in (1, 2)]
+        coalescer.start()
+        producers = [threading.Thread(target=lambda s=s: [coalescer.put(e) for e in s]) for s in streams]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        coalescer.stop()
+        return coalescer.stats()
+
+    stats = benchmark.pedantic(run, rounds=3)
+    assert stats['pending'] == 0 and stats['received'] == 20000
+    benchmark.extra_info.update({k: stats.get(k, 0) for k in ('delivered', 'coalesced', 'delay_p50_ms', 'delay_p99_ms')})
+
+
+@pytest.mark.parametrize('max_inbox', [10000, 10 ** 9], ids=['bounded', 'unbounded'])
+def test_stalled_consumer_memory(benchmark, snapshot_stats, max_inbox):
+    provider, live = make_live()
+    events = list(synthetic_events(provider, 100000, seed=3, hot=64))
+
+    def flood():
+        coalescer = EventCoalescer(live, max_inbox=max_inbox)
+        for event in events:
+            coalescer.put(event)
+        return coalescer
+
+    coalescer = benchmark.pedantic(flood, rounds=3)
+    assert coalescer.stats()['inbox'] == min(max_inbox, len(events))
+    snapshot_stats(flood, rounds=3)
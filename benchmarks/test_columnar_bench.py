@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+np = pytest.importorskip('numpy')
+
+from axcore.columnar import to_columns
+from axcore.fake import SyntheticProvider
+from axcore.walker import walk_tree
+
+PROVIDER = SyntheticProvider(depth=6, fanout=5)
+
+
+@pytest.fixture(scope='module')
+def tree():
+    return [walk_tree(PROVIDER, PROVIDER.root) for _ in range(2)]
+
+
+def visible_stats_python(tree):
+    """Visible-element count and mean area by recursive flattening, as downstream jobs do today"""
+    count = area = 0
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        if node.get('states', {}).get('visible'):
+            count += 1
+            area += node['bbox']['width'] * node['bbox']['height']
+        stack.extend(node['children'])
+    return count, area / count
+
+
+def visible_stats_columns(columns):
+    visible = columns['state_visible'] == 1
+    boxes = columns['bbox'][visible].astype(np.int64)
+    return int(visible.sum()), float((boxes[:, 2] * boxes[:, 3]).mean())
+
+
+def test_to_columns(benchmark, snapshot_stats, tree):
+    columns = benchmark(to_columns, tree)
+    assert len(columns['parent']) == PROVIDER.size * 2
+    snapshot_stats(lambda: to_columns(tree), rounds=5, nodes=PROVIDER.size * 2)
+
+
+@pytest.mark.parametrize('mode', ['python', 'columns'])
+def test_visible_stats(benchmark, snapshot_stats, tree, mode):
+    columns = to_columns(tree)
+    fn = (lambda: visible_stats_python(tree)) if mode == 'python' else (lambda: visible_stats_columns(columns))
+    assert benchmark(fn) == visible_stats_python(tree)
+    snapshot_stats(fn, nodes=PROVIDER.size * 2)
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.compact import CompactReader, dumps_compact, loads_compact
+from axcore.fake import SyntheticProvider
+from axcore.walker import walk_tree
+
+PROVIDER = SyntheticProvider(depth=6, fanout=5)
+
+
+@pytest.fixture(scope='module')
+def snapshot():
+    return {'tree': [walk_tree(PROVIDER, PROVIDER.root) for _ in range(2)], 'focused_element': None, 'queries': {}}
+
+
+@pytest.mark.parametrize('fmt', ['json', 'compact'])
+def test_encode(benchmark, snapshot_stats, snapshot, fmt):
+    encode = (lambda: json.dumps(snapshot).encode()) if fmt == 'json' else (lambda: dumps_compact(snapshot))
+    data = benchmark(encode)
+    benchmark.extra_info['bytes'] = len(data)
+    benchmark.extra_info['ratio_to_json'] = round(len(data) / len(json.dumps(snapshot)), 3)
+    snapshot_stats(encode, rounds=5, nodes=PROVIDER.size * 2)
+
+
+@pytest.mark.parametrize('fmt', ['json', 'compact'])
+def test_decode(benchmark, snapshot_stats, snapshot, fmt):
+    if fmt == 'json':
+        data = json.dumps(snapshot).encode()
+        decode = lambda: json.loads(data)
+    else:
+        data = dumps_compact(snapshot)
+        decode = lambda: loads_compact(data)
+    assert benchmark(decode) == snapshot
+    snapshot_stats(decode, rounds=5, nodes=PROVIDER.size * 2)
+
+
+def test_scan_roles(benchmark, snapshot_stats, snapshot):
+    """Iterate node records for one attribute without rebuilding the tree"""
+    data = dumps_compact(snapshot)
+
+    def count_buttons():
+        return sum(1 for _, _, node in CompactReader(data=data) if node['role'] == 'Button')
+
+    assert benchmark(count_buttons) > 0
+    snapshot_stats(count_buttons, rounds=5, nodes=PROVIDER.size * 2)
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.events import LiveTree
+from axcore.fake import SyntheticProvider, synthetic_events
+from axcore.walker import walk_tree
+
+
+def make_live(depth=6, fanout=5):
+    provider = SyntheticProvider(depth, fanout)
+    live = LiveTree(provider, lambda: [provider.root])
+    live.load()
+    return provider, live
+
+
+@pytest.mark.parametrize('structure,carry_values', [(0, True), (0, False), (0.02, True)],
+                         ids=['property_values', 'property_reread', 'with_structure'])
+def test_apply_synthetic_stream(benchmark, snapshot_stats, structure, carry_values):
+    provider, live = make_live()
+    events = list(synthetic_events(provider, 1000, seed=1, structure=structure, carry_values=carry_values))
+
+    def apply_all():
+        for event in events:
+            live.apply(event)
+
+    provider.calls.clear()
+    apply_all()
+    benchmark.extra_info['provider_calls_per_event'] = round(sum(provider.calls.values()) / len(events), 2)
+    assert live.snapshot()["tree"] == [walk_tree(provider, provider.root)]
+
+    benchmark(apply_all)
+    stats = snapshot_stats(apply_all)
+    benchmark.extra_info['events'] = len(events)
+    benchmark.extra_info['events_per_sec'] = round(len(events) / (stats['p50_ms'] / 1000))
+
+
+@pytest.mark.parametrize('mode', ['live_snapshot', 'rewalk'])
+def test_snapshot_after_change(benchmark, snapshot_stats, mode):
+    provider, live = make_live()
+    events = synthetic_events(provider, 10 ** 9, seed=2, structure=0, focus=0)
+
+    def snapshot():
+        # One UI change between consecutive snapshots
+        live.apply(next(events))
+        if mode == 'live_snapshot':
+            return live.snapshot()["tree"]
+        return [walk_tree(provider, provider.root)]
+
+    tree = benchmark(snapshot)
+    assert len(tree) == 1
+    snapshot_stats(snapshot, nodes=provider.size)
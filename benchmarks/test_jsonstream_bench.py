@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticProvider
+from axcore.jsonstream import write_json
+from axcore.walker import walk_tree
+
+
+def clean_value(v):
+    if isinstance(v, str):
+        return v.encode('utf-8', errors='ignore').decode('utf-8')
+    elif isinstance(v, dict):
+        return {k: clean_value(x) for k, x in v.items()}
+    elif isinstance(v, list):
+        return [clean_value(x) for x in v]
+    return v
+
+
+def clean_string(s):
+    return s.encode('utf-8', errors='ignore').decode('utf-8')
+
+
+class NullWriter:
+    """Discards output but keeps its size, like writing to a file"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+
+
+@pytest.fixture(scope='module')
+def windows():
+    provider = SyntheticProvider(depth=6, fanout=5)
+    return [walk_tree(provider, provider.root) for _ in range(4)]
+
+
+@pytest.mark.parametrize('mode', ['copy_dumps', 'streaming'])
+def test_write_snapshot(benchmark, snapshot_stats, windows, mode):
+    nodes = SyntheticProvider(depth=6, fanout=5).size * len(windows)
+
+    def write():
+        out = NullWriter()
+        output = {'tree': iter(windows), 'focused_element': None, 'queries': {}}
+        if mode == 'copy_dumps':
+            output['tree'] = windows
+            out.write(json.dumps(clean_value(output), ensure_ascii=True))
+        else:
+            write_json(output, out.write, sanitize=clean_string)
+        return out.size
+
+    expected = len(json.dumps({'tree': windows, 'focused_element': None, 'queries': {}}))
+    assert benchmark(write) == expected
+    snapshot_stats(write, rounds=5, nodes=nodes)
+
+
+def test_streamed_bytes_match(windows):
+    output = {'tree': windows, 'focused_element': None, 'queries': {}}
+    buffer = io.StringIO()
+    write_json(output, buffer.write, sanitize=clean_string)
+    assert buffer.getvalue() == json.dumps(clean_value(output), ensure_ascii=True)
@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticWindows
+from axcore.procwalk import ProcessWalker
+from axcore.scheduler import fixed_budgets
+from axcore.walker import count_nodes
+from uia_extractors import iter_windows_tree
+
+# 8 windows of 73 nodes; every provider call is a 20 µs round-trip through
+# the process's single-threaded apartment, as with pywinauto's COM objects
+WINDOWS = (8, 3, 8, 0.00002)
+
+
+@pytest.mark.parametrize('workers', [1, 2, 4, 8])
+@pytest.mark.parametrize('mode', ['threads', 'processes'])
+def test_snapshot_scaling(benchmark, mode, workers):
+    backend = SyntheticWindows(*WINDOWS)
+    if mode == 'threads':
+        executor = ThreadPoolExecutor(workers)
+
+        def snapshot():
+            plan = fixed_budgets(backend.keys(), 60, str)
+            return list(iter_windows_tree(plan, executor, lambda key, deadline, max_nodes, stats, cache:
+                                          backend.walk(key, deadline, max_nodes, stats)))
+        close = executor.shutdown
+    else:
+        walker = ProcessWalker(SyntheticWindows, WINDOWS, workers)
+        walker.start()
+
+        def snapshot():
+            return list(walker.iter_windows_tree(fixed_budgets(backend.keys(), 60, str)))
+        close = walker.close
+
+    try:
+        trees = benchmark.pedantic(snapshot, rounds=3)
+    finally:
+        close()
+    assert sum(count_nodes(tree) for tree in trees) == 8 * 73
+    benchmark.extra_info.update(workers=workers, cpus=os.cpu_count(), nodes=8 * 73)
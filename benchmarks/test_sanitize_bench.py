@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticProvider
+from axcore.jsonstream import COMPACT_SEPARATORS, write_json
+from axcore.walker import make_bbox, walk_tree
+
+# Window titles, labels and cell values of a CJK-heavy desktop, with the odd
+# lone surrogate and control character that real backends hand out
+TEXTS = ['文件', '编辑(E)', '查看 - 视图', '设置和隐私', 'ドキュメント.docx', '검색 결과 1,024개', 'Ответить всем',
+         'Submit', 'OK', '2024年3月15日 星期五', '✓ 已保存', '🙂 表情符号', 'Zeile\x0b1', 'broken \ud83d emoji',
+         '中文输入法 - 拼音', '']
+
+
+class MixedTextProvider(SyntheticProvider):
+    def name(self, element):
+        return TEXTS[element[1] % len(TEXTS)]
+
+    def value(self, element):
+        return TEXTS[(element[1] * 7 + element[0]) % len(TEXTS)]
+
+
+class UncleanedProvider(MixedTextProvider):
+    def read(self, element):
+        # Provider.read before strings were cleaned as nodes are built
+        node = {
+            "name": self.name(element) or '',
+            "role": self.role(element) or '',
+            "description": self.description(element) or '',
+            "value": self.value(element) or '',
+            "bbox": make_bbox(self.bounds(element)),
+        }
+        node["states"] = self.states(element)
+        node["children"] = []
+        return node
+
+
+def clean_string(s):
+    return s.encode('utf-8', errors='ignore').decode('utf-8')
+
+
+def clean_value(v):
+    if isinstance(v, str):
+        return clean_string(v)
+    elif isinstance(v, dict):
+        return {k: clean_value(x) for k, x in v.items()}
+    elif isinstance(v, list):
+        return [clean_value(x) for x in v]
+    return v
+
+
+class ByteCounter:
+    """Discards output but counts its UTF-8 bytes, like writing to a file"""
+
+    def __init__(self):
+        self.text = []
+
+    def write(self, chunk):
+        self.text.append(chunk)
+
+    def bytes(self):
+        return ''.join(self.text).encode('utf-8')
+
+
+def snapshot(mode):
+    """Walk a 9331-node window and serialise it as the dumper would in mode"""
+    out = ByteCounter()
+    if mode in ('copy_dumps', 'sanitize_on_write'):
+        provider = UncleanedProvider(depth=6, fanout=6)
+        output = {'tree': [walk_tree(provider, provider.root)]}
+        if mode == 'copy_dumps':
+            out.write(json.dumps(clean_value(output), ensure_ascii=True))
+        else:
+            write_json(output, out.write, sanitize=clean_string)
+    else:
+        provider = MixedTextProvider(depth=6, fanout=6)
+        output = {'tree': [walk_tree(provider, provider.root)]}
+        if mode == 'clean_on_read':
+            write_json(output, out.write)
+        else:
+            write_json(output, out.write, ensure_ascii=False, separators=COMPACT_SEPARATORS)
+    return out.bytes()
+
+
+@pytest.mark.parametrize('mode', ['copy_dumps', 'sanitize_on_write', 'clean_on_read', 'clean_on_read_utf8'])
+def test_walk_and_write_mixed_unicode(benchmark, mode):
+    data = benchmark.pedantic(snapshot, args=(mode,), rounds=5)
+    ascii_data = snapshot('clean_on_read')
+    if mode.startswith('clean_on_read'):
+        assert json.loads(data) == json.loads(ascii_data)
+    benchmark.extra_info.update(bytes=len(data), ratio_to_ascii=round(len(data) / len(ascii_data), 3))
+
+
+def test_cleaning_once_drops_what_write_time_cleaning_dropped():
+    before, after = json.loads(snapshot('sanitize_on_write')), json.loads(snapshot('clean_on_read'))
+    # Lone surrogates are gone either way; control characters are now dropped too
+    assert json.dumps(before).replace('\\u000b', '') == json.dumps(after)
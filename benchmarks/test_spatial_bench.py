@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.spatial import SpatialIndex
+
+
+def tiled_tree(depth, fanout, box, axis=0):
+    """Window-like tree whose children tile their parent, alternating split direction"""
+    x, y, w, h = box
+    children = []
+    if depth > 1:
+        for i in range(fanout):
+            if axis == 0:
+                child = (x + w * i // fanout, y, w // fanout, h)
+            else:
+                child = (x, y + h * i // fanout, w, h // fanout)
+            children.append(tiled_tree(depth - 1, fanout, child, 1 - axis))
+    return {'name': f"{x},{y}", 'role': 'Pane', 'description': '', 'value': '',
+            'bbox': {'x': x, 'y': y, 'width': w, 'height': h}, 'children': children}
+
+
+@pytest.fixture(scope='module')
+def tree():
+    # Four overlapping windows of 3906 nodes each
+    return [tiled_tree(6, 5, (i * 300, i * 150, 1600, 900)) for i in range(4)]
+
+
+def test_build_index(benchmark, snapshot_stats, tree):
+    index = benchmark(SpatialIndex, tree)
+    snapshot_stats(lambda: SpatialIndex(tree), rounds=5, nodes=len(index))
+
+
+def test_hit_points(benchmark, snapshot_stats, tree):
+    """Label 1000 click points offline"""
+    index = SpatialIndex(tree)
+    rng = random.Random(1)
+    points = [(rng.randrange(0, 2560), rng.randrange(0, 1440)) for _ in range(1000)]
+
+    def label():
+        return sum(1 for x, y in points if index.hit_index(x, y) >= 0)
+
+    assert benchmark(label) > 0
+    stats = snapshot_stats(label)
+    benchmark.extra_info['us_per_hit'] = round(stats['p50_ms'], 3)
@@ -0,0 +1,70 @@
+import itertools
+import json
+import random
+import time
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticProvider
+from axcore.store import SnapshotStore
+from axcore.walker import walk_tree
+
+SNAPSHOTS = 20
+
+
+def recording_session(churn):
+    """
+    Events of a recording session over a 9331-node desktop: the clock changes
+    every snapshot and `churn` random elements are renamed between snapshots
+    """
+    rng = random.Random(7)
+    provider = SyntheticProvider(depth=6, fanout=6)
+    events = []
+    for i in range(SNAPSHOTS):
+        provider.rename((1, 0), f"Clock {i}")
+        for _ in range(churn):
+            depth = rng.randrange(2, 6)
+            provider.rename((depth, rng.randrange(6 ** depth)), f"Edited {i}")
+        events.append({'time': 1700000000000 + i * 1000,
+                       'data': {'duration': 40, 'tree': [walk_tree(provider, provider.root)]}})
+    return events
+
+
+@pytest.mark.parametrize('churn', [0, 100])
+def test_ingest_recording_session(benchmark, tmp_path, churn):
+    events = recording_session(churn)
+    paths = itertools.count()
+    timings = []
+
+    def ingest():
+        start = time.perf_counter()
+        with SnapshotStore(str(tmp_path / f'session-{next(paths)}.db')) as store:
+            for event in events:
+                store.add(event)
+            timings.append(time.perf_counter() - start)
+            return store.stats()
+
+    stats = benchmark.pedantic(ingest, rounds=2)
+    json_bytes = sum(len(json.dumps(event)) for event in events)
+    benchmark.extra_info.update(
+        nodes_per_sec=round(stats['nodes'] / min(timings)),
+        dedup_ratio=stats['dedup_ratio'],
+        store_bytes_per_snapshot=stats['bytes'] // SNAPSHOTS,
+        json_bytes_per_snapshot=json_bytes // SNAPSHOTS,
+    )
+    assert stats['snapshots'] == SNAPSHOTS and stats['nodes'] == SNAPSHOTS * 9331
+
+
+def test_read_snapshot_and_subtree(benchmark, snapshot_stats, tmp_path):
+    events = recording_session(10)
+    with SnapshotStore(str(tmp_path / 'session.db')) as store:
+        ids = [store.add(event)[0] for event in events]
+        root = store.snapshots()[-1][2]
+        window = store.children(store.children(root)[0])[1]
+
+        snapshot = benchmark(store.snapshot, ids[-1])
+        assert snapshot == events[-1]
+        subtree = snapshot_stats(lambda: store.subtree(window))
+        benchmark.extra_info['subtree_p50_ms'] = subtree['p50_ms']
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticProvider
+from axcore.visibility import VisibilityFilter
+from axcore.walker import WalkStats, walk_tree
+
+# Synthetic elements span x = 0..1460 at 20 px steps, 24 px tall rows
+FILTERS = {
+    'none': None,
+    'offscreen': VisibilityFilter([(0, 0, 640, 1080)]),
+    'occluded': VisibilityFilter([(0, 0, 1920, 1080)], occluders=[(400, 0, 500, 1080)]),
+    'occluded_stubs': VisibilityFilter([(0, 0, 1920, 1080)], occluders=[(400, 0, 500, 1080)], stubs=True),
+}
+
+
+@pytest.mark.parametrize('mode', list(FILTERS))
+def test_walk_with_visibility_pruning(benchmark, snapshot_stats, mode):
+    provider = SyntheticProvider(depth=6, fanout=6)
+    prune = FILTERS[mode]
+
+    def snapshot():
+        stats = WalkStats()
+        walk_tree(provider, provider.root, stats=stats, prune=prune)
+        return stats
+
+    stats = benchmark(snapshot)
+    provider.calls.clear()
+    snapshot()
+    benchmark.extra_info.update(walked=stats.nodes, pruned=stats.pruned,
+                                walked_fraction=round(stats.nodes / provider.size, 3),
+                                provider_calls=sum(provider.calls.values()))
+    snapshot_stats(snapshot, nodes=stats.nodes)
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from axcore.fake import SyntheticProvider
+from axcore.walker import SubtreeCache, count_nodes, walk_tree
+
+
+@pytest.mark.parametrize('depth,fanout', [(6, 4), (12, 2), (3, 40)], ids=['balanced', 'deep', 'wide'])
+def test_walk_synthetic_tree(benchmark, snapshot_stats, depth, fanout):
+    provider = SyntheticProvider(depth, fanout)
+    tree = benchmark(walk_tree, provider, provider.root)
+
+    assert count_nodes(tree) == provider.size
+    snapshot_stats(lambda: walk_tree(provider, provider.root), nodes=provider.size)
+
+
+def test_walk_with_ipc_latency(benchmark, snapshot_stats):
+    provider = SyntheticProvider(depth=4, fanout=3, latency=0.00002)
+    tree = benchmark.pedantic(walk_tree, args=(provider, provider.root), rounds=3)
+
+    assert count_nodes(tree) == provider.size
+    snapshot_stats(lambda: walk_tree(provider, provider.root), rounds=3, nodes=provider.size)
+
+
+def test_incremental_steady_state(benchmark, snapshot_stats):
+    provider = SyntheticProvider(depth=6, fanout=4)
+    cache = SubtreeCache(max_age=10 ** 9)
+    walk_tree(provider, provider.root, cache=cache)
+    full_calls = sum(provider.calls.values())
+
+    def snapshot():
+        # The root and one of its four branches change between snapshots
+        provider.rename((0, 0), f"Root #{cache.generation}")
+        provider.rename((1, 1), f"Branch #{cache.generation}")
+        return walk_tree(provider, provider.root, cache=cache)
+
+    provider.calls.clear()
+    tree = benchmark(snapshot)
+    rounds = cache.generation - 1
+    assert count_nodes(tree) == provider.size
+    benchmark.extra_info['call_fraction'] = round(sum(provider.calls.values()) / rounds / full_calls, 4)
+    snapshot_stats(snapshot, nodes=provider.size)
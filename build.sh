@@ -62,7 +62,7 @@ handle_platform() {
             # Add Windows-specific commands here
             setup_venv "windows"
             cd win-ax
-            pyinstaller --onefile dump-tree.py
+            pyinstaller --onefile --paths .. dump-tree.py
             cd ..
             mkdir -p target/windows-x64
             cp win-ax/dist/dump-tree.exe target/windows-x64/
@@ -94,6 +94,7 @@ handle_platform() {
             pyinstaller \
                 --add-data "./macapptree/macapptree:macapptree" \
                 --onefile \
+                --paths .. \
                 --target-arch arm64\
                 dump-tree.py
             cd ..
@@ -115,6 +116,7 @@ handle_platform() {
             pyinstaller \
                 --add-data "./macapptree/macapptree:macapptree" \
                 --onefile \
+                --paths .. \
                 --target-arch x86_64\
                 dump-tree.py
             cd ..
@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Platform helper modules live next to their dump-tree.py scripts
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'win-ax'), os.path.join(ROOT, 'mac-ax')]
+
+# Manual macOS check script, needs Quartz
+collect_ignore = ['mac-ax/test_cgwindows.py'] if sys.platform != 'darwin' else []
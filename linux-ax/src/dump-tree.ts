@@ -16,14 +16,35 @@ interface Node {
   children: Node[];
 }
 
+// Same shape as axcore/metrics.py: phases in ms, nodes per application, errors by type
+interface Metrics {
+  phases: Record<string, number>;
+  windows: Record<string, number>;
+  errors: Record<string, number>;
+}
+
 interface EventOutput {
   time: number;
   data: {
     duration: number;
     tree: Node[];
+    metrics: Metrics;
   };
 }
 
+const metrics: Metrics = { phases: {}, windows: {}, errors: {} };
+
+function countError(e: unknown) {
+  const kind = (e as Error)?.name || "Error";
+  metrics.errors[kind] = (metrics.errors[kind] || 0) + 1;
+}
+
+function countNodes(node: Node): number {
+  let count = 1;
+  for (const child of node.children) count += countNodes(child);
+  return count;
+}
+
 function getLabel(accessible: Atspi.Accessible) {
   const relationSet = accessible.get_relation_set();
   if (!relationSet) return null;
@@ -76,7 +97,7 @@ function formatInfo(accessible: Atspi.Accessible): Node {
       bbox.height = rect.height;
     }
   } catch (e) {
-    // console.error(e);
+    countError(e);
   }
 
   return {
@@ -111,18 +132,28 @@ async function main(outFile: string | null, eventFormat: boolean = false) {
   const startTime = Date.now(); // JS timestamp in ms
   let out: Node[] = [];
   const desktop = Atspi.get_desktop(0);
+  const apps: Atspi.Accessible[] = [];
   for (let i = 0, app; (app = desktop.get_child_at_index(i)); i++) {
-    out.push(dumpNodeContent(app));
+    apps.push(app);
   }
+  const walkStart = Date.now();
+  metrics.phases.enumerate = walkStart - startTime;
+  apps.forEach((app, i) => {
+    const node = dumpNodeContent(app);
+    metrics.windows[`${node.name ?? "app"} #${i}`] = countNodes(node);
+    out.push(node);
+  });
   const endTime = Date.now();
+  metrics.phases.walk = endTime - walkStart;
   const duration = endTime - startTime;
 
-  const output = eventFormat
+  const output: EventOutput | Node[] = eventFormat
     ? {
         time: startTime,
         data: {
           duration,
           tree: out,
+          metrics,
         },
       }
     : out;
@@ -0,0 +1,933 @@
+"""
+Platform-free passive AX extraction used by custom_extractors.py.
+
+Everything here talks to the accessibility API through the AXProvider
+interface below (implemented with pyobjc in custom_extractors.py), so
+ordering, deadline and merge behaviour can be exercised off-macOS against
+the fake provider in axcore/fake.py.
+
+Applications can be walked concurrently: each app runs on a worker thread
+with its own deadline. The app element's messaging timeout bounds every
+single AX call; the deadline stops the walk between elements, keeping the
+partial windows marked truncated. An app whose worker still has not
+returned once its deadline and one messaging timeout have passed (an AX
+call blocked on a hung process) is reported as timed out and its thread
+is abandoned; a replacement worker keeps the pool at full size. Results
+are merged in application enumeration order, whatever order they finish in.
+
+Each element is read with one multi-attribute fetch (like
+AXUIElementCopyMultipleAttributeValues) covering the requested fields and
+its children, instead of one Mach IPC round-trip per attribute. Callers can
+drop fields they do not need; the role is always fetched because the legacy
+output skips nodes without one.
+
+Windows are walked depth-first with an explicit stack (no recursion limit on
+deep web content), emitting nodes in the shared output schema directly
+rather than building an intermediate tree and converting it afterwards.
+
+With a WindowCache, windows whose CGWindowList entry (bounds, title, layer)
+is unchanged since the last snapshot reuse their previous tree instead of
+being walked again.
+
+With pruning, a ScreenLayout built from the display frames and the
+CGWindowList z-order lets each window walk skip elements that are empty,
+off every display or hidden behind the windows in front of it (see
+axcore/visibility.py).
+
+With an axcore.metrics.Metrics, extract_system_wide times the enumerate
+and walk phases, counts AX calls per attribute through CountingAXProvider
+and counts AXErrors and failed applications.
+
+For watch mode, AXTreeProvider exposes an AXProvider as an axcore.walker
+Provider so an axcore.events.LiveTree can mirror the windows, and ax_event()
+turns AXObserver notifications into backend-neutral UIEvents.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from axcore.events import UIEvent
+from axcore.visibility import ScreenLayout
+from axcore.walker import Deadline, Provider, WalkStats, clean_text, count_nodes
+
+# AXError codes
+kAXErrorSuccess = 0
+kAXErrorCannotComplete = -25204
+kAXErrorAPIDisabled = -25211
+kAXErrorNoValue = -25212
+
+kAXRoleAttribute = 'AXRole'
+kAXTitleAttribute = 'AXTitle'
+kAXValueAttribute = 'AXValue'
+kAXDescriptionAttribute = 'AXDescription'
+kAXPositionAttribute = 'AXPosition'
+kAXSizeAttribute = 'AXSize'
+kAXChildrenAttribute = 'AXChildren'
+kAXWindowsAttribute = 'AXWindows'
+kAXParentAttribute = 'AXParent'
+
+# AXObserver notifications watched in watch mode and the UIEvent kind of each
+AX_NOTIFICATION_EVENTS = {
+    'AXCreated': UIEvent.STRUCTURE,
+    'AXUIElementDestroyed': UIEvent.STRUCTURE,
+    'AXWindowCreated': UIEvent.STRUCTURE,
+    'AXValueChanged': UIEvent.PROPERTY,
+    'AXTitleChanged': UIEvent.PROPERTY,
+    'AXMoved': UIEvent.PROPERTY,
+    'AXResized': UIEvent.PROPERTY,
+    'AXFocusedUIElementChanged': UIEvent.FOCUS,
+}
+
+# Fields of the passive tree and the AX attributes each needs
+FIELD_ATTRIBUTES = {
+    'role': (kAXRoleAttribute,),
+    'title': (kAXTitleAttribute,),
+    'value': (kAXValueAttribute,),
+    'description': (kAXDescriptionAttribute,),
+    'bbox': (kAXPositionAttribute, kAXSizeAttribute),
+}
+FIELDS = tuple(FIELD_ATTRIBUTES)
+TEXT_FIELDS = ('role', 'title', 'value', 'description')
+
+# System apps that should not be recorded
+INVALID_APPS = ['Window Server', 'Dock', 'Spotlight', 'SystemUIServer',
+                'ControlCenter', 'NotificationCenter', 'Finder', 'clones']
+
+# Per-call AX messaging timeout used when an app deadline is set
+DEFAULT_MESSAGING_TIMEOUT = 1.0
+
+
+class AXProvider:
+    """
+    Accessibility API interface consumed by the passive extractors.
+
+    Methods mirror the AXUIElement C API: errors are returned as AXError
+    codes alongside the value rather than raised.
+    """
+
+    def applications(self):
+        """Return (err, app elements) of the system-wide element"""
+        return kAXErrorSuccess, []
+
+    def copy_attribute(self, element, attribute):
+        """Return (err, value) like AXUIElementCopyAttributeValue"""
+        return kAXErrorNoValue, None
+
+    def copy_multiple_attributes(self, element, attributes):
+        """
+        Return (err, values) like AXUIElementCopyMultipleAttributeValues,
+        with None for attributes that have no value. The default issues one
+        copy_attribute call per attribute.
+        """
+        values = []
+        for attribute in attributes:
+            err, value = self.copy_attribute(element, attribute)
+            if err == kAXErrorCannotComplete:
+                return err, None
+            values.append(value if err == kAXErrorSuccess else None)
+        return kAXErrorSuccess, values
+
+    def set_messaging_timeout(self, element, seconds):
+        """Bound every AX call on element (and, for an app element, its descendants)"""
+        return kAXErrorSuccess
+
+    def pid(self, app):
+        """Return (err, pid) of an application element like AXUIElementGetPid"""
+        return kAXErrorNoValue, None
+
+    def window_number(self, window):
+        """CGWindowID of a window element, or None when unknown"""
+        return None
+
+    def window_list(self):
+        """
+        On-screen windows from CGWindowListCopyWindowInfo as dicts with pid,
+        number, bounds (x, y, width, height), title and layer
+        """
+        return []
+
+    def point(self, value):
+        """Return (x, y) of an AXPosition value"""
+        return value.x, value.y
+
+    def size(self, value):
+        """Return (width, height) of an AXSize value"""
+        return value.width, value.height
+
+
+class AXTreeProvider(Provider):
+    """
+    axcore.walker Provider over an AXProvider, used by watch mode's LiveTree.
+
+    read() makes the element's single multi-attribute fetch and keeps the
+    children it returned for the children() call that follows; elements
+    without a role fail to read, so they are left out with their subtree as
+    in snapshots. Elements are their own identity (AXUIElementRefs compare
+    with CFEqual). Calls must be serialised, as LiveTree does.
+
+    Args:
+        provider: AXProvider
+        fields: Element fields to fetch (default: all of FIELDS)
+    """
+
+    def __init__(self, provider, fields=None):
+        self.provider = provider
+        self.fetch = element_attributes(fields)
+        self._last = (None, None)
+
+    def read(self, element, fingerprint=None):
+        attributes, children = read_element(self.provider, element, self.fetch)
+        node, _ = legacy_node(attributes)
+        if node is None:
+            raise LookupError("element has no role (destroyed?)")
+        self._last = (element, children)
+        return node
+
+    def children(self, element):
+        last, children = self._last
+        if last is not element:
+            err, children = self.provider.copy_attribute(element, kAXChildrenAttribute)
+            children = children if err == kAXErrorSuccess else None
+        return list(children or [])
+
+    def parent(self, element):
+        err, parent = self.provider.copy_attribute(element, kAXParentAttribute)
+        return parent if err == kAXErrorSuccess else None
+
+    def identity(self, element):
+        return element
+
+
+def ax_event(notification, element):
+    """UIEvent for an AXObserver notification, or None for notifications not watched"""
+    kind = AX_NOTIFICATION_EVENTS.get(str(notification))
+    return UIEvent(kind, element) if kind is not None else None
+
+
+class CountingAXProvider(AXProvider):
+    """
+    Wraps another AXProvider and counts calls and seconds per method
+    (copy_attribute per attribute name), and failed calls per AXError code
+    in `errors` (missing values are not failures). Safe to share between
+    app workers.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def _call(self, name, method, *args, errors=True):
+        """Call the wrapped method; with errors, its result is (err, value) or err"""
+        start = time.perf_counter()
+        result = getattr(self.provider, method)(*args)
+        elapsed = time.perf_counter() - start
+        err = kAXErrorSuccess
+        if errors:
+            err = result[0] if isinstance(result, tuple) else result
+        with self._lock:
+            self.calls[name] += 1
+            self.seconds[name] += elapsed
+            if err not in (kAXErrorSuccess, kAXErrorNoValue):
+                self.errors[f"AXError {err}"] += 1
+        return result
+
+    def report(self):
+        """{method or attribute: {"calls", "ms"}} in descending time order"""
+        with self._lock:
+            return {name: {"calls": self.calls[name], "ms": round(seconds * 1000, 3)}
+                    for name, seconds in self.seconds.most_common()}
+
+    def applications(self):
+        return self._call('applications', 'applications')
+
+    def copy_attribute(self, element, attribute):
+        return self._call(attribute, 'copy_attribute', element, attribute)
+
+    def copy_multiple_attributes(self, element, attributes):
+        return self._call('copy_multiple_attributes', 'copy_multiple_attributes', element, attributes)
+
+    def set_messaging_timeout(self, element, seconds):
+        return self._call('set_messaging_timeout', 'set_messaging_timeout', element, seconds)
+
+    def pid(self, app):
+        return self._call('pid', 'pid', app)
+
+    def window_number(self, window):
+        return self._call('window_number', 'window_number', window, errors=False)
+
+    def window_list(self):
+        return self._call('window_list', 'window_list', errors=False)
+
+    def point(self, value):
+        return self.provider.point(value)
+
+    def size(self, value):
+        return self.provider.size(value)
+
+
+def application_windows(provider, apps):
+    """Window elements of the applications snapshots record (titled, not excluded system apps)"""
+    windows = []
+    for app in apps:
+        err, app_name = provider.copy_attribute(app, kAXTitleAttribute)
+        if err != kAXErrorSuccess or not app_name or str(app_name) in INVALID_APPS:
+            continue
+        err, app_windows = provider.copy_attribute(app, kAXWindowsAttribute)
+        if err == kAXErrorSuccess and app_windows:
+            windows.extend(app_windows)
+    return windows
+
+
+class AppReport:
+    """
+    Outcome of one application's extraction, reported in -e output.
+
+    status is one of ok, truncated (deadline or node budget reached,
+    partial windows kept), timeout (abandoned, no windows), skipped
+    (filtered or no windows) and error; reason says why for anything but ok.
+    """
+
+    def __init__(self, index, app_name=None):
+        self.index = index
+        self.app_name = app_name
+        self.status = 'ok'
+        self.reason = None
+        self.windows = 0
+        self.reused = 0
+        self.nodes = 0
+        self.pruned = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        report = {
+            "app": self.app_name,
+            "index": self.index,
+            "status": self.status,
+            "windows": self.windows,
+            "reused": self.reused,
+            "nodes": self.nodes,
+            "pruned": self.pruned,
+            "elapsed_ms": round(self.elapsed * 1000),
+        }
+        if self.reason:
+            report["reason"] = self.reason
+        return report
+
+
+class WindowCache:
+    """
+    Window trees of the previous snapshot keyed on (pid, window number).
+
+    A window's tree is reused while its CGWindowList entry (bounds, title,
+    layer) is unchanged, it has not been invalidated and it is younger than
+    max_age snapshots. Edits inside a window do not change its CGWindowList
+    entry, so they only show once the entry expires unless a long-lived
+    caller observing AX notifications passes them to invalidate(); one-shot
+    runs cannot, and should keep max_age low. Thread-safe, so concurrent
+    application workers can share one cache.
+
+    Args:
+        path: JSON file to load from and save to (None = memory only)
+        max_age: Snapshots after which a window is re-walked even if unchanged
+    """
+
+    def __init__(self, path=None, max_age=10):
+        self.path = path
+        self.max_age = max_age
+        self.generation = 0
+        self.entries = {}  # (pid, number) -> [signature, tree, generation stored]
+        self.windows = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    saved = json.load(f)
+                self.generation = saved["generation"]
+                for key, entry in saved["windows"].items():
+                    pid, number = key.split(':')
+                    self.entries[(int(pid), int(number))] = entry
+            except (IOError, ValueError, KeyError) as e:
+                print(f"Error loading window cache {path}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def signature(info):
+        x, y, width, height = info['bounds']
+        return [int(x), int(y), int(width), int(height), info.get('title'), info.get('layer')]
+
+    def begin(self, window_list):
+        """Start a snapshot given the current CGWindowList windows"""
+        self.generation += 1
+        self.hits = 0
+        self.misses = 0
+        self.windows = {(info['pid'], info['number']): info for info in window_list}
+
+    def key(self, pid, number, position, size):
+        """
+        Cache key of a window of app pid, or None if it is not on screen.
+
+        Without a window number, the window is matched by its bounds among
+        the app's CGWindowList windows.
+        """
+        if number is not None:
+            return (pid, number) if (pid, number) in self.windows else None
+        bounds = [int(position[0]), int(position[1]), int(size[0]), int(size[1])]
+        matches = [key for key, info in self.windows.items()
+                   if key[0] == pid and self.signature(info)[:4] == bounds]
+        return matches[0] if len(matches) == 1 else None
+
+    def reuse(self, key):
+        """Return the cached tree of the window if it is unchanged, counting hits and misses"""
+        with self._lock:
+            entry = self.entries.get(key) if key is not None else None
+            if (entry is None or entry[0] != self.signature(self.windows[key]) or
+                    self.generation - entry[2] >= self.max_age):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def store(self, key, tree):
+        with self._lock:
+            self.entries[key] = [self.signature(self.windows[key]), tree, self.generation]
+
+    def invalidate(self, pid, number=None):
+        """Force one window, or every window of an application, to be walked again"""
+        with self._lock:
+            for key in list(self.entries):
+                if key[0] == pid and number in (None, key[1]):
+                    del self.entries[key]
+
+    def commit(self):
+        """Drop windows that are no longer on screen"""
+        with self._lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if key in self.windows}
+
+    def report(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({"generation": self.generation,
+                           "windows": {f"{pid}:{number}": entry for (pid, number), entry in self.entries.items()}}, f)
+        except IOError as e:
+            print(f"Error saving window cache {self.path}: {e}", file=sys.stderr)
+
+
+def parse_fields(text):
+    """Parse a comma-separated field list (e.g. for --fields), always including role"""
+    fields = [field.strip() for field in text.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELD_ATTRIBUTES]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (choose from {', '.join(FIELDS)})")
+    return normalize_fields(fields)
+
+
+def normalize_fields(fields):
+    """Fields in canonical order as a tuple, always including role"""
+    fields = set(fields or FIELDS) | {'role'}
+    return tuple(field for field in FIELDS if field in fields)
+
+
+def element_attributes(fields):
+    """AX attributes fetched per element for the given fields, children last"""
+    attributes = [attribute for field in normalize_fields(fields) for attribute in FIELD_ATTRIBUTES[field]]
+    return tuple(attributes) + (kAXChildrenAttribute,)
+
+
+def _reason(message, err):
+    return message if err == kAXErrorSuccess else f"{message} (AXError {err})"
+
+
+def display_index_of(position, size, displays):
+    """
+    Index of the display the window overlaps most, by area (0 if it overlaps none).
+
+    displays are frames as from get_display_info(); ties go to the lower index.
+    """
+    return DisplayIndex(displays).index_of(position, size)
+
+
+class DisplayIndex:
+    """
+    Display frames of one snapshot, assigning windows to displays.
+
+    Built once per snapshot from get_display_info() frames, in global
+    top-left-origin coordinates like window bounds. A window belongs to the
+    display it overlaps most, so windows straddling two displays and
+    side-by-side or stacked arrangements of any number of displays are
+    assigned like the window server does.
+    """
+
+    def __init__(self, displays):
+        self.frames = [(d['frame']['x'], d['frame']['y'], d['frame']['width'], d['frame']['height'])
+                       for d in displays]
+
+    def index_of(self, position, size):
+        """Index of the display the window overlaps most (0 if it overlaps none)"""
+        x, y = position
+        right, bottom = x + size[0], y + size[1]
+        best, best_area = 0, 0
+        for i, (fx, fy, fw, fh) in enumerate(self.frames):
+            width = min(right, fx + fw) - max(x, fx)
+            height = min(bottom, fy + fh) - max(y, fy)
+            if width > 0 and height > 0 and width * height > best_area:
+                best, best_area = i, width * height
+        return best
+
+    def pids_on(self, index, window_list):
+        """pids owning a normal-layer window of window_list (CGWindowList entries) on display index"""
+        return {info['pid'] for info in window_list
+                if info.get('layer', 0) == 0 and self.index_of(info['bounds'][:2], info['bounds'][2:]) == index}
+
+
+def read_element(provider, element, fetch):
+    """
+    Read one element's attributes with a single multi-attribute fetch.
+
+    fetch is element_attributes(fields). Returns (attributes, children) where
+    attributes holds the passive tree fields that have a value.
+    """
+    err, values = provider.copy_multiple_attributes(element, fetch)
+    if err != kAXErrorSuccess or not values:
+        return {}, None
+    values = dict(zip(fetch, values))
+
+    attributes = {}
+    for field in TEXT_FIELDS:
+        value = values.get(FIELD_ATTRIBUTES[field][0])
+        if value:
+            attributes[field] = clean_text(str(value))
+
+    position = values.get(kAXPositionAttribute)
+    size = values.get(kAXSizeAttribute)
+    if position and size:
+        x, y = provider.point(position)
+        width, height = provider.size(size)
+        attributes['bbox'] = {'x': int(x), 'y': int(y), 'width': int(width), 'height': int(height)}
+    return attributes, values.get(kAXChildrenAttribute)
+
+
+def passive_node(attributes):
+    """Node of the intermediate {'attributes', 'children'} format, and its children list"""
+    node = {'attributes': attributes, 'children': []}
+    return node, node['children']
+
+
+def legacy_node(attributes):
+    """Node in the shared output schema, and its children list; elements without a role are dropped"""
+    if not attributes.get('role'):
+        return None, None
+    node = {
+        'role': attributes['role'],
+        'name': attributes.get('title', ''),
+        'description': attributes.get('description', ''),
+        'value': attributes.get('value', ''),
+        'bbox': attributes.get('bbox', {'x': 0, 'y': 0, 'width': 0, 'height': 0}),
+        'children': []
+    }
+    return node, node['children']
+
+
+def walk_passive(provider, element, make_node=legacy_node, max_depth=None, max_nodes=None, deadline=None,
+                 stats=None, fields=None, prune=None):
+    """
+    Depth-first walk from element with an explicit stack, without focus changes.
+
+    make_node(attributes) builds each node directly in the output format
+    and returns (node, children list), or (None, None) to drop the element
+    and its subtree. Returns a list with the root node, or an empty list.
+
+    Args:
+        provider: AXProvider implementation
+        element: Element to start from (depth 0)
+        make_node: legacy_node (default) or passive_node
+        max_depth: Number of levels to include (None = unlimited)
+        max_nodes: Node budget; reaching it truncates the walk like the deadline
+        deadline: Deadline checked before each element after the root
+        stats: WalkStats to fill in (nodes, truncated, pruned)
+        fields: Element fields to fetch (default: FIELDS)
+        prune: axcore.visibility.VisibilityFilter; elements it rejects are
+            not descended into and are dropped or kept as stubs
+    """
+    stats = stats if stats is not None else WalkStats()
+    if max_depth is not None and max_depth <= 0:
+        return []
+    fetch = element_attributes(fields)
+    roots = []
+    stack = [(element, roots, 0)]
+    while stack:
+        if roots and ((deadline is not None and deadline.expired()) or
+                      (max_nodes is not None and stats.nodes >= max_nodes)):
+            stats.truncated = True
+            break
+
+        element, siblings, depth = stack.pop()
+        try:
+            attributes, children = read_element(provider, element, fetch)
+        except Exception as e:
+            print(f"Error extracting element: {e}", file=sys.stderr)
+            continue
+        stats.nodes += 1
+
+        node, node_children = make_node(attributes)
+        if node is None:
+            continue
+        if prune is not None:
+            reason = prune.reason(attributes.get('bbox'))
+            if reason is not None:
+                stats.pruned += 1
+                if prune.stubs:
+                    siblings.append(prune.stub(node, reason, len(children) if children else 0))
+                continue
+        siblings.append(node)
+        if children and (max_depth is None or depth + 1 < max_depth):
+            # Reversed so children are visited (and appended) in order
+            stack.extend((child, node_children, depth + 1) for child in reversed(list(children)))
+    return roots
+
+
+def extract_element_tree_passive(provider, element, max_depth=None, current_depth=0, deadline=None, stats=None,
+                                 fields=None):
+    """
+    Extract accessibility tree from an element without focus changes, in the
+    intermediate {'attributes', 'children'} format.
+    """
+    if max_depth is not None:
+        max_depth -= current_depth
+    roots = walk_passive(provider, element, passive_node, max_depth, deadline=deadline, stats=stats, fields=fields)
+    return roots[0] if roots else None
+
+
+def extract_application(provider, app, displays, max_depth=None, report=None, deadline=None, fields=None,
+                        max_nodes=None, cache=None, layout=None, display_filter=None, pids=None):
+    """
+    Extract the windows of one application.
+
+    Returns the list of window dicts, whose 'tree' holds the window element
+    in the shared output schema, and fills in report (an AppReport).
+    displays is the snapshot's DisplayIndex; max_nodes is the node budget of
+    each window; cache is a WindowCache already begun for this snapshot;
+    layout is the ScreenLayout (keyed on window numbers) to prune each
+    window walk with. Pruned trees depend on the other windows, so they are
+    not stored in the cache. With display_filter only windows on that
+    display are walked, and apps whose pid is not in pids (those with
+    windows on it, when known) are skipped before any AX call.
+    """
+    report = report if report is not None else AppReport(0)
+    pid = None
+    if cache is not None or pids is not None:
+        err, pid = provider.pid(app)
+        if err != kAXErrorSuccess:
+            pid = None
+    if pids is not None and pid is not None and pid not in pids:
+        report.status, report.reason = 'skipped', f"no windows on display {display_filter}"
+        return []
+
+    err, app_name = provider.copy_attribute(app, kAXTitleAttribute)
+    if err != kAXErrorSuccess or not app_name:
+        report.status, report.reason = 'skipped', _reason("no title", err)
+        return []
+    report.app_name = app_name = clean_text(str(app_name))
+    if app_name in INVALID_APPS:
+        report.status, report.reason = 'skipped', "excluded system app"
+        return []
+
+    err, windows = provider.copy_attribute(app, kAXWindowsAttribute)
+    if err != kAXErrorSuccess or not windows:
+        report.status, report.reason = 'skipped', _reason("no windows", err)
+        return []
+
+    windows_data = []
+    stats = WalkStats()
+    for window in windows:
+        if deadline is not None and deadline.expired():
+            stats.truncated = True
+            break
+        try:
+            err, values = provider.copy_multiple_attributes(window, (kAXPositionAttribute, kAXSizeAttribute))
+            if err != kAXErrorSuccess or not values or values[0] is None or values[1] is None:
+                continue
+            position = provider.point(values[0])
+            size = provider.size(values[1])
+
+            # Filter out tiny windows
+            if size[0] < 100 or size[1] < 100:
+                continue
+            display_index = displays.index_of(position, size)
+            if display_filter is not None and display_index != display_filter:
+                continue
+
+            key = tree = prune = None
+            number = None
+            if (cache is not None and pid is not None) or layout is not None:
+                number = provider.window_number(window)
+            if cache is not None and pid is not None:
+                key = cache.key(pid, number, position, size)
+                tree = cache.reuse(key)
+            if layout is not None:
+                prune = layout.filter(number)
+            window_stats = WalkStats()
+            if tree is not None:
+                report.reused += 1
+            else:
+                tree = walk_passive(provider, window, legacy_node, max_depth, max_nodes, deadline, window_stats, fields,
+                                    prune)
+                if key is not None and not window_stats.truncated and not window_stats.pruned:
+                    cache.store(key, tree)
+
+            window_data = {
+                'app_name': app_name,
+                'display_index': display_index,
+                'position': {'x': int(position[0]), 'y': int(position[1])},
+                'size': {'width': int(size[0]), 'height': int(size[1])},
+                'tree': tree
+            }
+            if window_stats.truncated:
+                window_data['truncated'] = True
+                stats.truncated = True
+            stats.nodes += window_stats.nodes
+            stats.pruned += window_stats.pruned
+            windows_data.append(window_data)
+
+        except Exception as e:
+            print(f"Error processing window: {e}", file=sys.stderr)
+            continue
+
+    report.windows = len(windows_data)
+    report.nodes = stats.nodes
+    report.pruned = stats.pruned
+    if stats.truncated:
+        report.status, report.reason = 'truncated', "deadline or node budget reached"
+    return windows_data
+
+
+def _extract_timed(provider, app, index, displays, max_depth, app_timeout, messaging_timeout, fields, max_nodes,
+                   cache, layout=None, display_filter=None, pids=None):
+    """Run extract_application for one app under its deadline, returning (windows, AppReport)"""
+    report = AppReport(index)
+    deadline = Deadline(app_timeout)
+    try:
+        if messaging_timeout is not None:
+            provider.set_messaging_timeout(app, messaging_timeout)
+        windows = extract_application(provider, app, displays, max_depth, report, deadline, fields, max_nodes, cache,
+                                      layout, display_filter, pids)
+    except Exception as e:
+        print(f"Error processing app {report.app_name or 'unknown'}: {e}", file=sys.stderr)
+        report.status, report.reason = 'error', str(e)
+        windows = []
+    report.elapsed = deadline.elapsed()
+    return windows, report
+
+
+def extract_applications(provider, apps, displays, max_depth=None, workers=None, app_timeout=None,
+                         messaging_timeout=None, fields=None, max_nodes=None, cache=None, clock=time.monotonic,
+                         layout=None, display_filter=None, window_list=None):
+    """
+    Extract the windows of every application.
+
+    Args:
+        provider: AXProvider implementation
+        apps: Application elements in enumeration order
+        displays: Display frames from get_display_info()
+        max_depth: Maximum depth of each window tree
+        workers: Number of worker threads (None: walk apps sequentially
+            on the calling thread)
+        app_timeout: Per-app deadline in seconds (None = unbounded)
+        messaging_timeout: AX messaging timeout set on each app element
+            (default: DEFAULT_MESSAGING_TIMEOUT capped at app_timeout when
+            app_timeout is set)
+        fields: Passive tree fields to fetch per element (default: FIELDS)
+        max_nodes: Node budget of each window (None = unlimited)
+        cache: WindowCache begun for this snapshot, to skip unchanged windows
+        clock: Monotonic time source, injectable for tests
+        layout: ScreenLayout keyed on window numbers, to prune what is not
+            visible from the window walks (None = walk everything)
+        display_filter: Only walk the windows on this display index
+        window_list: CGWindowList entries of the snapshot; with
+            display_filter, apps without a window on the display are
+            skipped without touching their AX elements
+
+    Returns:
+        (windows, reports): window dicts merged in app order, and one
+        AppReport per app
+    """
+    if messaging_timeout is None and app_timeout is not None:
+        messaging_timeout = min(DEFAULT_MESSAGING_TIMEOUT, app_timeout)
+    displays = DisplayIndex(displays)
+    pids = None
+    if display_filter is not None and window_list is not None:
+        pids = displays.pids_on(display_filter, window_list)
+
+    def run(index):
+        return _extract_timed(provider, apps[index], index, displays, max_depth, app_timeout, messaging_timeout,
+                              fields, max_nodes, cache, layout, display_filter, pids)
+
+    if not workers:
+        outcomes = [run(index) for index in range(len(apps))]
+    else:
+        hard_limit = None if app_timeout is None else app_timeout + (messaging_timeout or 0)
+        outcomes = _run_pool(run, len(apps), workers, hard_limit, clock)
+
+    windows = []
+    reports = []
+    for windows_data, report in outcomes:
+        windows.extend(windows_data)
+        reports.append(report)
+    return windows, reports
+
+
+def extract_system_wide(provider, displays, max_depth=None, workers=None, app_timeout=None,
+                        messaging_timeout=None, fields=None, max_nodes=None, cache=None, metrics=None,
+                        prune=False, prune_stubs=False, display_filter=None):
+    """
+    Extract the windows of all applications of the system-wide element.
+
+    Raises RuntimeError when applications cannot be listed, to trigger the
+    CGWindowList fallback. Returns (windows, reports) like extract_applications.
+    With a WindowCache, the snapshot begins from provider.window_list() and
+    windows no longer on screen are dropped from the cache afterwards.
+    With metrics (axcore.metrics.Metrics), the enumerate and walk phases,
+    nodes per window ("app #n", reused ones included), AX calls and errors
+    are recorded. With prune (or prune_stubs, which keeps pruned elements
+    as stubs), window walks skip elements that cannot be seen given the
+    displays and the window list. With display_filter, only the windows on
+    that display are walked and other apps are not touched.
+    """
+    if metrics is not None:
+        provider = CountingAXProvider(provider)
+    try:
+        with metrics.phase('enumerate') if metrics is not None else nullcontext():
+            apps = _list_applications(provider)
+            layout = window_list = None
+            if cache is not None or prune or prune_stubs or display_filter is not None:
+                window_list = provider.window_list()
+                if cache is not None:
+                    cache.begin(window_list)
+                if prune or prune_stubs:
+                    layout = screen_layout(displays, window_list, prune_stubs)
+        print(f"Available displays: {len(displays)}", file=sys.stderr)
+        with metrics.phase('walk') if metrics is not None else nullcontext():
+            windows, reports = extract_applications(provider, apps, displays, max_depth, workers, app_timeout,
+                                                    messaging_timeout, fields, max_nodes, cache, layout=layout,
+                                                    display_filter=display_filter, window_list=window_list)
+    finally:
+        if metrics is not None:
+            metrics.calls = provider.report()
+            for kind, count in provider.errors.items():
+                metrics.error(kind, count)
+    if cache is not None:
+        cache.commit()
+    if metrics is not None:
+        metrics.windows = {}
+        counts = Counter()
+        for window in windows:
+            counts[window['app_name']] += 1
+            metrics.windows[f"{window['app_name']} #{counts[window['app_name']]}"] = sum(
+                count_nodes(node) for node in window['tree'])
+        for report in reports:
+            if report.status in ('timeout', 'error'):
+                metrics.error(f"app {report.status}")
+    return windows, reports
+
+
+def screen_layout(displays, window_list, stubs=False):
+    """ScreenLayout of the display frames and the normal-layer windows of window_list (front to back)"""
+    frames = [(d['frame']['x'], d['frame']['y'], d['frame']['width'], d['frame']['height']) for d in displays]
+    windows = [(info['number'], info['bounds']) for info in window_list if info.get('layer', 0) == 0]
+    return ScreenLayout(frames, windows, stubs)
+
+
+def _list_applications(provider):
+    """Application elements of the system-wide element"""
+    err, apps = provider.applications()
+    if err != kAXErrorSuccess:
+        error_msg = f"Failed to get applications from system element. Error: {err}"
+        print(error_msg, file=sys.stderr)
+        # Always raise exception for any accessibility error to trigger immediate fallback
+        raise RuntimeError(error_msg)
+
+    if not apps:
+        error_msg = "No applications found from system element"
+        print(error_msg, file=sys.stderr)
+        raise RuntimeError(error_msg)
+
+    print(f"Found {len(apps)} applications to examine", file=sys.stderr)
+    return list(apps)
+
+
+def _run_pool(run, count, workers, hard_limit, clock):
+    """Run run(index) for every index on daemon worker threads, abandoning runs past hard_limit"""
+    pending = queue.Queue()
+    for index in range(count):
+        pending.put(index)
+    done = queue.Queue()
+    started = {}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            with lock:
+                started[index] = clock()
+            try:
+                outcome = run(index)
+            except Exception as e:
+                report = AppReport(index)
+                report.status, report.reason = 'error', str(e)
+                outcome = ([], report)
+            done.put((index, outcome))
+
+    def spawn():
+        threading.Thread(target=worker, name='ax-app-worker', daemon=True).start()
+
+    for _ in range(min(workers, count)):
+        spawn()
+
+    outcomes = [None] * count
+    remaining = count
+    while remaining:
+        timeout = 0.05
+        if hard_limit is not None:
+            now = clock()
+            with lock:
+                running = [(index, start) for index, start in started.items() if outcomes[index] is None]
+            for index, start in running:
+                if now - start >= hard_limit:
+                    # Blocked in an AX call: give up on the app and replace its worker
+                    report = AppReport(index)
+                    report.status = 'timeout'
+                    report.reason = f"no response within {hard_limit:g}s"
+                    report.elapsed = now - start
+                    outcomes[index] = ([], report)
+                    remaining -= 1
+                    spawn()
+            waits = [start + hard_limit - now for index, start in running if outcomes[index] is None]
+            if waits:
+                timeout = max(0.0, min(waits + [timeout]))
+        if not remaining:
+            break
+        try:
+            index, outcome = done.get(timeout=timeout)
+        except queue.Empty:
+            continue
+        if outcomes[index] is None:
+            outcomes[index] = outcome
+            remaining -= 1
+    return outcomes
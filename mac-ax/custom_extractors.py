@@ -1,11 +1,51 @@
 """
 Custom accessibility extractors that extend macapptree functionality
 without duplicating the entire package.
+
+The extraction logic lives in ax_extractors.py; this module binds it to
+the real accessibility API through PyObjCAXProvider, and AXObserver
+notifications to the watch mode's LiveTree.
 """
 
+import ctypes
+import sys
+
 import AppKit
 import ApplicationServices
-from Quartz import CGDisplayBounds, CGGetOnlineDisplayList
+import objc
+from CoreFoundation import (
+    CFGetTypeID,
+    CFRunLoopAddSource,
+    CFRunLoopGetCurrent,
+    CFRunLoopRunInMode,
+    kCFRunLoopDefaultMode,
+)
+from Quartz import (
+    CGDisplayBounds,
+    CGGetOnlineDisplayList,
+    CGWindowListCopyWindowInfo,
+    kCGNullWindowID,
+    kCGWindowBounds,
+    kCGWindowLayer,
+    kCGWindowListOptionOnScreenOnly,
+    kCGWindowName,
+    kCGWindowNumber,
+    kCGWindowOwnerPID,
+)
+
+import ax_extractors
+from ax_extractors import AXProvider
+from axcore.coalesce import EventCoalescer
+from axcore.events import LiveTree
+
+# Private but long-stable SPI mapping an AX window to its CGWindowID
+try:
+    _AXUIElementGetWindow = ctypes.cdll.LoadLibrary(
+        '/System/Library/Frameworks/ApplicationServices.framework/ApplicationServices')._AXUIElementGetWindow
+    _AXUIElementGetWindow.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint32)]
+    _AXUIElementGetWindow.restype = ctypes.c_int32
+except (OSError, AttributeError):
+    _AXUIElementGetWindow = None
 
 
 def get_display_info():
@@ -29,205 +69,182 @@ def get_display_info():
     return displays
 
 
-def extract_system_wide_accessibility_tree(max_depth=None):
+class PyObjCAXProvider(AXProvider):
+    """AXProvider backed by the ApplicationServices AXUIElement API"""
+
+    def applications(self):
+        system_element = ApplicationServices.AXUIElementCreateSystemWide()
+        return ApplicationServices.AXUIElementCopyAttributeValue(
+            system_element, ApplicationServices.kAXChildrenAttribute, None
+        )
+
+    def copy_attribute(self, element, attribute):
+        return ApplicationServices.AXUIElementCopyAttributeValue(element, attribute, None)
+
+    def copy_multiple_attributes(self, element, attributes):
+        err, values = ApplicationServices.AXUIElementCopyMultipleAttributeValues(element, attributes, 0, None)
+        if err != ApplicationServices.kAXErrorSuccess or values is None:
+            return err, None
+        # Missing attributes come back as AXValues wrapping an AXError
+        return err, [None if _ax_value_type(value) == ApplicationServices.kAXValueAXErrorType else value
+                     for value in values]
+
+    def set_messaging_timeout(self, element, seconds):
+        return ApplicationServices.AXUIElementSetMessagingTimeout(element, seconds)
+
+    def pid(self, app):
+        return ApplicationServices.AXUIElementGetPid(app, None)
+
+    def window_number(self, window):
+        if _AXUIElementGetWindow is None:
+            return None
+        number = ctypes.c_uint32()
+        if _AXUIElementGetWindow(objc.pyobjc_id(window), ctypes.byref(number)) != 0:
+            return None
+        return number.value
+
+    def window_list(self):
+        windows = []
+        for info in CGWindowListCopyWindowInfo(kCGWindowListOptionOnScreenOnly, kCGNullWindowID) or []:
+            bounds = info.get(kCGWindowBounds)
+            if bounds is None:
+                continue
+            windows.append({
+                'pid': int(info.get(kCGWindowOwnerPID, 0)),
+                'number': int(info.get(kCGWindowNumber, 0)),
+                'bounds': (bounds['X'], bounds['Y'], bounds['Width'], bounds['Height']),
+                'title': info.get(kCGWindowName),
+                'layer': int(info.get(kCGWindowLayer, 0)),
+            })
+        return windows
+
+    def point(self, value):
+        # Unwrap AXValueRefs directly; fall back to the string representation
+        if _ax_value_type(value) == ApplicationServices.kAXValueCGPointType:
+            ok, value = ApplicationServices.AXValueGetValue(value, ApplicationServices.kAXValueCGPointType, None)
+        elif not (hasattr(value, 'x') and hasattr(value, 'y')):
+            value = AppKit.NSPointFromString(str(value))
+        return value.x, value.y
+
+    def size(self, value):
+        if _ax_value_type(value) == ApplicationServices.kAXValueCGSizeType:
+            ok, value = ApplicationServices.AXValueGetValue(value, ApplicationServices.kAXValueCGSizeType, None)
+        elif not (hasattr(value, 'width') and hasattr(value, 'height')):
+            value = AppKit.NSSizeFromString(str(value))
+        return value.width, value.height
+
+
+def _ax_value_type(value):
+    """AXValueType of an AXValueRef, or None for any other object"""
+    try:
+        if CFGetTypeID(value) != ApplicationServices.AXValueGetTypeID():
+            return None
+    except Exception:
+        return None
+    return ApplicationServices.AXValueGetType(value)
+
+
+AX_PROVIDER = PyObjCAXProvider()
+
+
+def extract_system_wide_accessibility_tree(max_depth=None, workers=None, app_timeout=None, report=None, fields=None,
+                                           max_nodes=None, window_cache=None, metrics=None, prune=False,
+                                           prune_stubs=False, display_filter=None):
     """
     Extract accessibility tree from the entire system without focus stealing.
     Returns accessibility data for all windows across all displays.
+
+    With workers, applications are walked concurrently; app_timeout bounds
+    each application (see ax_extractors). Per-app latency and failure
+    reasons are appended to report when given. fields limits the element
+    attributes fetched (see ax_extractors.FIELDS) and max_nodes the nodes
+    walked per window. Each window's 'tree' is already in the output schema.
+    Windows unchanged since the previous snapshot of window_cache (an
+    ax_extractors.WindowCache) are not walked again. Phases, AX calls and
+    errors are recorded into metrics (an axcore.metrics.Metrics) when given.
+    prune skips elements that are empty, off every display or hidden behind
+    other windows; prune_stubs keeps them as stubs with their child count.
+    With display_filter, only windows on that display index are walked.
     """
-    system_element = ApplicationServices.AXUIElementCreateSystemWide()
-    
-    # Get all applications
-    err, apps = ApplicationServices.AXUIElementCopyAttributeValue(
-        system_element, ApplicationServices.kAXChildrenAttribute, None
-    )
-    
-    if err != ApplicationServices.kAXErrorSuccess:
-        error_msg = f"Failed to get applications from system element. Error: {err}"
-        print(error_msg)
-        # Always raise exception for any accessibility error to trigger immediate fallback
-        raise RuntimeError(error_msg)
-    
-    if not apps:
-        error_msg = f"No applications found from system element"
-        print(error_msg)
-        raise RuntimeError(error_msg)
-    
-    all_windows_data = []
-    displays = get_display_info()
-    
-    print(f"Found {len(apps)} applications to examine")
-    print(f"Available displays: {len(displays)}")
-    
+    windows, reports = ax_extractors.extract_system_wide(AX_PROVIDER, get_display_info(), max_depth,
+                                                         workers, app_timeout, fields=fields, max_nodes=max_nodes,
+                                                         cache=window_cache, metrics=metrics, prune=prune,
+                                                         prune_stubs=prune_stubs, display_filter=display_filter)
+    if report is not None:
+        report.extend(r.report() for r in reports)
+    return windows
+
+
+def extract_element_tree_passive(element, max_depth=None, current_depth=0, fields=None):
+    """
+    Extract accessibility tree from an element without focus changes, in the
+    intermediate {'attributes', 'children'} format.
+    """
+    return ax_extractors.extract_element_tree_passive(AX_PROVIDER, element, max_depth, current_depth, fields=fields)
+
+
+def subscribe_ax_events(apps, callback):
+    """
+    Observe the notifications of ax_extractors.AX_NOTIFICATION_EVENTS on each
+    application and pass them to callback as UIEvents. Notifications are
+    delivered on the calling thread's run loop (see run_event_loop).
+    Returns the observers, which have to be kept alive.
+    """
+    def on_notification(observer, element, notification, refcon):
+        event = ax_extractors.ax_event(notification, element)
+        if event is not None:
+            callback(event)
+
+    run_loop = CFRunLoopGetCurrent()
+    observers = []
     for app in apps:
-        app_name = None  # Initialize app_name at start of loop
-        try:
-            # Get app name
-            err, app_name = ApplicationServices.AXUIElementCopyAttributeValue(
-                app, ApplicationServices.kAXTitleAttribute, None
-            )
-            if err != ApplicationServices.kAXErrorSuccess or not app_name:
-                continue
-                
-            # Skip system apps that should not be recorded
-            INVALID_APPS = ['Window Server', 'Dock', 'Spotlight', 'SystemUIServer', 
-                           'ControlCenter', 'NotificationCenter', 'Finder', 'clones']
-            if app_name in INVALID_APPS:
-                continue
-            
-            # Get windows for this app
-            err, windows = ApplicationServices.AXUIElementCopyAttributeValue(
-                app, ApplicationServices.kAXWindowsAttribute, None
-            )
-            
-            if err != ApplicationServices.kAXErrorSuccess or not windows:
-                continue
-                
-            for window in windows:
-                try:
-                    # Get window position and size
-                    err, position_value = ApplicationServices.AXUIElementCopyAttributeValue(
-                        window, ApplicationServices.kAXPositionAttribute, None
-                    )
-                    err2, size_value = ApplicationServices.AXUIElementCopyAttributeValue(
-                        window, ApplicationServices.kAXSizeAttribute, None
-                    )
-                    
-                    if (err != ApplicationServices.kAXErrorSuccess or 
-                        err2 != ApplicationServices.kAXErrorSuccess):
-                        continue
-                        
-                    # Convert to readable format 
-                    # Handle both direct values and string representations
-                    if hasattr(position_value, 'x') and hasattr(position_value, 'y'):
-                        position = position_value
-                    else:
-                        position = AppKit.NSPointFromString(str(position_value))
-                        
-                    if hasattr(size_value, 'width') and hasattr(size_value, 'height'):
-                        size = size_value
-                    else:
-                        size = AppKit.NSSizeFromString(str(size_value))
-                    
-                    # Filter out tiny windows
-                    if size.width < 100 or size.height < 100:
-                        continue
-                    
-                    # Determine which display this window is on
-                    window_display_index = 0  # Default to primary
-                    window_center_x = position.x + (size.width / 2)
-                    window_center_y = position.y + (size.height / 2)
-                    
-                    for i, display in enumerate(displays):
-                        frame = display['frame']
-                        if (frame['x'] <= window_center_x <= frame['x'] + frame['width'] and
-                            frame['y'] <= window_center_y <= frame['y'] + frame['height']):
-                            window_display_index = i
-                            break
-                    
-                    window_data = {
-                        'app_name': app_name,
-                        'display_index': window_display_index,
-                        'position': {'x': int(position.x), 'y': int(position.y)},
-                        'size': {'width': int(size.width), 'height': int(size.height)},
-                        'accessibility_tree': extract_element_tree_passive(window, max_depth)
-                    }
-                    
-                    all_windows_data.append(window_data)
-                    
-                except Exception as e:
-                    print(f"Error processing window: {e}")
-                    continue
-                    
-        except Exception as e:
-            print(f"Error processing app {app_name or 'unknown'}: {e}")
+        err, pid = AX_PROVIDER.pid(app)
+        if err != ApplicationServices.kAXErrorSuccess:
             continue
-    
-    return all_windows_data
+        err, observer = ApplicationServices.AXObserverCreate(pid, on_notification, None)
+        if err != ApplicationServices.kAXErrorSuccess:
+            print(f"Cannot observe application {pid} (AXError {err})", file=sys.stderr)
+            continue
+        for notification in ax_extractors.AX_NOTIFICATION_EVENTS:
+            ApplicationServices.AXObserverAddNotification(observer, app, notification, None)
+        CFRunLoopAddSource(run_loop, ApplicationServices.AXObserverGetRunLoopSource(observer),
+                           kCFRunLoopDefaultMode)
+        observers.append(observer)
+    return observers
 
 
-def extract_element_tree_passive(element, max_depth=None, current_depth=0):
+def watch_system_wide(fields=None, feed_size=10000, window=0.05, max_delay=0.5, max_rate=None):
     """
-    Recursively extract accessibility tree from an element without focus changes.
-    This is the core passive extraction that doesn't steal focus.
+    Mirror the windows of all applications in an axcore.events.LiveTree kept
+    current from AXObserver notifications. Notifications are queued on this
+    thread's run loop, coalesced per element (window, max_delay and max_rate
+    as in axcore.coalesce.EventCoalescer) and applied on a background thread,
+    so run_event_loop has to run on this thread meanwhile.
+
+    Returns (live tree, coalescer, stop callable).
     """
-    if max_depth is not None and current_depth >= max_depth:
-        return None
-        
-    try:
-        # Get basic attributes without focus changes
-        attributes = {}
-        
-        # Get role
-        err, role = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXRoleAttribute, None
-        )
-        if err == ApplicationServices.kAXErrorSuccess and role:
-            attributes['role'] = str(role)
-        
-        # Get title/name
-        err, title = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXTitleAttribute, None
-        )
-        if err == ApplicationServices.kAXErrorSuccess and title:
-            attributes['title'] = str(title)
-            
-        # Get value
-        err, value = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXValueAttribute, None
-        )
-        if err == ApplicationServices.kAXErrorSuccess and value:
-            attributes['value'] = str(value)
-            
-        # Get description
-        err, description = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXDescriptionAttribute, None
-        )
-        if err == ApplicationServices.kAXErrorSuccess and description:
-            attributes['description'] = str(description)
-            
-        # Get position and size if available
-        err, position = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXPositionAttribute, None
-        )
-        err2, size = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXSizeAttribute, None
-        )
-        
-        if (err == ApplicationServices.kAXErrorSuccess and position and
-            err2 == ApplicationServices.kAXErrorSuccess and size):
-            # Handle both direct values and string representations
-            if hasattr(position, 'x') and hasattr(position, 'y'):
-                pos = position
-            else:
-                pos = AppKit.NSPointFromString(str(position))
-                
-            if hasattr(size, 'width') and hasattr(size, 'height'):
-                sz = size
-            else:
-                sz = AppKit.NSSizeFromString(str(size))
-                
-            attributes['bbox'] = {
-                'x': int(pos.x), 'y': int(pos.y),
-                'width': int(sz.width), 'height': int(sz.height)
-            }
-        
-        # Get children
-        children_data = []
-        err, children = ApplicationServices.AXUIElementCopyAttributeValue(
-            element, ApplicationServices.kAXChildrenAttribute, None
-        )
-        
-        if err == ApplicationServices.kAXErrorSuccess and children:
-            for child in children:
-                child_data = extract_element_tree_passive(child, max_depth, current_depth + 1)
-                if child_data:
-                    children_data.append(child_data)
-        
-        return {
-            'attributes': attributes,
-            'children': children_data
-        }
-        
-    except Exception as e:
-        print(f"Error extracting element: {e}")
-        return None
\ No newline at end of file
+    err, apps = AX_PROVIDER.applications()
+    if err != ApplicationServices.kAXErrorSuccess or not apps:
+        raise RuntimeError(f"Failed to get applications from system element. Error: {err}")
+    apps = list(apps)
+
+    def windows():
+        err, current = AX_PROVIDER.applications()
+        return ax_extractors.application_windows(AX_PROVIDER, list(current or apps))
+
+    live = LiveTree(ax_extractors.AXTreeProvider(AX_PROVIDER, fields), windows, feed_size)
+    live.load()
+    coalescer = EventCoalescer(live, window, max_delay, max_rate)
+    observers = subscribe_ax_events(apps, coalescer.put)
+    coalescer.start()
+
+    def stop():
+        observers.clear()
+        coalescer.stop()
+    return live, coalescer, stop
+
+
+def run_event_loop(running, interval=0.25):
+    """Run this thread's run loop, delivering AX notifications, while running() is true"""
+    while running():
+        CFRunLoopRunInMode(kCFRunLoopDefaultMode, interval, False)
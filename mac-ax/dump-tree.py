@@ -1,8 +1,22 @@
-import json
 import argparse
+import os
+import sys
+import threading
 import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from axcore.columnar import save_columns, to_columns
+from axcore.compact import write_compact
+from axcore.jsonstream import COMPACT_SEPARATORS, write_json
+from axcore.metrics import Metrics, profiled, write_metrics
+from axcore.patch import EventLogWriter
+from axcore.serve import serve
+from axcore.store import SnapshotStore
 from macapptree import get_app_bundle, get_tree
-from custom_extractors import extract_system_wide_accessibility_tree
+from ax_extractors import FIELDS, DisplayIndex, WindowCache, parse_fields
+from custom_extractors import (extract_system_wide_accessibility_tree, get_display_info, run_event_loop,
+                               watch_system_wide)
 
 def get_tree_with_display_info(bundle, max_depth=None):
     """Wrapper around get_tree for consistency with the rest of the codebase"""
@@ -16,7 +30,16 @@ from Quartz import (
     kCGWindowBounds
 )
 
-def get_accessibility_tree_passive(max_depth=None, display_filter=None):
+def fields_argument(text):
+    """argparse type for --fields"""
+    try:
+        return parse_fields(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def get_accessibility_tree_passive(max_depth=None, display_filter=None, workers=None, app_timeout=None, report=None,
+                                   fields=None, max_nodes=None, window_cache=None, metrics=None, prune=False,
+                                   prune_stubs=False):
     """
     Get accessibility tree using passive extraction without focus stealing.
     Supports filtering by specific display for recording purposes.
@@ -24,17 +47,25 @@ def get_accessibility_tree_passive(max_depth=None, display_filter=None):
     Args:
         max_depth: Maximum depth for tree traversal
         display_filter: Only capture applications on this display (None = all displays)
+        workers: Walk applications concurrently on this many threads (None = sequentially)
+        app_timeout: Per-application deadline in seconds
+        report: List to which per-application latency and failure reports are appended
+        fields: Element fields to fetch (default: all of ax_extractors.FIELDS)
+        max_nodes: Node budget of each window
+        window_cache: WindowCache reusing the trees of unchanged windows
+        metrics: axcore.metrics.Metrics recording phases, AX calls and errors
+        prune: Skip elements that are empty, off every display or hidden behind other windows
+        prune_stubs: Like prune, but keep skipped elements as stubs with their child count
     """
     try:
-        all_windows = extract_system_wide_accessibility_tree(max_depth)
+        all_windows = extract_system_wide_accessibility_tree(max_depth, workers, app_timeout, report, fields,
+                                                             max_nodes, window_cache, metrics, prune, prune_stubs,
+                                                             display_filter)
         
         # Group windows by application
         apps_data = {}
         for window_data in all_windows:
-            # Filter by display if specified
-            if display_filter is not None and window_data['display_index'] != display_filter:
-                continue
-                
+            # Windows on other displays were not walked (see ax_extractors.DisplayIndex)
             app_name = window_data['app_name']
             if app_name not in apps_data:
                 apps_data[app_name] = {
@@ -60,8 +91,10 @@ def get_accessibility_tree_passive(max_depth=None, display_filter=None):
                     'height': window_data['size']['height']
                 },
                 'display_index': window_data['display_index'],
-                'children': convert_passive_tree_to_legacy_format(window_data['accessibility_tree'])
+                'children': window_data['tree']
             }
+            if window_data.get('truncated'):
+                window_node['truncated'] = True
             
             apps_data[app_name]['children'].append(window_node)
             apps_data[app_name]['displays'].add(window_data['display_index'])
@@ -84,45 +117,52 @@ def get_accessibility_tree_passive(max_depth=None, display_filter=None):
         return result
         
     except Exception as e:
-        print(f"Error in passive accessibility extraction: {e}")
+        print(f"Error in passive accessibility extraction: {e}", file=sys.stderr)
+        if metrics is not None:
+            metrics.error(e)
         # Fallback to legacy method if passive fails
-        return get_accessibility_tree_legacy(display_filter)
+        return get_accessibility_tree_legacy(display_filter, metrics)
 
-def convert_passive_tree_to_legacy_format(passive_tree):
-    """Convert passive tree format to legacy format for compatibility"""
-    if not passive_tree or 'attributes' not in passive_tree:
-        return []
-    
-    attrs = passive_tree['attributes']
-    children = passive_tree.get('children', [])
-    
-    # Convert to legacy format
-    legacy_node = {
-        'role': attrs.get('role', ''),
-        'name': attrs.get('title', ''),
-        'description': attrs.get('description', ''),
-        'value': attrs.get('value', ''),
-        'bbox': attrs.get('bbox', {'x': 0, 'y': 0, 'width': 0, 'height': 0}),
-        'children': [convert_passive_tree_to_legacy_format(child) for child in children]
-    }
-    
-    return [legacy_node] if legacy_node['role'] else []
+def watch_accessibility_tree(fields=None, window=0.05, max_delay=0.5, max_rate=None):
+    """
+    Mirror all windows from AXObserver notifications and answer live (current
+    tree), changes (change feed since a sequence number) and watch_stats
+    requests as JSON lines on stdin/stdout (see axcore/serve.py) until EOF.
+    Notifications are coalesced per element (see axcore/coalesce.py).
+    """
+    live, coalescer, stop = watch_system_wide(fields, window=window, max_delay=max_delay, max_rate=max_rate)
+    handlers = {"live": live.snapshot, "changes": live.changes,
+                "watch_stats": lambda: dict(live.stats(), events=coalescer.stats())}
+    # AX notifications are delivered on the main thread's run loop
+    server = threading.Thread(target=serve, args=(handlers,), daemon=True)
+    server.start()
+    try:
+        run_event_loop(server.is_alive)
+    finally:
+        stop()
 
-def get_accessibility_tree_legacy(display_filter=None):
+def get_accessibility_tree_legacy(display_filter=None, metrics=None):
     """Legacy method using CGWindowList (fallback) - NO hit-testing
     
     Args:
         display_filter: Only capture applications on this display (None = all displays)
+        metrics: axcore.metrics.Metrics timing the legacy_enumerate and legacy_group phases
     """
-    print(f"[Legacy] Starting CGWindowList extraction at {time.time()}")
+    metrics = metrics if metrics is not None else Metrics()
     # Reduced filter list - only system components that should never be recorded
     INVALID_WINDOWS=['Window Server', 'Dock', 'Spotlight', 'SystemUIServer', 'ControlCenter', 'NotificationCenter']
     
     options = kCGWindowListOptionOnScreenOnly
-    print(f"[Legacy] Getting window list at {time.time()}")
-    windowList = CGWindowListCopyWindowInfo(options, kCGNullWindowID)
-    print(f"[Legacy] Got {len(windowList) if windowList else 0} windows at {time.time()}")
+    with metrics.phase('legacy_enumerate'):
+        windowList = CGWindowListCopyWindowInfo(options, kCGNullWindowID)
+        displays = DisplayIndex(get_display_info())
+    print(f"[Legacy] Got {len(windowList) if windowList else 0} windows", file=sys.stderr)
     
+    with metrics.phase('legacy_group'):
+        return _group_legacy_windows(windowList, display_filter, INVALID_WINDOWS, displays)
+
+def _group_legacy_windows(windowList, display_filter, invalid_windows, displays):
+    """Group CGWindowList entries into application nodes with window children (displays: a DisplayIndex)"""
     app_windows = {}
     
     for window in windowList:
@@ -135,11 +175,11 @@ def get_accessibility_tree_legacy(display_filter=None):
             elif key == kCGWindowBounds:
                 bounds = value
         
-        if app_name and bounds and app_name not in INVALID_WINDOWS:
+        if app_name and bounds and app_name not in invalid_windows:
             # Filter out tiny windows (likely system UI elements)
             if bounds["Width"] > 100 and bounds["Height"] > 100:
-                # Determine display
-                display_index = 0 if bounds['Y'] >= 0 else 1
+                # Display the window overlaps most
+                display_index = displays.index_of((bounds['X'], bounds['Y']), (bounds['Width'], bounds['Height']))
                 
                 # Filter by display if specified
                 if display_filter is not None and display_index != display_filter:
@@ -185,73 +225,139 @@ def get_accessibility_tree_legacy(display_filter=None):
             'children': windows
         })
     
-    print(f"[Legacy] Completed CGWindowList extraction at {time.time()}")
     return out
 
 def get_accessibility_tree(display_filter=None):
     """Main accessibility tree function - chooses passive or legacy based on args"""
     return get_accessibility_tree_legacy(display_filter)  # Default to legacy for backward compatibility
 
-def main():
-    parser = argparse.ArgumentParser(description='Extract accessibility tree from macOS applications')
-    parser.add_argument('-o', '--out', help='Output file path (defaults to stdout)')
-    parser.add_argument('-e', '--event', help='Output in event format with timing data', action='store_true')
-    parser.add_argument('--recording-display', type=int, help='Display index being used for recording (0=primary)', default=None)
-    parser.add_argument('--display-index', type=int, help='Only capture applications on specified display (0=primary)', default=None)
-    parser.add_argument('--no-focus-steal', action='store_true', help='Use no-focus-steal mode to avoid disrupting user during recording')
-    parser.add_argument('--low-frequency', action='store_true', help='Reduce polling frequency to 60s intervals for recording mode')
-    args = parser.parse_args()
-    
-    # Add delay for low-frequency mode
-    if args.low_frequency:
-        print("Low-frequency mode: This capture is for recording context (60s intervals recommended)")
-        # This is just a single capture, but signals the calling system to use 60s intervals
-
-    start_time = int(time.time() * 1000)  # JS equivalent of timestamp_millis
-    
+def take_snapshot(args, start_time, metrics):
+    """Extract the tree as chosen by args; returns the tree or the event (-e, --patch-log)"""
     # Determine display filter (use recording-display if specified, otherwise display-index)
     display_filter = args.display_index if args.display_index is not None else args.recording_display
     
     # Choose extraction method based on arguments
+    apps_report = None
+    window_cache = None
     if args.no_focus_steal:
-        print("Using no-focus-steal passive extraction mode")
-        print(f"Starting passive extraction at {time.time()}")
+        print("Using no-focus-steal passive extraction mode", file=sys.stderr)
+        apps_report = []
+        window_cache = WindowCache(args.window_cache, args.window_cache_max_age) if args.window_cache else None
         try:
-            tree = get_accessibility_tree_passive(max_depth=10, display_filter=display_filter)
-            print(f"Passive extraction completed at {time.time()}")
+            tree = get_accessibility_tree_passive(max_depth=10, display_filter=display_filter, workers=args.workers,
+                                                  app_timeout=args.app_timeout, report=apps_report, fields=args.fields,
+                                                  max_nodes=args.max_nodes, window_cache=window_cache,
+                                                  metrics=metrics, prune=args.prune, prune_stubs=args.prune_stubs)
+            if window_cache is not None:
+                window_cache.save()
         except Exception as e:
-            print(f"Passive extraction failed at {time.time()}: {e}")
-            print(f"Starting legacy fallback at {time.time()}")
-            tree = get_accessibility_tree_legacy(display_filter=display_filter)
-            print(f"Legacy fallback completed at {time.time()}")
-            print(f"Legacy returned {len(tree)} applications")
+            print(f"Passive extraction failed: {e}", file=sys.stderr)
+            metrics.error(e)
+            tree = get_accessibility_tree_legacy(display_filter=display_filter, metrics=metrics)
+            print(f"Legacy returned {len(tree)} applications", file=sys.stderr)
     else:
-        tree = get_accessibility_tree_legacy(display_filter=display_filter)
+        tree = get_accessibility_tree_legacy(display_filter=display_filter, metrics=metrics)
     
     end_time = int(time.time() * 1000)
     duration = end_time - start_time
 
-    if args.event:
+    if args.event or args.patch_log:
         output = {
             "time": start_time,
             "data": {
                 "duration": duration,
-                "tree": tree
+                "tree": tree,
+                "metrics": metrics.as_dict()
             }
         }
-    else:
-        output = tree
+        if apps_report:
+            output["data"]["apps"] = apps_report
+        if window_cache is not None:
+            output["data"]["window_cache"] = window_cache.report()
+        return output
+    return tree
 
-    json_output = json.dumps(output)
+def write_snapshot(args, output, metrics, start_time):
+    """Write output in the format chosen by args, timing the serialize and write phases"""
+    if args.patch_log:
+        with metrics.phase('write'):
+            EventLogWriter(args.patch_log, args.keyframe_interval).write(output)
+        return
+    if args.store:
+        with metrics.phase('write'), SnapshotStore(args.store) as store:
+            store.add(output, start_time)
+        return
 
-    if args.out:
-        with open(args.out, 'w') as f:
-            f.write(json_output)
-    else:
-        print(json_output)
+    with metrics.phase('serialize'):
+        if args.format == 'npz':
+            columns = to_columns(output)
+            with metrics.phase('write'):
+                save_columns(args.out or sys.stdout.buffer, columns)
+        elif args.format == 'compact':
+            if args.out:
+                with open(args.out, 'wb') as f:
+                    write_compact(output, metrics.timed_call('write', f.write))
+            else:
+                write_compact(output, metrics.timed_call('write', sys.stdout.buffer.write))
+                sys.stdout.buffer.flush()
+        else:
+            options = dict(ensure_ascii=False, separators=COMPACT_SEPARATORS) if args.utf8 else {}
+            if args.out:
+                with open(args.out, 'w', encoding='utf-8') as f:
+                    write_json(output, metrics.timed_call('write', f.write), **options)
+            else:
+                write_json(output, metrics.timed_call('write', sys.stdout.write), **options)
+                sys.stdout.write('\n')
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract accessibility tree from macOS applications')
+    parser.add_argument('-o', '--out', help='Output file path (defaults to stdout)')
+    parser.add_argument('-e', '--event', help='Output in event format with timing data', action='store_true')
+    parser.add_argument('--recording-display', type=int, help='Display index being used for recording (0=primary)', default=None)
+    parser.add_argument('--display-index', type=int, help='Only capture applications on specified display (0=primary)', default=None)
+    parser.add_argument('--no-focus-steal', action='store_true', help='Use no-focus-steal mode to avoid disrupting user during recording')
+    parser.add_argument('--low-frequency', action='store_true', help='Reduce polling frequency to 60s intervals for recording mode')
+    parser.add_argument('-w', '--workers', type=int, help='With --no-focus-steal, walk applications concurrently on N threads', default=None)
+    parser.add_argument('--app-timeout', type=float, help='With --no-focus-steal, per-application deadline in seconds; hung apps are skipped and reported', default=None)
+    parser.add_argument('--fields', type=fields_argument, help=f"With --no-focus-steal, comma-separated element fields to fetch (default: {','.join(FIELDS)}; role is always fetched)", default=None)
+    parser.add_argument('--max-nodes', type=int, help='With --no-focus-steal, node budget of each window; larger windows are truncated', default=None)
+    parser.add_argument('--window-cache', help='With --no-focus-steal, JSON file keeping window trees between runs; windows whose CGWindowList entry is unchanged are not walked again', default=None)
+    parser.add_argument('--window-cache-max-age', type=int, help='With --window-cache, walk every window again after N snapshots even if CGWindowList reports it unchanged (default: 3)', default=3)
+    parser.add_argument('--prune', action='store_true', help='With --no-focus-steal, skip elements with empty bounds, off every display or hidden behind other windows (and their subtrees)')
+    parser.add_argument('--prune-stubs', action='store_true', help='Like --prune, but keep skipped elements as stubs with "pruned" and "child_count"')
+    parser.add_argument('--watch', action='store_true', help='Stay resident, mirror all windows from AXObserver notifications and answer live/changes requests as JSON lines on stdin (honours --fields)')
+    parser.add_argument('--event-window', type=float, help='With --watch, seconds an element must be quiet before its notifications are applied (default: 0.05)', default=0.05)
+    parser.add_argument('--event-max-delay', type=float, help='With --watch, apply a continuously changing element at least every N seconds (default: 0.5)', default=0.5)
+    parser.add_argument('--event-rate', type=float, help='With --watch, maximum coalesced element updates applied per second (default: unlimited)', default=None)
+    parser.add_argument('--format', choices=['json', 'compact', 'npz'], help='Output format: json (default), compact binary (see axcore/compact.py) or npz columns (see axcore/columnar.py)', default='json')
+    parser.add_argument('--utf8', action='store_true', help='Write JSON as compact UTF-8 (no escapes for non-ASCII text, no whitespace) instead of ASCII-only')
+    parser.add_argument('--patch-log', help='Append the event to this keyframe/delta log instead of printing it', default=None)
+    parser.add_argument('--store', help='Archive the snapshot in this SQLite store, sharing identical subtrees with the snapshots already in it (see axcore/store.py), instead of printing it', default=None)
+    parser.add_argument('--keyframe-interval', type=int, help='Write a full keyframe to --patch-log at least every N events (default: 60)', default=60)
+    parser.add_argument('--metrics', help='Append per-phase timings, per-window node counts, AX calls per attribute and error counts of the snapshot to this JSON-lines file', default=None)
+    parser.add_argument('--profile', help='Profile the snapshot into this file: cProfile stats for a .prof path, sampled collapsed stacks of all threads otherwise', default=None)
+    parser.add_argument('--profile-interval', type=float, help='Seconds between stack samples for --profile (default: 0.005)', default=0.005)
+    args = parser.parse_args()
     
+    if args.watch:
+        watch_accessibility_tree(args.fields, args.event_window, args.event_max_delay, args.event_rate)
+        return
+
+    # Add delay for low-frequency mode
+    if args.low_frequency:
+        print("Low-frequency mode: This capture is for recording context (60s intervals recommended)", file=sys.stderr)
+        # This is just a single capture, but signals the calling system to use 60s intervals
+
+    start_time = int(time.time() * 1000)  # JS equivalent of timestamp_millis
+    metrics = Metrics()
+    with profiled(args.profile, args.profile_interval):
+        output = take_snapshot(args, start_time, metrics)
+        write_snapshot(args, output, metrics, start_time)
+    if args.metrics:
+        write_metrics(args.metrics, {"time": start_time, "duration": int(time.time() * 1000) - start_time,
+                                     **metrics.as_dict()})
+
     # Force immediate exit to prevent hanging
-    import sys
     sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+import time
+
+import pytest
+
+from ax_extractors import (AXTreeProvider, DisplayIndex, WindowCache, application_windows, ax_event, display_index_of,
+                           extract_applications, extract_element_tree_passive, extract_system_wide, parse_fields,
+                           screen_layout, walk_passive)
+from axcore.events import LiveTree
+from axcore.fake import FakeAXApp, FakeAXElement, FakeAXProvider, build_fake_ax_window
+from axcore.metrics import Metrics
+from axcore.walker import WalkStats
+
+DISPLAYS = [{'frame': {'x': 0, 'y': 0, 'width': 1440, 'height': 900}},
+            {'frame': {'x': 1440, 'y': 0, 'width': 1920, 'height': 1080}}]
+
+
+def make_apps():
+    return [
+        FakeAXApp('Slow Editor', [build_fake_ax_window(3, 2)], latency=0.005),
+        FakeAXApp('Dock', [build_fake_ax_window(2, 2)]),
+        FakeAXApp('Browser', [build_fake_ax_window(3, 3, position=(1500, 100)), build_fake_ax_window(1, 0)]),
+        FakeAXApp('Menu Extra'),
+        FakeAXElement(role='AXApplication'),
+        FakeAXApp('Terminal', [build_fake_ax_window(2, 4, size=(50, 50)), build_fake_ax_window(2, 1)]),
+    ]
+
+
+def summary(windows):
+    return [(w['app_name'], w['display_index'], w['tree'][0]['name'], len(w['tree'][0]['children']))
+            for w in windows]
+
+
+def test_concurrent_merge_matches_sequential_order():
+    sequential, seq_reports = extract_applications(FakeAXProvider(make_apps()), make_apps(), DISPLAYS, max_depth=10)
+    apps = make_apps()
+    concurrent, reports = extract_applications(FakeAXProvider(apps), apps, DISPLAYS, max_depth=10, workers=4)
+
+    # The slow first app finishes last but is still merged first
+    assert summary(concurrent) == summary(sequential) == [
+        ('Slow Editor', 0, 'window', 2), ('Browser', 1, 'window', 3), ('Browser', 0, 'window', 0),
+        ('Terminal', 0, 'window', 1)]
+    assert [r.report()['status'] for r in reports] == ['ok', 'skipped', 'ok', 'skipped', 'skipped', 'ok']
+    assert [r.reason for r in reports] == [None, 'excluded system app', None, 'no windows', 'no title', None]
+    assert [(r.app_name, r.windows, r.nodes) for r in reports] == [(r.app_name, r.windows, r.nodes) for r in seq_reports]
+    assert reports[0].nodes == 7 and reports[0].elapsed > reports[2].elapsed
+
+
+def test_hung_app_is_abandoned_and_slow_app_truncated():
+    apps = [
+        FakeAXApp('Hung', [build_fake_ax_window(2, 2)], hang=True),
+        FakeAXApp('Sluggish', [build_fake_ax_window(4, 3)], latency=0.02),
+        FakeAXApp('Unresponsive', [build_fake_ax_window(2, 2)], latency=5),
+        FakeAXApp('Healthy', [build_fake_ax_window(3, 3)]),
+    ]
+    provider = FakeAXProvider(apps)
+    start = time.monotonic()
+    try:
+        windows, reports = extract_applications(provider, apps, DISPLAYS, workers=2, app_timeout=0.2,
+                                                messaging_timeout=0.1)
+    finally:
+        provider.release()
+    assert time.monotonic() - start < 2
+
+    hung, sluggish, unresponsive, healthy = [r.report() for r in reports]
+    assert hung['status'] == 'timeout' and hung['reason'] == 'no response within 0.3s'
+    assert hung['elapsed_ms'] >= 300 and hung['windows'] == 0
+    assert sluggish['status'] == 'truncated' and 0 < sluggish['nodes'] < 40
+    assert unresponsive['status'] == 'skipped' and unresponsive['reason'] == 'no title (AXError -25204)'
+    assert healthy['status'] == 'ok' and healthy['nodes'] == 13
+    assert [(w['app_name'], w.get('truncated', False)) for w in windows] == [('Sluggish', True), ('Healthy', False)]
+
+
+def test_system_wide_errors_trigger_fallback():
+    with pytest.raises(RuntimeError, match='Error: -25211'):
+        extract_system_wide(FakeAXProvider([], error=-25211), DISPLAYS)
+    with pytest.raises(RuntimeError, match='No applications'):
+        extract_system_wide(FakeAXProvider([]), DISPLAYS)
+
+
+def test_batched_fetch_makes_one_round_trip_per_element_and_honours_fields():
+    apps = [FakeAXApp('Browser', [build_fake_ax_window(3, 3)])]
+    per_attribute = FakeAXProvider(apps, batched=False)
+    legacy, _ = extract_applications(per_attribute, apps, DISPLAYS)
+    batched = FakeAXProvider(apps)
+    windows, reports = extract_applications(batched, apps, DISPLAYS)
+
+    assert windows == legacy
+    assert {k: v for k, v in windows[0]['tree'][0].items() if k != 'children'} == {
+        'role': 'AXWindow', 'name': 'window', 'description': '', 'value': '',
+        'bbox': {'x': 0, 'y': 0, 'width': 800, 'height': 600}}
+    # Title and windows of the app, position+size of the window, then one fetch per element
+    assert batched.calls == {'AXTitle': 1, 'AXWindows': 1, 'multiple': 1 + reports[0].nodes}
+    assert sum(per_attribute.calls.values()) == 2 + 2 + 7 * reports[0].nodes
+
+    trimmed = FakeAXProvider(apps, batched=False)
+    windows, _ = extract_applications(trimmed, apps, DISPLAYS, fields=parse_fields('title'))
+    assert windows[0]['tree'][0]['bbox'] == {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+    assert sum(trimmed.calls.values()) == 2 + 2 + 3 * reports[0].nodes
+    with pytest.raises(ValueError, match='Unknown fields: name'):
+        parse_fields('name,bbox')
+
+
+def reference_legacy(provider, element, max_depth, depth=0):
+    """The former two-pass conversion: intermediate passive tree, then legacy nodes"""
+    if max_depth is not None and depth >= max_depth:
+        return []
+    err, values = provider.copy_multiple_attributes(element, ('AXRole', 'AXTitle', 'AXChildren'))
+    role, title, children = values
+    nodes = [n for child in children or [] for n in reference_legacy(provider, child, max_depth, depth + 1)]
+    if not role:
+        return []
+    return [{'role': role, 'name': title or '', 'description': '', 'value': '',
+             'bbox': {'x': 0, 'y': 0, 'width': 0, 'height': 0}, 'children': nodes}]
+
+
+def deep_chain(depth):
+    element = None
+    for level in reversed(range(depth)):
+        element = FakeAXElement(role='AXGroup', title=f"level {level}", children=[element] if element else [])
+    return element
+
+
+def test_iterative_walk_emits_legacy_nodes_in_order():
+    window = build_fake_ax_window(4, 3)
+    window.attributes['AXChildren'][1].attributes['AXRole'] = None  # dropped with its subtree
+    provider = FakeAXProvider([FakeAXApp('App', [window])])
+    fields = parse_fields('title')
+
+    for max_depth in (None, 3, 1, 0):
+        assert walk_passive(provider, window, max_depth=max_depth, fields=fields) == \
+            reference_legacy(provider, window, max_depth)
+
+    passive = extract_element_tree_passive(provider, window, max_depth=2, fields=fields)
+    assert passive['attributes'] == {'role': 'AXWindow', 'title': 'window'}
+    assert [c['attributes'].get('title') for c in passive['children']] == ['window.0', 'window.1', 'window.2']
+
+
+def test_iterative_walk_handles_10k_deep_trees_with_budgets():
+    root = deep_chain(10000)
+    provider = FakeAXProvider([])
+    stats = WalkStats()
+    [node] = walk_passive(provider, root, stats=stats)
+    depth = 0
+    while node['children']:
+        [node] = node['children']
+        depth += 1
+    assert depth == 9999 and node['name'] == 'level 9999'
+    assert stats.nodes == 10000 and not stats.truncated
+
+    stats = WalkStats()
+    [node] = walk_passive(provider, root, max_nodes=100, stats=stats)
+    assert stats.truncated and stats.nodes == 100
+
+    stats = WalkStats()
+    walk_passive(provider, root, max_depth=50, stats=stats)
+    assert stats.nodes == 50 and not stats.truncated
+
+
+def test_window_cache_skips_unchanged_windows(tmp_path):
+    editor, terminal = build_fake_ax_window(3, 3, title='window'), build_fake_ax_window(3, 2, title='window')
+    apps = [FakeAXApp('Editor', [editor]), FakeAXApp('Terminal', [terminal])]
+    provider = FakeAXProvider(apps)
+    path = str(tmp_path / 'windows.json')
+    cache = WindowCache(path, max_age=3)
+
+    first, reports = extract_system_wide(provider, DISPLAYS, cache=cache)
+    assert cache.report() == {'hits': 0, 'misses': 2, 'entries': 2}
+    cache.save()
+
+    # A new process picks up the saved trees; nothing is walked again
+    cache = WindowCache(path, max_age=3)
+    provider.calls.clear()
+    second, reports = extract_system_wide(provider, DISPLAYS, cache=cache, workers=2)
+    assert second == first
+    assert cache.report() == {'hits': 2, 'misses': 0, 'entries': 2}
+    assert [r.report()['reused'] for r in reports] == [1, 1]
+    assert provider.calls['multiple'] == 2  # window position/size only
+
+    # Retitled windows and AX notifications force a re-walk
+    terminal.attributes['AXTitle'] = 'renamed'
+    cache.invalidate(apps[0].pid)
+    third, _ = extract_system_wide(provider, DISPLAYS, cache=cache)
+    assert cache.report()['misses'] == 2 and third[1]['tree'][0]['name'] == 'renamed'
+
+    # Closed windows are dropped; entries expire after max_age snapshots
+    apps[1].attributes['AXWindows'] = []
+    extract_system_wide(provider, DISPLAYS, cache=cache)
+    assert cache.report() == {'hits': 1, 'misses': 0, 'entries': 1}
+    extract_system_wide(provider, DISPLAYS, cache=cache)
+    extract_system_wide(provider, DISPLAYS, cache=cache)
+    assert cache.report() == {'hits': 0, 'misses': 1, 'entries': 1}
+
+
+def test_window_cache_matches_windows_by_bounds_without_numbers():
+    cache = WindowCache()
+    cache.begin([{'pid': 7, 'number': 1, 'bounds': (0, 0, 800, 600), 'title': None, 'layer': 0},
+                 {'pid': 7, 'number': 2, 'bounds': (10, 10, 300, 200), 'title': None, 'layer': 0},
+                 {'pid': 7, 'number': 3, 'bounds': (10, 10, 300, 200), 'title': None, 'layer': 0}])
+    assert cache.key(7, None, (0.4, 0), (800, 600)) == (7, 1)
+    assert cache.key(7, None, (10, 10), (300, 200)) is None  # ambiguous
+    assert cache.key(8, None, (0, 0), (800, 600)) is None
+    assert cache.key(7, 4, (0, 0), (800, 600)) is None
+
+
+def test_live_tree_follows_ax_notifications():
+    editor = build_fake_ax_window(3, 2)
+    apps = [FakeAXApp('Editor', [editor]), FakeAXApp('Dock', [build_fake_ax_window(2, 2)])]
+    provider = FakeAXProvider(apps)
+    live = LiveTree(AXTreeProvider(provider), lambda: application_windows(provider, apps))
+    assert live.load() == 7
+    assert live.snapshot()['tree'] == walk_passive(provider, editor)
+
+    # Value changes re-read the element alone, in one round-trip
+    field = editor.attributes['AXChildren'][1]
+    field.attributes['AXValue'] = 'typed'
+    provider.calls.clear()
+    [change] = live.apply(ax_event('AXValueChanged', field))
+    assert (change['path'], change['attrs']) == ([0, 1], {'value': 'typed'})
+    assert provider.calls == {'multiple': 1}
+
+    # Destroyed elements no longer read (no role) and are dropped
+    destroyed = editor.attributes['AXChildren'].pop(0)
+    destroyed.attributes['AXRole'] = None
+    [change] = live.apply(ax_event('AXUIElementDestroyed', destroyed))
+    assert (change['op'], change['path']) == ('remove', [0, 0])
+
+    # New windows have no mirrored ancestor: the window list is re-read
+    dialog = build_fake_ax_window(2, 1, title='window')
+    apps[0].attributes['AXWindows'].append(dialog)
+    [change] = live.apply(ax_event('AXWindowCreated', dialog))
+    assert (change['op'], change['path']) == ('add', [1])
+    assert ax_event('AXSelectedTextChanged', dialog) is None
+    assert live.snapshot()['tree'] == walk_passive(provider, editor) + walk_passive(provider, dialog)
+
+
+def test_metrics_count_ax_calls_windows_and_errors():
+    metrics = Metrics()
+    windows, reports = extract_system_wide(FakeAXProvider(make_apps()), DISPLAYS, max_depth=10, metrics=metrics)
+
+    result = metrics.as_dict()
+    assert list(result['phases']) == ['enumerate', 'walk']
+    assert result['windows'] == {'Slow Editor #1': 7, 'Browser #1': 13, 'Browser #2': 1, 'Terminal #1': 2}
+    assert result['calls']['AXTitle']['calls'] == 6 and result['calls']['applications']['calls'] == 1
+    assert result['calls']['copy_multiple_attributes']['calls'] >= sum(r.nodes for r in reports)
+    assert result['errors'] == {}
+
+    metrics = Metrics()
+    with pytest.raises(RuntimeError):
+        extract_system_wide(FakeAXProvider(make_apps(), error=-25204), DISPLAYS, metrics=metrics)
+    assert metrics.errors == {'AXError -25204': 1}
+
+
+def test_windows_behind_other_windows_are_pruned():
+    apps = [FakeAXApp('Editor', [build_fake_ax_window(3, 2, size=(800, 600))]),
+            FakeAXApp('Notes', [build_fake_ax_window(3, 2, position=(100, 100), size=(300, 300)),
+                                build_fake_ax_window(3, 2, position=(3400, 100), size=(300, 300))])]
+    provider = FakeAXProvider(apps)
+
+    windows, reports = extract_applications(provider, apps, DISPLAYS,
+                                            layout=screen_layout(DISPLAYS, provider.window_list()))
+    assert [len(w['tree']) for w in windows] == [1, 0, 0]
+    assert [r.report()['pruned'] for r in reports] == [0, 2]
+
+    windows, _ = extract_applications(provider, apps, DISPLAYS,
+                                      layout=screen_layout(DISPLAYS, provider.window_list(), stubs=True))
+    assert [(w['tree'][0].get('pruned'), w['tree'][0].get('child_count')) for w in windows] == [
+        (None, None), ('occluded', 2), ('offscreen', 2)]
+
+
+# Laptop on the left, primary in the middle, a portrait display to the right raised above the primary's top
+THREE_DISPLAYS = [{'frame': {'x': 0, 'y': 0, 'width': 2560, 'height': 1440}},
+                  {'frame': {'x': -1512, 'y': 400, 'width': 1512, 'height': 982}},
+                  {'frame': {'x': 2560, 'y': -600, 'width': 1080, 'height': 1920}}]
+
+
+@pytest.mark.parametrize('position,size,expected', [
+    ((100, 100), (800, 600), 0),
+    ((-1400, 500), (800, 600), 1),
+    ((2600, -500), (800, 600), 2),      # above the primary: y < 0 is not "the other display"
+    ((-300, 600), (800, 600), 0),       # straddling: mostly on the primary
+    ((-700, 600), (800, 600), 1),
+    ((2200, 100), (800, 1400), 2),
+    ((5000, 5000), (800, 600), 0),      # on no display
+])
+def test_windows_go_to_the_display_they_overlap_most(position, size, expected):
+    assert display_index_of(position, size, THREE_DISPLAYS) == expected
+    assert DisplayIndex(THREE_DISPLAYS).index_of(position, size) == expected
+
+
+def test_display_filter_skips_other_displays_before_walking():
+    def make():
+        return [FakeAXApp('Editor', [build_fake_ax_window(3, 3, position=(100, 100))]),
+                FakeAXApp('Chat', [build_fake_ax_window(3, 3, position=(-1400, 500)),
+                                   build_fake_ax_window(3, 3, position=(2600, 0))]),
+                FakeAXApp('Mail', [build_fake_ax_window(3, 3, position=(2600, 200))])]
+    apps = make()
+    provider = FakeAXProvider(apps)
+    windows, reports = extract_system_wide(provider, THREE_DISPLAYS, display_filter=2)
+
+    assert [(w['app_name'], w['display_index']) for w in windows] == [('Chat', 2), ('Mail', 2)]
+    assert reports[0].report()['reason'] == 'no windows on display 2'
+    only_display = make()[1:]
+    alone = FakeAXProvider(only_display)
+    extract_system_wide(alone, THREE_DISPLAYS)
+    # Editor costs no AX calls; Chat's 13-element window on display 1 costs only its bounds
+    assert sum(provider.calls.values()) == sum(alone.calls.values()) - 13
@@ -0,0 +1,152 @@
+from axcore.coalesce import EventCoalescer
+from axcore.events import LiveTree, UIEvent
+from axcore.fake import SyntheticProvider, synthetic_events
+from axcore.walker import walk_tree
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pipeline(depth=5, fanout=3, **options):
+    provider = SyntheticProvider(depth, fanout)
+    live = LiveTree(provider, lambda: [provider.root])
+    live.load()
+    clock = FakeClock()
+    return provider, live, EventCoalescer(live, clock=clock, **options), clock
+
+
+def fresh(provider):
+    return [walk_tree(provider, provider.root)]
+
+
+def test_storm_on_hot_elements_is_coalesced_per_element():
+    provider, live, coalescer, clock = make_pipeline(window=0.05)
+    elements = set()
+    for event in synthetic_events(provider, 5000, seed=1, structure=0, focus=0, hot=8):
+        coalescer.put(event)
+        elements.add(event.element)
+        clock.now += 0.00001
+
+    assert coalescer.drain() == 0  # still changing
+    clock.now += 0.05
+    assert coalescer.drain() == len(elements)
+    assert live.snapshot()["tree"] == fresh(provider)
+    stats = coalescer.stats()
+    assert stats["received"] == 5000 and stats["coalesced"] == 5000 - len(elements) and stats["pending"] == 0
+    assert live.stats()["property"] == len(elements)
+
+
+def test_continuously_changing_element_is_delivered_after_max_delay():
+    provider, live, coalescer, clock = make_pipeline(window=0.05, max_delay=0.2)
+    deliveries = []
+    for tick in range(100):
+        provider.rename((2, 4), f"frame {tick}")
+        coalescer.put(UIEvent(UIEvent.PROPERTY, (2, 4), {"name": f"frame {tick}"}))
+        clock.now += 0.01
+        if coalescer.drain():
+            deliveries.append(round(clock.now, 2))
+    assert deliveries == [0.2, 0.4, 0.6, 0.8, 1.0]
+    assert coalescer.stats()["delay_p50_ms"] == 200.0
+
+
+def test_property_merge_rules():
+    provider, live, coalescer, clock = make_pipeline(window=0)
+    provider.rename((3, 1), "final")
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (3, 1), {"name": "stale", "value": "1"}))
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (3, 1), {"name": "final"}))
+    coalescer.put(UIEvent(UIEvent.FOCUS, (3, 0)))
+    coalescer.put(UIEvent(UIEvent.FOCUS, (3, 2)))
+    coalescer.drain()
+    assert [c["op"] for c in live.changes(0)["changes"]] == ["set", "focus"]
+    assert live.changes(0)["changes"][0]["attrs"] == {"name": "final", "value": "1"}
+    assert live.snapshot()["focused"] == [0, 0, 0, 2]
+
+    # A value-less event means "re-read", which wins over carried values
+    provider.rename((3, 1), "read back")
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (3, 1), {"name": "carried"}))
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (3, 1)))
+    coalescer.drain()
+    assert live.snapshot()["tree"] == fresh(provider)
+
+
+def test_structure_event_absorbs_its_subtree():
+    provider, live, coalescer, clock = make_pipeline(window=0.05)
+    # Descendants of (1, 0) change, then the whole branch is rebuilt
+    for element in [(2, 0), (3, 4), (4, 20)]:
+        provider.rename(element, "changed")
+        coalescer.put(UIEvent(UIEvent.PROPERTY, element, {"name": "changed"}))
+    provider.remove((2, 1))
+    coalescer.put(UIEvent(UIEvent.STRUCTURE, (1, 0)))
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (3, 0), {"name": "changed"}))  # absorbed on arrival
+    provider.rename((3, 0), "changed")
+    coalescer.put(UIEvent(UIEvent.PROPERTY, (2, 3), {"name": "elsewhere"}))  # another branch
+    provider.rename((2, 3), "elsewhere")
+
+    clock.now += 0.05
+    assert coalescer.drain() == 2
+    assert [c["op"] for c in live.changes(0)["changes"]] == ["replace", "set"]
+    stats = coalescer.stats()
+    assert stats["absorbed"] == 4 and stats["pending"] == 0
+    assert live.snapshot()["tree"] == fresh(provider)
+
+
+def test_rate_cap_holds_entries_back_and_keeps_coalescing():
+    provider, live, coalescer, clock = make_pipeline(window=0.01, max_rate=100)
+    events = list(synthetic_events(provider, 3000, seed=2, structure=0, focus=0))
+    delivered = []
+    for start in range(0, 3000, 30):
+        for event in events[start:start + 30]:
+            coalescer.put(event)
+        clock.now += 0.01
+        delivered.append(coalescer.drain())
+    # 1 second at 100 entries/s (plus the initial burst of one)
+    assert sum(delivered) <= 101 and max(delivered) <= 1
+    assert coalescer.stats()["pending"] > 100
+    coalescer.drain(flush=True)
+    assert live.snapshot()["tree"] == fresh(provider)
+
+
+def test_backpressure_bounds_pending_entries_and_inbox():
+    provider = SyntheticProvider(4, 4)
+    windows = [(1, 0), (1, 1), (1, 2), (1, 3)]
+    live = LiveTree(provider, lambda: list(windows))
+    live.load()
+    clock = FakeClock()
+    coalescer = EventCoalescer(live, window=0.05, max_pending=8, max_inbox=1000, clock=clock)
+
+    for event in synthetic_events(provider, 900, seed=3, structure=0, focus=0):
+        coalescer.put(event)
+    coalescer.drain()
+    stats = coalescer.stats()
+    assert stats["pending"] <= 8 + len(windows) and stats["escalated"] > 0
+    clock.now += 0.05
+    coalescer.drain()
+    assert live.snapshot()["tree"] == [walk_tree(provider, w) for w in windows]
+
+    # A stalled consumer: the inbox stops growing and the mirror is reloaded once
+    for event in synthetic_events(provider, 1500, seed=4, structure=0.05, focus=0):
+        coalescer.put(event)
+    assert coalescer.stats()["inbox"] == 1000 and coalescer.stats()["discarded"] == 500
+    coalescer.drain()
+    clock.now += 0.05
+    assert coalescer.drain() == 1
+    assert coalescer.stats()["reloads"] == 1 and live.stats()["loads"] == 2
+    assert live.snapshot()["tree"] == [walk_tree(provider, w) for w in windows]
+
+
+def test_drain_thread_delivers_everything_on_stop():
+    provider = SyntheticProvider(4, 3)
+    live = LiveTree(provider, lambda: [provider.root])
+    live.load()
+    coalescer = EventCoalescer(live, window=0.002, max_delay=0.01)
+    coalescer.start()
+    for event in synthetic_events(provider, 2000, seed=5, structure=0.05, hot=20):
+        coalescer.put(event)
+    coalescer.stop()
+    assert coalescer.stats()["pending"] == 0
+    assert live.snapshot()["tree"] == fresh(provider)
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from axcore.columnar import column_string, column_strings, load_columns, save_columns, to_columns
+from axcore.fake import SyntheticProvider
+from axcore.walker import walk_tree
+
+
+def linux_node(name, role, bbox, children=()):
+    return {'name': name, 'role': role, 'description': '', 'value': None,
+            'bbox': dict(zip(('x', 'y', 'width', 'height'), bbox)), 'children': list(children)}
+
+
+LINUX_TREE = [
+    linux_node('gedit', 'application', (0, 0, 0, 0), [
+        linux_node('Untitled', 'frame', (10, 10, 800, 600), [
+            linux_node('Save', 'push button', (20, 20, 40, 20)),
+            linux_node(None, 'text', (20, 50, 700, 500)),
+        ]),
+    ]),
+    linux_node('Files', 'application', (0, 0, 0, 0), [linux_node('Home', 'frame', (900.6, 0, 400, 300))]),
+]
+
+
+def flatten(tree):
+    """Reference preorder flattening with Python recursion"""
+    rows = []
+
+    def visit(node, parent, depth):
+        index = len(rows)
+        rows.append((node, parent, depth))
+        for child in node['children']:
+            visit(child, index, depth + 1)
+
+    for node in tree:
+        visit(node, -1, 0)
+    return rows
+
+
+def test_linux_tree_columns():
+    columns = to_columns(LINUX_TREE)
+
+    assert columns['parent'].tolist() == [-1, 0, 1, 1, -1, 4]
+    assert columns['depth'].tolist() == [0, 1, 2, 2, 0, 1]
+    assert columns['first_child'].tolist() == [1, 2, -1, -1, 5, -1]
+    assert columns['next_sibling'].tolist() == [4, -1, 3, -1, -1, -1]
+    assert columns['child_count'].tolist() == [1, 2, 0, 0, 1, 0]
+    assert columns['subtree_end'].tolist() == [4, 4, 3, 4, 6, 6]
+    assert columns['window'].tolist() == [0, 0, 0, 0, 4, 4]
+    assert columns['bbox'].dtype == np.int32
+    assert columns['bbox'][5].tolist() == [901, 0, 400, 300]
+    assert columns['role_categories'][columns['role']].tolist() == [
+        'application', 'frame', 'push button', 'text', 'application', 'frame']
+    assert column_strings(columns, 'name') == ['gedit', 'Untitled', 'Save', '', 'Files', 'Home']
+    assert column_string(columns, 'value', 2) == ''
+
+
+def test_event_output_matches_reference_and_filters_vectorised(tmp_path):
+    provider = SyntheticProvider(depth=5, fanout=3)
+    tree = [walk_tree(provider, provider.root), walk_tree(provider, provider.root)]
+    tree[1]['children'][0]['states'] = {'enabled': False}
+    tree[1]['children'][1]['name'] = 'ünïcode ✓'
+    event = {'time': 1700000000000, 'data': {'duration': 42, 'tree': tree, 'windows': []}}
+
+    path = str(tmp_path / 'snapshot.npz')
+    save_columns(path, to_columns(event))
+    columns = load_columns(path)
+
+    rows = flatten(tree)
+    assert columns['parent'].tolist() == [p for _, p, _ in rows]
+    assert columns['depth'].tolist() == [d for _, _, d in rows]
+    assert column_strings(columns, 'name') == [n['name'] for n, _, _ in rows]
+    assert columns['bbox'].tolist() == [[n['bbox'][k] for k in ('x', 'y', 'width', 'height')] for n, _, _ in rows]
+    assert columns['state_enabled'].tolist() == [int(n['states'].get('enabled', -1)) for n, _, _ in rows]
+    assert (int(columns['time']), int(columns['duration'])) == (1700000000000, 42)
+
+    # Enabled buttons overlapping a region, without Python-level recursion
+    roles = columns['role_categories']
+    x, y, w, h = columns['bbox'].T
+    hits = np.flatnonzero((roles[columns['role']] == 'Button') & (columns['state_enabled'] == 1) &
+                          (x < 100) & (x + w > 0) & (y < 100) & (y + h > 0))
+    expected = [i for i, (n, _, _) in enumerate(rows) if n['role'] == 'Button' and n['states']['enabled'] and
+                n['bbox']['x'] < 100 and n['bbox']['y'] < 100]
+    assert hits.tolist() == expected
+
+    second = np.flatnonzero(columns['parent'] < 0)[1]
+    assert columns['subtree_end'][second] == len(rows)
+    assert (columns['window'][second:] == second).all()
+
+
+def test_cli_converts_saved_json(tmp_path):
+    source = tmp_path / 'linux.json'
+    source.write_text(json.dumps({'time': 1, 'data': {'duration': 2, 'tree': LINUX_TREE}}))
+    target = tmp_path / 'linux.npz'
+
+    subprocess.run([sys.executable, '-m', 'axcore.columnar', str(source), '-o', str(target)], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert load_columns(str(target))['parent'].tolist() == [-1, 0, 1, 1, -1, 4]
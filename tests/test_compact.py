@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from axcore.compact import CompactReader, dumps_compact, load_compact, loads_compact, write_compact
+from axcore.fake import SyntheticProvider
+from axcore.walker import walk_tree
+
+
+def mac_node(name, children=()):
+    return {'role': 'AXGroup', 'name': name, 'description': '', 'value': '',
+            'bbox': {'x': -1440, 'y': 0, 'width': 1440.5, 'height': 900},
+            'display_index': 1, 'children': list(children)}
+
+
+@pytest.fixture
+def window():
+    provider = SyntheticProvider(depth=4, fanout=3)
+    tree = walk_tree(provider, provider.root)
+    tree['children'][1]['truncated'] = True
+    tree['children'][2]['value'] = None
+    return tree
+
+
+def test_parser_outputs_round_trip_with_key_order(window):
+    outputs = [
+        [window, mac_node('Finder', [mac_node('Window')])],
+        {'tree': [window], 'focused_element': window['children'][0], 'queries': {'cursor': None}},
+        {'time': 1700000000000, 'data': {'duration': 12, 'tree': [window], 'windows': [{'key': '1'}]}},
+        {'tree': None, 'focused_element': None},
+        [],
+    ]
+    for output in outputs:
+        decoded = loads_compact(dumps_compact(output))
+        assert json.dumps(decoded) == json.dumps(output)
+
+
+def test_strings_are_interned_and_sanitised(window):
+    data = dumps_compact([window, window, {'name': 'bad \ud800', 'role': 'Pane', 'children': []}],
+                         sanitize=lambda s: s.encode('utf-8', errors='ignore').decode('utf-8'))
+    reader = CompactReader(data=data)
+    strings = [reader.string(i) for i in range(reader.string_count)]
+
+    assert len(strings) == len(set(strings))
+    assert strings.count('Button') == 1
+    assert reader.tree()[2]['name'] == 'bad '
+    assert len(data) < len(json.dumps([window, window])) / 4
+
+
+def test_reader_memory_maps_and_iterates_lazily(tmp_path, window):
+    path = tmp_path / 'snapshot.axtb'
+    windows = (w for w in [window, mac_node('Finder')])
+    with open(path, 'wb') as f:
+        size = write_compact({'tree': windows, 'queries': {}}, f.write, chunk_size=64)
+    assert path.stat().st_size == size
+
+    with CompactReader(str(path)) as reader:
+        assert len(reader) == 41
+        index, parent, node = next(iter(reader))
+        assert (index, parent, node['name'], node['children']) == (0, -1, 'Element 0.0', [])
+        assert len(reader.strings) < 10
+
+        nodes = list(reader)
+        assert [p for _, p, _ in nodes[:5]] == [-1, 0, 1, 2, 2]
+        assert nodes[-1][1:] == (-1, mac_node('Finder'))
+
+    assert load_compact(str(path)) == {'tree': [window, mac_node('Finder')], 'queries': {}}
+
+
+def test_rejects_other_files():
+    with pytest.raises(ValueError):
+        CompactReader(data=json.dumps({'tree': []}).encode() * 10)
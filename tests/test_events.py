@@ -0,0 +1,206 @@
+import copy
+import json
+import queue
+import threading
+
+from axcore.events import LiveTree, UIEvent, apply_change
+from axcore.fake import FakeControl, FakeDesktop, SyntheticProvider, synthetic_events
+from axcore.serve import parse_request
+from axcore.walker import count_nodes, walk_tree
+from uia_extractors import TreeSession, property_event
+
+
+class VanishingProvider(SyntheticProvider):
+    gone = ()
+
+    def read(self, element):
+        if element in self.gone:
+            raise RuntimeError("element not available")
+        return super().read(element)
+
+
+def make_live(depth=5, fanout=3, feed_size=10000):
+    provider = SyntheticProvider(depth, fanout)
+    live = LiveTree(provider, lambda: [provider.root], feed_size=feed_size)
+    live.load()
+    return provider, live
+
+
+def test_synthetic_stream_keeps_mirror_equal_to_fresh_walk():
+    provider, live = make_live()
+    initial = live.snapshot()
+    before = json.dumps(initial["tree"])
+
+    for carry_values in (True, False):
+        for event in synthetic_events(provider, 500, seed=carry_values, structure=0.1, carry_values=carry_values):
+            live.apply(event)
+        assert live.snapshot()["tree"] == [walk_tree(provider, provider.root)]
+
+    # Snapshots handed out earlier are never mutated
+    assert json.dumps(initial["tree"]) == before
+    stats = live.stats()
+    assert stats["nodes"] == count_nodes(live.snapshot()["tree"][0])
+    assert stats["property"] + stats["structure"] + stats["focus"] == 1000
+
+
+def test_property_event_copies_only_the_path_to_the_root():
+    provider, live = make_live(depth=4, fanout=3)
+    old = live.snapshot()["tree"]
+    provider.calls.clear()
+
+    [change] = live.apply(UIEvent(UIEvent.PROPERTY, (3, 5), {"name": "Saved", "role": "Pane"}))
+    assert change["op"] == "set" and change["path"] == [0, 0, 1, 2]
+    assert change["attrs"] == {"name": "Saved"}  # the role is unchanged
+    assert sum(provider.calls.values()) == 0  # applied from the event alone
+
+    new = live.snapshot()["tree"]
+    assert new[0]["children"][0]["children"][1]["children"][2]["name"] == "Saved"
+    assert new[0]["children"][1] is old[0]["children"][1]
+    assert new[0]["children"][0]["children"][0] is old[0]["children"][0]["children"][0]
+    assert live.apply(UIEvent(UIEvent.PROPERTY, (3, 5), {"name": "Saved"})) == []
+
+    # Without values the element alone is re-read
+    provider.rename((2, 4), "Re-read")
+    [change] = live.apply(UIEvent(UIEvent.PROPERTY, (2, 4)))
+    assert change["attrs"] == {"name": "Re-read"} and provider.calls["children"] == 0
+
+
+def test_structure_events_remove_and_restore_subtrees():
+    provider = VanishingProvider(4, 2)
+    live = LiveTree(provider, lambda: [provider.root])
+    size = live.load()
+
+    provider.remove((2, 1))
+    [change] = live.apply(UIEvent(UIEvent.STRUCTURE, (1, 0)))
+    assert change["op"] == "replace" and change["path"] == [0, 0]
+    assert len(live) == size - 3
+
+    # A child-added event on an element not yet mirrored re-walks its nearest mirrored ancestor
+    provider.restore((2, 1))
+    [change] = live.apply(UIEvent(UIEvent.STRUCTURE, (2, 1)))
+    assert change["path"] == [0, 0] and len(live) == size
+
+    # An element that can no longer be read is removed
+    provider.gone = {(1, 1)}
+    [change] = live.apply(UIEvent(UIEvent.PROPERTY, (1, 1)))
+    assert change == {"seq": change["seq"], "op": "remove", "path": [0, 1]}
+    assert [c["name"] for c in live.snapshot()["tree"][0]["children"]] == ["Element 1.0"]
+    assert live.apply(UIEvent(UIEvent.PROPERTY, (2, 3), {"name": "x"})) == []
+    assert live.stats()["ignored"] == 1
+
+
+def test_windows_opened_and_closed_and_focus():
+    provider = SyntheticProvider(3, 2)
+    windows = [(1, 0), (1, 1)]
+    live = LiveTree(provider, lambda: list(windows))
+    live.load()
+
+    windows[:] = [(1, 1), (2, 0)]
+    removed, added = live.apply(UIEvent(UIEvent.STRUCTURE, None))
+    assert (removed["op"], removed["path"]) == ("remove", [0])
+    assert (added["op"], added["path"], added["node"]["name"]) == ("add", [1], "Element 2.0")
+
+    [focus] = live.apply(UIEvent(UIEvent.FOCUS, (2, 3)))
+    assert focus["path"] == [0, 1] and live.snapshot()["focused"] == [0, 1]
+    live.apply(UIEvent(UIEvent.FOCUS, (2, 0)))
+    assert live.snapshot()["focused"] == [1]
+
+
+class AnonymousWindowsProvider(SyntheticProvider):
+    """Top-level windows (depth 1) have no identity, like windows without a native handle"""
+
+    def identity(self, element):
+        return None if element[0] == 1 else element
+
+
+def test_anonymous_windows_survive_desktop_structure_events():
+    provider = AnonymousWindowsProvider(3, 3)
+    windows = [(1, 0), (1, 1)]
+    live = LiveTree(provider, lambda: list(windows))
+    live.load()
+    before = live.snapshot()["tree"]
+
+    assert live.apply(UIEvent(UIEvent.STRUCTURE, None)) == []
+    assert live.snapshot()["tree"] == before and live.stats()["reads"] == 2 * 4
+
+    windows.append((1, 2))
+    [added] = live.apply(UIEvent(UIEvent.STRUCTURE, None))
+    assert (added["op"], added["path"], added["node"]["name"]) == ("add", [2], "Element 1.2")
+    del windows[0]
+    [removed] = live.apply(UIEvent(UIEvent.STRUCTURE, None))
+    assert (removed["op"], removed["path"]) == ("remove", [0])
+    assert [node["name"] for node in live.snapshot()["tree"]] == ["Element 1.1", "Element 1.2"]
+
+
+def test_change_feed_replays_onto_an_earlier_snapshot():
+    provider, live = make_live(depth=5, fanout=3, feed_size=300)
+    events = synthetic_events(provider, 2000, seed=7, structure=0.1)
+
+    for _ in range(100):
+        live.apply(next(events))
+    snapshot = live.snapshot()
+    replica = copy.deepcopy(snapshot["tree"])
+
+    for event in events:
+        live.apply(event)
+        if live.sequence - snapshot["sequence"] > 200:
+            break
+    feed = live.changes(snapshot["sequence"])
+    for change in feed["changes"]:
+        apply_change(replica, change)
+    assert replica == live.snapshot()["tree"]
+    assert feed["sequence"] == live.sequence and live.changes(live.sequence)["changes"] == []
+
+    # Consumers that fell behind the feed (or a reload) must resynchronise
+    for event in events:
+        live.apply(event)
+    assert live.changes(snapshot["sequence"])["changes"] is None
+    live.load()
+    assert live.changes(live.sequence - 1)["changes"] is None
+    assert live.changes(live.sequence)["changes"] == []
+
+
+def test_consume_applies_events_from_a_callback_thread():
+    provider, live = make_live(depth=4, fanout=3)
+    events = queue.Queue()
+    worker = threading.Thread(target=live.consume, args=(iter(events.get, None),))
+    worker.start()
+    for event in synthetic_events(provider, 200, seed=3):
+        events.put(event)
+        live.snapshot()
+    events.put(UIEvent(UIEvent.PROPERTY, "not an element", {"name": "x"}))
+    events.put(None)
+    worker.join()
+    assert live.snapshot()["tree"] == [walk_tree(provider, provider.root)]
+
+
+def test_uia_session_watch_applies_uia_events():
+    button = FakeControl('OK', 'Button', rect=(10, 10, 50, 30))
+    pane = FakeControl('Toolbar', children=[button])
+    window = FakeControl('Editor', 'Window', rect=(0, 0, 800, 600), children=[pane])
+    session = TreeSession(FakeDesktop([window]), lambda: button, lambda x, y: button)
+    try:
+        live = session.watch()
+        button.calls.clear()
+        button.element_info.name = 'Save'
+        [change] = live.apply(property_event(button, 30005, 'Save'))
+        assert (change['path'], change['attrs']) == ([0, 0, 0], {'name': 'Save'})
+        assert not button.calls
+
+        # Bounds changes carry no usable value: the element alone is re-read
+        button._rect = (20, 10, 60, 30)
+        [change] = live.apply(property_event(button, 30001, None))
+        assert change['attrs'] == {'bbox': {'x': 20, 'y': 10, 'width': 40, 'height': 20}}
+        assert 'children' not in button.calls
+
+        # ChildAdded is raised on the new element; its parent is re-walked
+        label = FakeControl('Status', 'Text')
+        label._parent = pane
+        pane._children.append(label)
+        [change] = live.apply(UIEvent(UIEvent.STRUCTURE, label))
+        assert (change['op'], change['path']) == ('replace', [0, 0])
+        assert [c['name'] for c in live.snapshot()['tree'][0]['children'][0]['children']] == ['Save', 'Status']
+        assert parse_request('changes 1') == {'cmd': 'changes', 'since': 1}
+        assert [c['op'] for c in live.changes(1)['changes']] == ['set', 'replace']
+    finally:
+        session.close()
@@ -0,0 +1,121 @@
+from axcore.fake import FakeDesktop, SyntheticProvider, build_fake_tree
+from axcore.walker import Deadline, SubtreeCache, WalkStats, count_nodes, walk_tree
+from uia_extractors import TreeSession
+
+
+def walk(provider, cache, **kwargs):
+    provider.calls.clear()
+    stats = WalkStats()
+    tree = walk_tree(provider, provider.root, cache=cache, stats=stats, **kwargs)
+    return tree, stats, sum(provider.calls.values())
+
+
+def test_unchanged_tree_reuses_every_read():
+    provider = SyntheticProvider(depth=6, fanout=4)
+    cache = SubtreeCache()
+    full, _, _ = walk(provider, cache)
+    again, stats, _ = walk(provider, cache)
+
+    assert again == full
+    assert stats.nodes == 0 and stats.reused == provider.size
+    # Only children and the fingerprint (name, bounds) are read per element
+    assert set(provider.calls) == {'children', 'name', 'bounds'}
+
+
+def test_only_changed_nodes_are_read():
+    provider = SyntheticProvider(depth=6, fanout=4)
+    cache = SubtreeCache()
+    full, _, _ = walk(provider, cache)
+
+    provider.rename((0, 0), 'Renamed root')
+    provider.rename((1, 2), 'Renamed child')
+    tree, stats, _ = walk(provider, cache)
+
+    assert tree['name'] == 'Renamed root'
+    assert tree['children'][2]['name'] == 'Renamed child'
+    assert tree['children'][0] == full['children'][0]
+    assert stats.nodes == 2 and provider.calls['role'] == 2
+    assert count_nodes(tree) == count_nodes(full)
+
+
+def test_cache_misses_read_name_and_bounds_once():
+    provider = SyntheticProvider(depth=3, fanout=3)
+    cache = SubtreeCache()
+    full, _, _ = walk(provider, cache)
+    assert provider.calls['name'] == provider.calls['bounds'] == provider.calls['role'] == provider.size
+
+    provider.rename((0, 0), 'Renamed root')
+    tree, stats, _ = walk(provider, cache)
+    assert tree == dict(full, name='Renamed root') and stats.nodes == 1
+    # One fingerprint per element; the root's read reuses its name and bounds
+    assert (provider.calls['name'], provider.calls['bounds'], provider.calls['role']) == (13, 13, 1)
+
+
+def test_child_count_change_rewalks_parent():
+    provider = SyntheticProvider(depth=4, fanout=3)
+    cache = SubtreeCache()
+    walk(provider, cache)
+
+    provider.remove((1, 1))
+    tree, stats, _ = walk(provider, cache)
+
+    assert [c['name'] for c in tree['children']] == ['Element 1.0', 'Element 1.2']
+    assert stats.nodes == 1 and stats.reused == 40 - 1 - 13
+
+
+def test_deep_change_under_unchanged_root_shows_in_next_walk():
+    provider = SyntheticProvider(depth=4, fanout=3)
+    cache = SubtreeCache()
+    walk(provider, cache)
+
+    provider.rename((3, 13), 'Deep change')
+    provider.remove((2, 7))
+    tree, stats, _ = walk(provider, cache)
+    assert tree['children'][1]['children'][1]['children'][1]['name'] == 'Deep change'
+    assert [c['name'] for c in tree['children'][2]['children']] == ['Element 2.6', 'Element 2.8']
+    # The renamed element and the parent whose child count changed
+    assert stats.nodes == 2
+
+
+def test_entries_expire_and_invalidate():
+    provider = SyntheticProvider(depth=4, fanout=2)
+    cache = SubtreeCache(max_age=2)
+    walk(provider, cache)
+    _, stats, _ = walk(provider, cache)
+    assert stats.nodes == 0
+
+    _, stats, _ = walk(provider, cache)
+    assert stats.nodes == provider.size
+
+    cache.invalidate((3, 5))
+    _, stats, _ = walk(provider, cache)
+    assert stats.nodes == 1
+
+
+def test_truncated_walk_keeps_previous_cache():
+    provider = SyntheticProvider(depth=5, fanout=3)
+    cache = SubtreeCache()
+    full, _, _ = walk(provider, cache)
+
+    provider.rename((0, 0), 'Changed')
+    partial, stats, _ = walk(provider, cache, deadline=Deadline(0))
+    assert stats.truncated
+
+    tree, stats, _ = walk(provider, cache)
+    assert tree['name'] == 'Changed' and 'truncated' not in tree
+    assert tree['children'][0] == full['children'][0] and stats.nodes == 1
+
+
+def test_incremental_session_reuses_window_subtrees():
+    window = build_fake_tree(depth=5, fanout=3, name='win', handle=7)
+    session = TreeSession(FakeDesktop([window]), None, None, incremental=True)
+    try:
+        first = session.windows_tree()
+        window.calls.clear()
+        second = session.windows_tree()
+    finally:
+        session.close()
+
+    assert second == first
+    assert session.last_report[0]['reused_nodes'] == 121 and session.last_report[0]['nodes'] == 0
+    assert window.calls['get_value'] == 0
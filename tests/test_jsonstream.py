@@ -0,0 +1,130 @@
+import json
+import random
+
+import pytest
+
+from axcore.fake import FakeDesktop, SyntheticProvider, build_fake_tree
+from axcore.jsonstream import COMPACT_SEPARATORS, iter_json, write_json
+from axcore.walker import walk_tree
+from uia_extractors import TreeSession
+
+
+# The copy-then-dump path of win-ax/dump-tree.py that the streaming writer replaces
+def clean_string(s):
+    if isinstance(s, str):
+        return s.encode('utf-8', errors='ignore').decode('utf-8')
+    return s
+
+
+def clean_value(v):
+    if isinstance(v, str):
+        return clean_string(v)
+    elif isinstance(v, dict):
+        return {k: clean_value(x) for k, x in v.items()}
+    elif isinstance(v, list):
+        return [clean_value(x) for x in v]
+    return v
+
+
+STRINGS = ['', 'OK', 'café', 'tab\there "quoted" \\ slash', '😀 emoji', 'lone \ud800 surrogate',
+           '\x00\x1f control', 'line\nbreak', ' ']
+
+
+def random_value(rng, depth=4):
+    kind = rng.randrange(10 if depth else 6)
+    if kind == 0:
+        return rng.choice(STRINGS)
+    if kind == 1:
+        return rng.randrange(-10 ** 12, 10 ** 12)
+    if kind == 2:
+        return rng.choice([0.1, -2.5e-300, 1e21, float('nan'), float('inf'), -float('inf'), 3.0])
+    if kind == 3:
+        return rng.choice([None, True, False])
+    if kind == 4:
+        return (rng.choice(STRINGS), [rng.choice(STRINGS)])
+    if kind == 5:
+        return []
+    if kind < 8:
+        return [random_value(rng, depth - 1) for _ in range(rng.randrange(5))]
+    keys = STRINGS + [1, 2.5, True, None]
+    return {rng.choice(keys): random_value(rng, depth - 1) for _ in range(rng.randrange(5))}
+
+
+def test_output_is_byte_identical_to_json_dumps():
+    rng = random.Random(11)
+    for _ in range(500):
+        value = random_value(rng)
+        assert ''.join(iter_json(value, clean_string)) == json.dumps(clean_value(value), ensure_ascii=True)
+        assert ''.join(iter_json(value)) == json.dumps(value)
+        if not isinstance(value, str) or '\ud800' not in value:
+            assert ''.join(iter_json(value, ensure_ascii=False)) == json.dumps(value, ensure_ascii=False)
+        assert ''.join(iter_json(value, separators=COMPACT_SEPARATORS)) == json.dumps(value, separators=(',', ':'))
+
+
+def test_walked_tree_matches_and_unserialisable_values_raise():
+    provider = SyntheticProvider(depth=5, fanout=3)
+    tree = walk_tree(provider, provider.root)
+    assert ''.join(iter_json({'tree': [tree]}, clean_string)) == json.dumps(clean_value({'tree': [tree]}))
+
+    with pytest.raises(TypeError):
+        ''.join(iter_json({'bad': object()}))
+    with pytest.raises(TypeError):
+        ''.join(iter_json({(1, 2): 'tuple key'}))
+
+
+def test_event_wrapped_trees_stream_in_leaf_sized_chunks():
+    provider = SyntheticProvider(depth=5, fanout=6)
+    tree = walk_tree(provider, provider.root)
+    event = {'time': 1700000000000, 'data': {'duration': 40, 'tree': [tree]}}
+    leaf = tree
+    while leaf['children']:
+        leaf = leaf['children'][0]
+
+    chunks = list(iter_json(event))
+    assert ''.join(chunks) == json.dumps(event)
+    # Only leaf nodes (and their bboxes and states) are encoded whole
+    assert max(len(chunk) for chunk in chunks) <= len(json.dumps(leaf)) + 40
+
+
+def test_deep_trees_do_not_recurse():
+    node = {'name': 'leaf', 'children': []}
+    for i in range(20000):
+        node = {'name': f"n{i}", 'children': [node]}
+    text = ''.join(iter_json(node))
+    assert text.startswith('{"name": "n19999", "children": [{"name": "n19998"')
+    assert text.endswith(']}' * 20000)
+
+
+def test_generators_are_consumed_lazily_with_bounded_writes():
+    consumed = []
+    writes = []
+
+    def windows():
+        for i in range(50):
+            consumed.append(i)
+            yield {'name': 'w' * 1000, 'index': i}
+
+    def write(chunk):
+        writes.append((len(consumed), len(chunk)))
+
+    total = write_json({'tree': windows(), 'done': True}, write, buffer_size=4096)
+
+    assert total == len(json.dumps({'tree': [{'name': 'w' * 1000, 'index': i} for i in range(50)], 'done': True}))
+    assert writes[0][0] < 10  # first bytes leave before the later windows are produced
+    assert max(size for _, size in writes) < 4096 + 1100
+
+
+def test_session_streams_windows_and_reports_when_exhausted():
+    windows = [build_fake_tree(3, 2, name=f"win{i}", handle=i + 1) for i in range(4)]
+    session = TreeSession(FakeDesktop(windows), None, None, max_workers=2)
+    try:
+        stream = session.iter_windows_tree()
+        first = next(stream)
+        assert session.last_report == []
+        rest = list(stream)
+    finally:
+        session.close()
+
+    assert sorted(w['name'] for w in [first] + rest) == ['win0', 'win1', 'win2', 'win3']
+    assert [r['nodes'] for r in session.last_report] == [7, 7, 7, 7]
+    assert set(session.history.windows) == {'1', '2', '3', '4'}
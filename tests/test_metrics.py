@@ -0,0 +1,101 @@
+import pstats
+import threading
+import time
+
+from axcore.fake import FakeControl, FakeDesktop, build_fake_tree
+from axcore.metrics import Metrics, profiled, write_metrics
+from uia_extractors import TreeSession
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class BrokenControl(FakeControl):
+    def children(self):
+        raise LookupError('element is gone')
+
+
+def test_phases_are_exclusive_of_nested_phases_and_accumulate():
+    clock = Clock()
+    metrics = Metrics(clock)
+
+    def produce():
+        for item in range(3):
+            clock.now += 0.010  # walking a window
+            yield item
+
+    with metrics.phase('serialize'):
+        for item in metrics.timed('walk', produce()):
+            clock.now += 0.001
+            with metrics.phase('write'):
+                clock.now += 0.002
+    with metrics.phase('write'):
+        clock.now += 0.004
+
+    assert metrics.as_dict() == {'phases': {'walk': 30.0, 'write': 10.0, 'serialize': 3.0}, 'errors': {}}
+
+
+def test_errors_are_counted_by_type_and_records_appended(tmp_path):
+    metrics = Metrics()
+    metrics.error(KeyError('x'))
+    metrics.error(KeyError('y'))
+    metrics.error('app timeout', 2)
+    write_metrics(tmp_path / 'metrics.jsonl', {'time': 1, **metrics.as_dict()})
+    write_metrics(tmp_path / 'metrics.jsonl', {'time': 2, **metrics.as_dict()})
+
+    lines = (tmp_path / 'metrics.jsonl').read_text().splitlines()
+    assert len(lines) == 2 and '"errors": {"KeyError": 2, "app timeout": 2}' in lines[1]
+
+
+def test_session_fills_in_windows_and_errors():
+    windows = [build_fake_tree(2, 3, handle=7), BrokenControl('broken', 'Window', handle=8)]
+    session = TreeSession(FakeDesktop(windows), lambda: 1 / 0, None, field_stats=True)
+    metrics = Metrics()
+    try:
+        with metrics.phase('walk'):
+            trees = session.windows_tree(metrics)
+        assert session.focused(metrics=metrics) is None
+    finally:
+        session.close()
+
+    assert len(trees) == 2
+    result = metrics.as_dict()
+    assert list(result['phases']) == ['enumerate', 'walk']
+    assert result['windows'] == {'7': 4, '8': 1}
+    assert result['errors'] == {'LookupError': 1, 'ZeroDivisionError': 1}
+    assert result['calls']['children']['calls'] == 5
+    assert {r['key']: r['errors'] for r in session.last_report} == {'7': {}, '8': {'LookupError': 1}}
+
+
+def busy_worker(done):
+    while not done.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profile_covers_other_threads(tmp_path):
+    done = threading.Event()
+    worker = threading.Thread(target=busy_worker, args=(done,))
+    with profiled(str(tmp_path / 'walk.folded'), interval=0.001):
+        worker.start()
+        time.sleep(0.1)
+        done.set()
+        worker.join()
+
+    lines = (tmp_path / 'walk.folded').read_text().splitlines()
+    assert any('busy_worker' in line.rsplit(' ', 1)[0] for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_prof_path_writes_cprofile_stats(tmp_path):
+    done = threading.Event()
+    done.set()
+    with profiled(str(tmp_path / 'snapshot.prof')):
+        busy_worker(done)
+
+    stats = pstats.Stats(str(tmp_path / 'snapshot.prof'))
+    assert any(name == 'busy_worker' for _, _, name in stats.stats)
@@ -0,0 +1,109 @@
+import copy
+import json
+import random
+
+from axcore.patch import EventLogReader, EventLogWriter, PatchEncoder, PatchState
+
+
+def node(name, role='Pane', children=(), value=''):
+    return dict(name=name, role=role, description='', value=value,
+                bbox={'x': 0, 'y': 0, 'width': 10, 'height': 10}, children=list(children))
+
+
+def random_tree(rng, depth=3):
+    roles = ['Pane', 'Button', 'Text']
+    return [node(f"n{rng.randrange(6)}", rng.choice(roles),
+                 random_tree(rng, depth - 1) if depth > 1 else [])
+            for _ in range(rng.randrange(4))]
+
+
+def mutate(rng, tree):
+    tree = copy.deepcopy(tree)
+    nodes = []
+    stack = [tree]
+    while stack:
+        siblings = stack.pop()
+        for n in siblings:
+            nodes.append((n, siblings))
+            stack.append(n['children'])
+    for _ in range(rng.randrange(4)):
+        action = rng.randrange(5)
+        if action == 0 or not nodes:
+            tree.insert(rng.randrange(len(tree) + 1), node('x', children=random_tree(rng, 2)))
+        else:
+            n, siblings = rng.choice(nodes)
+            if not any(s is n for s in siblings):
+                continue
+            if action == 1:
+                siblings.remove(n)
+            elif action == 2:
+                n['name'] = f"renamed{rng.randrange(100)}"
+            elif action == 3:
+                siblings.remove(n)
+                siblings.insert(rng.randrange(len(siblings) + 1), n)
+            else:
+                n['value'] = str(rng.random())
+                n.pop('description', None)
+    return tree
+
+
+def event(time, tree, **data):
+    return {'time': time, 'data': dict(data, duration=5, tree=tree)}
+
+
+def test_diff_apply_round_trips_random_mutations():
+    rng = random.Random(7)
+    writer, reader = PatchState(), PatchState()
+    tree = random_tree(rng)
+    writer.reset(tree)
+    reader.reset(tree)
+
+    for _ in range(300):
+        tree = mutate(rng, tree)
+        ops = writer.diff(tree)
+        reader.apply(json.loads(json.dumps(ops)))
+        assert reader.tree() == tree
+        assert writer.tree() == tree
+
+
+def test_rename_and_move_produce_small_ops():
+    state = PatchState()
+    state.reset([node('win', children=[node('a'), node('b'), node('c')])])
+    ops = state.diff([node('win title', children=[node('c'), node('a'), node('b', value='1')])])
+
+    assert ops == [
+        {'op': 'set', 'id': 1, 'attrs': {'name': 'win title'}},
+        {'op': 'move', 'id': 4, 'index': 0},
+        {'op': 'set', 'id': 3, 'attrs': {'value': '1'}},
+    ]
+
+
+def test_encoder_emits_periodic_keyframes():
+    encoder = PatchEncoder(keyframe_interval=3)
+    types = [encoder.encode(event(t, [node('w')]))['type'] for t in range(7)]
+    assert types == ['keyframe', 'delta', 'delta', 'keyframe', 'delta', 'delta', 'keyframe']
+
+
+def test_log_reader_reconstructs_any_snapshot(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    rng = random.Random(3)
+    tree = random_tree(rng)
+    events = []
+    writer = EventLogWriter(path, keyframe_interval=5)
+    for t in range(0, 230, 10):
+        if t == 120:
+            # A later one-shot run picks up the encoder state from the file
+            writer = EventLogWriter(path, keyframe_interval=5)
+        tree = mutate(rng, tree)
+        events.append(event(t, tree, focused_element=None))
+        writer.write(events[-1])
+
+    reader = EventLogReader(path)
+    assert reader.times() == [e['time'] for e in events]
+    assert [r[1] for r in reader.records].count('keyframe') == 5
+    assert list(reader) == events
+
+    for t in [225, 0, 75, 80, 80, 30, 229]:
+        expected = events[min(t // 10, len(events) - 1)]
+        assert reader.snapshot_at(t) == expected
+    assert reader.snapshot_at(-1) is None
@@ -0,0 +1,58 @@
+import os
+
+from axcore.fake import FakeControl, FakeDesktop, SyntheticWindows
+from axcore.procwalk import ProcessWalker
+from axcore.scheduler import fixed_budgets
+from axcore.walker import count_nodes
+from uia_extractors import TreeSession
+
+
+class CrashingWindows(SyntheticWindows):
+    def walk(self, key, deadline=None, max_nodes=None, stats=None):
+        if key == 'crash':
+            os._exit(1)
+        return super().walk(key, deadline, max_nodes, stats)
+
+
+def test_windows_are_walked_in_workers_and_yielded_in_rank_order():
+    local = SyntheticWindows(4, 3, 4)
+    walker = ProcessWalker(SyntheticWindows, (4, 3, 4), workers=2)
+    try:
+        plan = fixed_budgets(local.keys() + ['9'], 5, str)
+        plan[1].max_nodes = 5
+        trees = list(walker.iter_windows_tree(plan, rank=lambda budget: -int(budget.key)))
+    finally:
+        walker.close()
+
+    assert [tree['name'] for tree in trees] == ['Element 1.3', 'Element 1.2', 'Element 1.1', 'Element 1.0']
+    assert trees[-1] == local.walk('0')
+    assert [(b.nodes, b.truncated) for b in plan] == [(21, False), (5, True), (21, False), (21, False), (0, False)]
+    assert count_nodes(plan[1].tree) == 5 and plan[1].tree['node_count'] == 5
+    assert plan[4].tree is None  # the key no longer resolves
+
+
+def test_pool_is_restarted_after_a_worker_dies(capsys):
+    walker = ProcessWalker(CrashingWindows, (2, 2, 2), workers=1)
+    try:
+        assert list(walker.iter_windows_tree(fixed_budgets(['crash'], 5, str))) == []
+        assert walker.pool is None and 'worker died' in capsys.readouterr().err
+        [tree] = walker.iter_windows_tree(fixed_budgets(['1'], 5, str))
+        assert tree['name'] == 'Element 1.1'
+    finally:
+        walker.close()
+
+
+def test_session_walks_windows_in_processes_in_z_order():
+    # Top-level windows enumerated front to back, identified by handle
+    windows = [FakeControl(f'window {h}', 'Window', handle=h) for h in (3, 1, 2)]
+    walker = ProcessWalker(SyntheticWindows, (4, 3, 4), workers=2)
+    session = TreeSession(FakeDesktop(windows), None, None, process_walker=walker, incremental=True)
+    try:
+        trees = session.windows_tree()
+        assert [tree['name'] for tree in trees] == ['Element 1.3', 'Element 1.1', 'Element 1.2']
+        assert session.workers == 2 and session.subtree_caches is None
+        assert [window['nodes'] for window in session.last_report] == [21, 21, 21]
+        assert session.windows_tree() == trees  # the pool is reused
+    finally:
+        session.close()
+    assert walker.pool is None
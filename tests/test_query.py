@@ -0,0 +1,52 @@
+from collections import Counter
+
+from axcore.fake import FakeControl, FakeDesktop, SyntheticProvider, build_fake_tree
+from axcore.walker import CountingProvider, ancestor_chain
+from uia_extractors import TreeSession
+
+
+def make_desktop(calls):
+    document = build_fake_tree(depth=6, fanout=4, calls=calls, name='doc')
+    window = FakeControl('Editor', 'Window', rect=(0, 0, 800, 600), children=[document], calls=calls, handle=1)
+    root = FakeControl('Desktop', 'Pane', children=[window], calls=calls)
+    return root, window, document
+
+
+def test_point_reads_element_and_ancestors_not_descendants():
+    calls = Counter()
+    root, window, document = make_desktop(calls)
+    session = TreeSession(FakeDesktop([window]), lambda: document, lambda x, y: document)
+    try:
+        element = session.point(5, 5)['element']
+        assert element['name'] == 'doc'
+        assert element['children'] == []
+        assert [n['name'] for n in element['ancestors']] == ['Editor']
+        assert 'children' not in element['ancestors'][0]
+        # The element and its window are read; the desktop root is only asked for its parent
+        assert element['provider_calls']['name'] == 2
+        assert element['provider_calls']['parent'] == 3
+        assert 'children' not in element['provider_calls']
+        bounded = sum(calls.values())
+
+        calls.clear()
+        legacy = session.focused(max_depth=0, ancestors=False)
+        assert 'ancestors' not in legacy
+        assert len(legacy['children']) == 4
+        assert legacy['provider_calls']['name'] == 4 ** 6 // 3  # 1 + 4 + ... + 4**5
+        assert sum(calls.values()) > 100 * bounded
+
+        limited = session.focused(max_depth=3, max_nodes=10)
+        assert limited['truncated'] and limited['node_count'] == 10
+        assert limited['provider_calls']['name'] == 11
+    finally:
+        session.close()
+
+
+def test_ancestor_chain_limits_and_counting_provider():
+    counting = CountingProvider(SyntheticProvider(depth=4, fanout=2))
+    leaf = (3, 5)
+
+    assert [n['name'] for n in ancestor_chain(counting, leaf)] == ['Element 1.1', 'Element 2.2']
+    assert counting.calls['parent'] == 4
+    assert [n['name'] for n in ancestor_chain(counting, leaf, max_depth=1)] == ['Element 2.2']
+    assert ancestor_chain(counting, (0, 0)) == []
@@ -0,0 +1,88 @@
+from axcore.fake import FakeDesktop, build_fake_tree
+from axcore.scheduler import SizeHistory, plan_budgets
+from uia_extractors import TreeSession
+
+
+def budgets_by_key(plan):
+    return {b.key: b for b in plan}
+
+
+def test_plan_serves_priority_windows_first_and_small_windows_fully():
+    history = SizeHistory()
+    for key, nodes in [('ide', 20000), ('chat', 300), ('term', 100), ('focus', 2000)]:
+        history.record(key, nodes, nodes * 0.001)
+
+    plan = plan_budgets(['ide', 'chat', 'term', 'focus'], total_seconds=4.0, history=history,
+                        key=lambda w: w, priority_keys={'focus'}, workers=1)
+    budgets = budgets_by_key(plan)
+
+    assert [b.key for b in plan] == ['focus', 'term', 'chat', 'ide']
+    assert budgets['focus'].priority
+    assert budgets['focus'].seconds >= 2.0 * 1.5 - 1e-9
+    assert budgets['term'].max_nodes >= 100 and budgets['chat'].max_nodes >= 300
+    assert budgets['ide'].max_nodes < 20000
+    assert abs(sum(b.seconds for b in plan) - 4.0) < 1e-6
+
+
+def test_plan_spreads_unused_capacity_and_caps_at_total():
+    history = SizeHistory()
+    history.record('a', 10, 0.01)
+    plan = plan_budgets(['a', 'new'], total_seconds=2.0, history=history, key=lambda w: w, workers=4)
+    budgets = budgets_by_key(plan)
+
+    assert budgets['a'].seconds == budgets['new'].seconds == 2.0
+    assert budgets['new'].max_nodes is None
+
+
+def test_history_treats_truncated_counts_as_lower_bounds(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    history = SizeHistory(path)
+    history.record('w', 1000, 1.0)
+    history.record('w', 400, 0.4, truncated=True)
+    history.record('w', 600, 0.6)
+    history.save()
+
+    reloaded = SizeHistory(path)
+    assert reloaded.expected_nodes('w') == 800
+    assert abs(reloaded.seconds_per_node('w') - 0.001) < 1e-9
+
+
+def test_history_forgets_windows_not_seen_for_max_age_snapshots(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    history = SizeHistory(path, max_age=3)
+    history.begin(['open', 'closed'])
+    history.record('open', 100, 0.1)
+    history.record('closed', 5000, 50.0)
+    history.save()
+
+    for _ in range(2):
+        history = SizeHistory(path, max_age=3)
+        history.begin(['open'])
+        history.save()
+    assert set(history.windows) == {'open', 'closed'}
+
+    history = SizeHistory(path, max_age=3)
+    history.begin(['open'])
+    assert set(history.windows) == {'open'}
+    # A new window with the closed one's handle falls back to the defaults, not its size and cost
+    assert history.expected_nodes('closed') == SizeHistory.DEFAULT_NODES
+    assert abs(history.seconds_per_node('closed') - 0.001) < 1e-9
+
+
+def test_session_reports_budgets_and_learns_window_sizes():
+    big = build_fake_tree(depth=7, fanout=3, name='big', handle=1)
+    small = build_fake_tree(depth=2, fanout=2, name='small', handle=2)
+    session = TreeSession(FakeDesktop([big, small]), None, None, budget_seconds=10.0,
+                          priority_windows=lambda: {2})
+    try:
+        tree = session.windows_tree()
+    finally:
+        session.close()
+
+    assert sorted(w['name'] for w in tree) == ['big', 'small']
+    report = {r['key']: r for r in session.last_report}
+    assert report['2']['priority'] and not report['1']['priority']
+    assert report['1']['nodes'] == 1093 and not report['1']['truncated']
+    assert session.history.expected_nodes('1') == 1093
+    assert set(report['1']) == {'key', 'priority', 'budget_ms', 'max_nodes', 'nodes', 'reused_nodes', 'truncated',
+                              'elapsed_ms', 'errors', 'pruned_subtrees'}
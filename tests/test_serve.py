@@ -0,0 +1,78 @@
+import io
+import json
+
+from axcore.fake import FakeControl, FakeDesktop, build_fake_tree
+from axcore.serve import parse_request, serve
+from uia_extractors import TreeSession
+
+
+def make_session():
+    window = build_fake_tree(depth=3, fanout=2, name='win')
+    hidden = FakeControl(name='hidden', control_type='Window', visible=False)
+    button = FakeControl(name='OK', control_type='Button', rect=(10, 20, 50, 40))
+    return TreeSession(FakeDesktop([window, hidden]), lambda: button, lambda x, y: button)
+
+
+def run(session, *lines):
+    handlers = {
+        'snapshot': session.windows_tree,
+        'focused': session.focused,
+        'point': session.point,
+    }
+    out = io.StringIO()
+    served = serve(handlers, stdin=[line + '\n' for line in lines], stdout=out)
+    return served, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_parse_request_accepts_text_and_json():
+    assert parse_request('point 3, 4') == {'cmd': 'point', 'x': 3, 'y': 4}
+    assert parse_request('snapshot') == {'cmd': 'snapshot'}
+    assert parse_request('{"id": 7, "cmd": "focused"}') == {'id': 7, 'cmd': 'focused'}
+
+
+def test_serve_answers_each_command_with_timing():
+    session = make_session()
+    try:
+        served, responses = run(session, 'snapshot', '{"id": 2, "cmd": "focused"}', 'point 15,25')
+    finally:
+        session.close()
+
+    assert served == 3
+    snapshot, focused, point = responses
+    assert all(r['ok'] and r['duration'] >= 0 for r in responses)
+
+    assert [w['name'] for w in snapshot['result']] == ['win']
+    assert len(snapshot['result'][0]['children']) == 2
+
+    assert focused['id'] == 2
+    assert focused['result']['name'] == 'OK'
+    assert focused['result']['bbox'] == {'x': 10, 'y': 20, 'width': 40, 'height': 20}
+
+    assert point['result']['position'] == {'x': 15, 'y': 25}
+    assert point['result']['element']['role'] == 'Button'
+
+
+def test_serve_reports_errors_and_stops_on_quit():
+    session = make_session()
+    try:
+        served, responses = run(session, 'bogus', 'point x', 'quit', 'snapshot')
+    finally:
+        session.close()
+
+    assert served == 2
+    assert responses[0] == {'cmd': 'bogus', 'ok': False, 'error': 'ValueError: Unknown command: bogus',
+                            'duration': responses[0]['duration']}
+    assert not responses[1]['ok'] and responses[1]['error'].startswith('Bad request')
+
+
+def test_session_reuses_executor_across_snapshots():
+    session = make_session()
+    try:
+        executor = session.executor
+        first = session.windows_tree()
+        second = session.windows_tree()
+    finally:
+        session.close()
+
+    assert first == second
+    assert session.executor is executor
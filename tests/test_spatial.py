@@ -0,0 +1,155 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+
+from axcore.fake import FakeControl, FakeDesktop
+from axcore.serve import parse_request
+from axcore.spatial import SpatialIndex
+from uia_extractors import TreeSession
+
+
+def node(name, bbox, children=(), **extra):
+    return dict(name=name, role='Pane', description='', value='',
+                bbox=dict(zip(('x', 'y', 'width', 'height'), bbox)), children=list(children), **extra)
+
+
+def random_tree(rng, depth=4, box=(0, 0, 1920, 1080)):
+    x, y, w, h = box
+    children = []
+    if depth > 1:
+        for _ in range(rng.randrange(5)):
+            cw, ch = rng.randrange(0, w + 1), rng.randrange(0, h + 1)
+            # Children may spill outside their parent, as offscreen UIA elements do
+            cx, cy = x + rng.randrange(-20, w + 1), y + rng.randrange(-20, h + 1)
+            children.append(random_tree(rng, depth - 1, (cx, cy, cw, ch)))
+    return node(f"n{rng.random():.6f}", box, children)
+
+
+def brute_force_hit(tree, x, y):
+    best = None
+    for rank, window in enumerate(tree):
+        stack = [(window, 0)]
+        order = []
+        while stack:
+            n, depth = stack.pop()
+            order.append((n, depth))
+            stack.extend((c, depth + 1) for c in reversed(n['children']))
+        for preorder, (n, depth) in enumerate(order):
+            b = n['bbox']
+            if b['width'] > 0 and b['height'] > 0 and b['x'] <= x < b['x'] + b['width'] and b['y'] <= y < b['y'] + b['height']:
+                key = (-rank, depth, preorder)
+                if best is None or key > best[0]:
+                    best = (key, n)
+    return best[1] if best else None
+
+
+def test_hits_match_brute_force_with_window_stacking():
+    rng = random.Random(5)
+    tree = [random_tree(rng, box=(rng.randrange(-500, 1500), rng.randrange(0, 800), 900, 700)) for _ in range(6)]
+    index = SpatialIndex(tree, cell_size=50)
+
+    for _ in range(2000):
+        x, y = rng.randrange(-600, 2600), rng.randrange(-100, 1700)
+        assert index.hit(x, y) is brute_force_hit(tree, x, y)
+
+
+def test_z_order_depth_and_visibility():
+    back = node('back', (0, 0, 400, 400), [node('back button', (10, 10, 50, 20))])
+    front = node('front', (100, 0, 200, 200), [
+        node('panel', (100, 0, 200, 200), [node('hidden', (120, 10, 40, 40), states={'visible': False})]),
+        node('overlay', (100, 0, 200, 100)),
+    ])
+    index = SpatialIndex([front, back])
+
+    assert index.hit(20, 15)['name'] == 'back button'
+    assert index.hit(130, 20)['name'] == 'overlay'      # later sibling drawn on top
+    assert index.hit(130, 150)['name'] == 'panel'       # deepest containing node
+    assert index.hit(350, 350)['name'] == 'back'
+    assert index.hit(500, 500) is None
+    assert SpatialIndex([front, back], window_order=[1, 0]).hit(130, 150)['name'] == 'back'
+
+    hit = index.hit_index(130, 20)
+    assert [index.nodes[i]['name'] for i in index.ancestors(hit)] == ['front', 'overlay']
+    assert [n['name'] for n in index.intersecting(0, 0, 105, 12)] == ['front', 'panel', 'overlay', 'back', 'back button']
+
+
+def test_session_answers_point_and_rect_queries_from_last_snapshot():
+    calls = []
+    windows = [
+        FakeControl('Editor', 'Window', rect=(0, 0, 800, 600), handle=1,
+                    children=[FakeControl('Save', 'Button', rect=(10, 10, 60, 30))]),
+        FakeControl('Desktop', 'Pane', rect=(0, 0, 1920, 1080), handle=2),
+    ]
+    session = TreeSession(FakeDesktop(windows), None, lambda x, y: calls.append((x, y)), spatial=True)
+    try:
+        session.windows_tree()
+        assert session.indexed_point(20, 20)['element']['name'] == 'Save'
+        assert [n['name'] for n in session.indexed_point(20, 20)['element']['ancestors']] == ['Editor']
+        assert session.indexed_point(5, 5)['element']['children'] == []
+        assert session.indexed_point(5, 5, max_depth=0)['element']['children'][0]['name'] == 'Save'
+        assert session.indexed_point(1000, 20)['element']['name'] == 'Desktop'
+        assert [n['name'] for n in session.rect(700, 500, 200, 200)] == ['Editor', 'Desktop']
+        assert 'children' not in session.rect(0, 0, 1, 1)[0]
+    finally:
+        session.close()
+    assert calls == []
+
+    assert parse_request('rect 0, 10,200,100') == {'cmd': 'rect', 'x': 0, 'y': 10, 'width': 200, 'height': 100}
+    assert parse_request('hit 5,6') == {'cmd': 'hit', 'x': 5, 'y': 6}
+
+
+class GatedControl(FakeControl):
+    """FakeControl whose children are only listed once `gate` is set"""
+
+    def __init__(self, *args, gate, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gate = gate
+
+    def children(self):
+        assert self.gate.wait(5)
+        return super().children()
+
+
+class SignallingControl(FakeControl):
+    def __init__(self, *args, signal, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.signal = signal
+
+    def children(self):
+        self.signal.set()
+        return super().children()
+
+
+def test_windows_are_output_in_z_order_when_walks_finish_out_of_order():
+    back_walked = threading.Event()
+    windows = [
+        GatedControl('Front', 'Window', rect=(0, 0, 800, 600), handle=1, gate=back_walked,
+                     children=[FakeControl('OK', 'Button', rect=(10, 10, 60, 30))]),
+        SignallingControl('Back', 'Window', rect=(0, 0, 1920, 1080), handle=2, signal=back_walked,
+                          children=[FakeControl('Cancel', 'Button', rect=(10, 10, 60, 30))]),
+    ]
+    session = TreeSession(FakeDesktop(windows), None, None, max_workers=2)
+    try:
+        tree = session.windows_tree()
+    finally:
+        session.close()
+
+    # The back window's walk completes first, but saved output keeps the stacking
+    assert [w['name'] for w in tree] == ['Front', 'Back']
+    assert SpatialIndex(json.loads(json.dumps(tree))).hit(20, 20)['name'] == 'OK'
+
+
+def test_cli_labels_points_in_saved_json(tmp_path):
+    source = tmp_path / 'mac.json'
+    app = node('Finder', (0, 0, 0, 0), [node('Window on display 0', (0, 25, 1440, 875))])
+    source.write_text(json.dumps({'time': 1, 'data': {'duration': 2, 'tree': [app]}}))
+
+    result = subprocess.run([sys.executable, '-m', 'axcore.spatial', str(source), '10,30', '10,10'],
+                            check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [n['name'] for n in lines[0]['path']] == ['Finder', 'Window on display 0']
+    assert lines[1] == {'position': {'x': 10, 'y': 10}, 'path': []}
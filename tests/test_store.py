@@ -0,0 +1,72 @@
+import copy
+
+import pytest
+
+from axcore.fake import SyntheticProvider
+from axcore.store import SnapshotStore, hash_tree, subtree_digest
+from axcore.walker import walk_tree
+
+
+def window(name, rows=3):
+    toolbar = {'role': 'ToolBar', 'name': 'Standard', 'bbox': {'x': 0, 'y': 0, 'width': 800, 'height': 30},
+               'children': [{'role': 'Button', 'name': label, 'children': []} for label in ('Back', 'Forward')]}
+    items = [{'role': 'ListItem', 'name': f'Row {i}', 'children': []} for i in range(rows)]
+    return {'role': 'Window', 'name': name, 'bbox': {'x': 0, 'y': 0, 'width': 800, 'height': 600},
+            'children': [toolbar, {'role': 'List', 'name': '', 'children': items}]}
+
+
+def test_snapshots_round_trip_in_every_output_shape(tmp_path):
+    event = {'time': 1700000000000, 'data': {'duration': 52, 'tree': [window('Mail'), window('Notes')],
+                                             'focused': {'role': 'Edit', 'name': 'To'}}}
+    plain = [window('Mail')]
+    document = {'tree': [window('Notes', rows=0)], 'focused': None}
+
+    with SnapshotStore(str(tmp_path / 'session.db')) as store:
+        ids = [store.add(output)[0] for output in (event, plain, document)]
+        assert [row[:2] for row in store.snapshots()] == [(ids[0], 1700000000000), (ids[1], None), (ids[2], None)]
+    assert event['data']['tree'][0]['name'] == 'Mail'  # the output is left untouched
+
+    with SnapshotStore(str(tmp_path / 'session.db')) as store:
+        assert [store.snapshot(i) for i in ids] == [event, plain, document]
+        assert store.snapshots(start=1700000000000) == store.snapshots()[:1]
+
+
+def test_identical_subtrees_are_stored_once():
+    store = SnapshotStore(':memory:')
+    first = [window('Mail'), window('Notes')]
+    second = copy.deepcopy(first)
+    second[1]['children'][1]['children'][2]['name'] = 'Row 2 (unread)'
+
+    root_a, nodes = store.put_tree(first)
+    root_b, _ = store.put_tree(second)
+    assert nodes == 2 * 8
+    # Window, toolbar (3 nodes), list and rows of Mail; Notes adds its window only, then the root.
+    # The second snapshot adds the changed row, its list, window and root
+    assert store.stats()['subtrees'] == 8 + 1 + 1 + 4
+
+    assert store.children(root_a)[0] == store.children(root_b)[0] == subtree_digest(first[0])
+    toolbar = store.children(subtree_digest(first[0]))[0]
+    assert store.subtree(toolbar) == first[0]['children'][0]
+    assert store.subtree(root_b) == second
+
+
+def test_digests_depend_on_content_and_child_order():
+    tree = [window('Mail')]
+    reordered = copy.deepcopy(tree)
+    reordered[0]['children'].reverse()
+    assert hash_tree(tree)[0] == hash_tree(copy.deepcopy(tree))[0]
+    assert hash_tree(tree)[0] != hash_tree(reordered)[0]
+    assert subtree_digest({'role': 'A', 'children': [{'role': 'B', 'children': []}]}) != \
+        subtree_digest({'role': 'A', 'children': []})
+
+
+def test_deep_trees_and_missing_digests():
+    store = SnapshotStore(':memory:')
+    provider = SyntheticProvider(depth=4, fanout=5)
+    tree = [walk_tree(provider, provider.root)]
+    snapshot_id, root = store.add(tree)
+    assert store.snapshot(snapshot_id) == tree
+    with pytest.raises(KeyError):
+        store.subtree('00' * 16)
+    with pytest.raises(KeyError):
+        store.snapshot(snapshot_id + 1)
@@ -0,0 +1,83 @@
+from axcore.fake import FakeDesktop, SyntheticProvider, build_fake_tree
+from axcore.visibility import ScreenLayout, VisibilityFilter, covered, subtract
+from axcore.walker import WalkStats, walk_tree
+from uia_extractors import TreeSession
+
+SCREEN = (0, 0, 640, 1080)
+
+
+def bbox(x, y, width, height):
+    return {'x': x, 'y': y, 'width': width, 'height': height}
+
+
+def visible_only(node, keep):
+    """Copy of node without the subtrees of the nodes keep() rejects"""
+    return dict(node, children=[visible_only(child, keep) for child in node['children'] if keep(child)])
+
+
+def test_rectangles_are_covered_only_by_their_union():
+    assert subtract((0, 0, 10, 10), (20, 20, 5, 5)) == [(0, 0, 10, 10)]
+    assert sorted(subtract((0, 0, 10, 10), (2, 2, 6, 6))) == [(0, 0, 10, 2), (0, 2, 2, 6), (0, 8, 10, 2),
+                                                               (8, 2, 2, 6)]
+    assert covered((10, 10, 100, 50), [(0, 0, 60, 100), (60, 0, 60, 100)])
+    assert not covered((10, 10, 100, 50), [(0, 0, 60, 100), (61, 0, 60, 100)])
+
+
+def test_filter_reasons():
+    prune = VisibilityFilter([SCREEN, (640, 0, 1920, 1080)], occluders=[(0, 0, 300, 300)])
+    assert prune.reason(bbox(10, 10, 0, 40)) == 'empty'
+    assert prune.reason(bbox(-500, 0, 400, 40)) == 'offscreen'
+    assert prune.reason(bbox(2600, 0, 100, 40)) == 'offscreen'
+    assert prune.reason(bbox(20, 20, 100, 40)) == 'occluded'
+    assert prune.reason(bbox(250, 20, 100, 40)) is None
+    assert prune.reason(None) is None
+
+
+def test_layout_occludes_with_the_windows_in_front_only():
+    layout = ScreenLayout([SCREEN], [('front', (0, 0, 300, 300)), ('back', (0, 0, 640, 600))])
+    assert layout.filter('front').occluders == []
+    assert layout.filter('back').occluders == [(0, 0, 300, 300)]
+    assert layout.filter('unknown').occluders == []
+
+
+def test_offscreen_subtrees_are_not_walked():
+    provider = SyntheticProvider(depth=4, fanout=6)
+    full = walk_tree(provider, provider.root)
+    provider.calls.clear()
+
+    stats = WalkStats()
+    pruned = walk_tree(provider, provider.root, stats=stats, prune=VisibilityFilter([SCREEN]))
+
+    # Elements at x >= 640 (index % 64 >= 32) are off the display; their subtrees are never read:
+    # 4 of the 36 elements at depth 2, and 96 of the 192 children of the other 32
+    assert pruned == visible_only(full, lambda node: node['bbox']['x'] < 640)
+    assert (stats.nodes, stats.pruned) == (1 + 6 + 36 + 192, 4 + 96)
+    assert provider.calls['children'] == stats.nodes - stats.pruned
+
+
+def test_stubs_keep_the_pruned_element_and_its_child_count():
+    provider = SyntheticProvider(depth=4, fanout=6)
+    tree = walk_tree(provider, provider.root, prune=VisibilityFilter([SCREEN], stubs=True))
+
+    stubs = [node for node in tree['children'][5]['children'] if 'pruned' in node]
+    assert [(node['bbox']['x'], node['pruned'], node['child_count'], node['children']) for node in stubs] == [
+        (640, 'offscreen', 6, []), (660, 'offscreen', 6, []), (680, 'offscreen', 6, []), (700, 'offscreen', 6, [])]
+
+
+def test_session_prunes_windows_behind_the_foreground_window():
+    front = build_fake_tree(2, 3, rect=(0, 0, 500, 500), handle=1)
+    back = build_fake_tree(3, 3, name='back', rect=(100, 100, 300, 300), handle=2)
+    session = TreeSession(FakeDesktop([front, back]), None, None, displays=lambda: [(0, 0, 1920, 1080)],
+                          prune_stubs=True, incremental=True)
+    try:
+        trees = {tree['name']: tree for tree in session.windows_tree()}
+        assert trees['back']['pruned'] == 'occluded' and trees['back']['child_count'] == 3
+        assert len(trees['node']['children']) == 3
+        assert {r['key']: r['pruned_subtrees'] for r in session.last_report} == {'1': 0, '2': 1}
+
+        # Moving the front window away re-walks the back window instead of reusing its stub
+        front._rect = (1000, 0, 1500, 500)
+        trees = {tree['name']: tree for tree in session.windows_tree()}
+        assert 'pruned' not in trees['back'] and len(trees['back']['children']) == 3
+    finally:
+        session.close()
@@ -0,0 +1,217 @@
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from axcore.fake import FAKE_CONTROL_TYPES, FakeControl, FakeDesktop, SyntheticProvider, build_fake_tree
+from axcore.scheduler import fixed_budgets
+from axcore.walker import CountingProvider, Deadline, Provider, WalkStats, count_nodes, walk_tree
+from uia_extractors import (STATE_CHECKS, CachedUIAProvider, ControlCapabilities, TreeSession, UIAProvider,
+                            get_control_states, get_element_info, get_element_info_cached, get_windows_tree,
+                            parse_fields, window_key)
+
+UIA_IsTogglePatternAvailablePropertyId = 30041
+
+
+class BrokenProvider(SyntheticProvider):
+    def bounds(self, element):
+        raise OSError('element gone')
+
+    def children(self, element):
+        if element == (1, 1):
+            raise OSError('children gone')
+        return super().children(element)
+
+
+def test_walk_tree_visits_every_node_breadth_first():
+    provider = SyntheticProvider(depth=4, fanout=3)
+    tree = walk_tree(provider, provider.root)
+
+    assert count_nodes(tree) == provider.size == 40
+    assert provider.calls['children'] == provider.size
+    assert list(tree) == ['name', 'role', 'description', 'value', 'bbox', 'states', 'children']
+    assert [c['name'] for c in tree['children']] == ['Element 1.0', 'Element 1.1', 'Element 1.2']
+
+
+def test_walk_tree_honours_max_depth():
+    provider = SyntheticProvider(depth=5, fanout=2)
+    tree = walk_tree(provider, provider.root, max_depth=2)
+
+    assert count_nodes(tree) == 3
+    assert provider.calls['children'] == 1
+
+
+def ticking_clock(step=1.0):
+    """Clock that advances by step on every read"""
+    now = [0.0]
+
+    def clock():
+        now[0] += step
+        return now[0]
+    return clock
+
+
+def test_walk_tree_returns_partial_tree_when_deadline_expires():
+    provider = SyntheticProvider(depth=6, fanout=3)
+    stats = WalkStats()
+    # The clock reads 1 at creation, then once per check after the root
+    tree = walk_tree(provider, provider.root, deadline=Deadline(5.5, clock=ticking_clock()), stats=stats)
+
+    assert stats.truncated and stats.nodes == 6
+    assert count_nodes(tree) == 6
+    assert tree['truncated'] is True
+    assert tree['node_count'] == 6
+    assert tree['elapsed_ms'] == 7000
+    assert provider.calls['children'] == 6
+
+
+def test_walk_tree_always_keeps_the_root():
+    provider = SyntheticProvider(depth=3, fanout=2)
+    tree = walk_tree(provider, provider.root, deadline=Deadline(0))
+
+    assert tree['children'] == [] and tree['truncated'] and tree['node_count'] == 1
+
+
+def test_untruncated_walk_has_no_truncation_fields():
+    provider = SyntheticProvider(depth=3, fanout=2)
+    tree = walk_tree(provider, provider.root, deadline=Deadline(60))
+
+    assert 'truncated' not in tree and 'node_count' not in tree
+
+
+def test_windows_tree_truncates_slow_windows_without_extra_threads():
+    slow = build_fake_tree(depth=8, fanout=3, name='slow')
+    fast = build_fake_tree(depth=2, fanout=2, name='fast')
+    threads_before = threading.active_count()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tree = get_windows_tree(fixed_budgets([slow, fast], 0.001, window_key), executor)
+        threads_during = threading.active_count()
+
+    by_name = {w['name']: w for w in tree}
+    assert by_name['slow']['truncated'] and by_name['slow']['node_count'] < 3280
+    assert count_nodes(by_name['fast']) <= 3
+    assert threads_during - threads_before == 1
+
+
+def test_walk_tree_substitutes_defaults_on_provider_errors(capsys):
+    provider = BrokenProvider(depth=3, fanout=2)
+    tree = walk_tree(provider, provider.root)
+
+    assert tree['bbox'] == {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+    assert count_nodes(tree) == 5
+    assert tree['children'][1]['children'] == []
+    assert 'children gone' in capsys.readouterr().err
+
+
+def test_base_provider_omits_states():
+    assert walk_tree(Provider(), object()) == {
+        'name': '', 'role': '', 'description': '', 'value': '',
+        'bbox': {'x': 0, 'y': 0, 'width': 0, 'height': 0}, 'children': []
+    }
+
+
+def test_get_element_info_uses_walker_on_uia_wrappers():
+    control = build_fake_tree(depth=3, fanout=2)
+    control._children.append(FakeControl(name='Ok', control_type='Button', rect=(5, 5, 25, 15), value='42'))
+    info = get_element_info(control)
+
+    assert count_nodes(info) == 8
+    ok = info['children'][-1]
+    assert ok['value'] == '42'
+    assert ok['bbox'] == {'x': 5, 'y': 5, 'width': 20, 'height': 10}
+    assert ok['states'] == {'enabled': True, 'visible': True}
+
+
+class FakeCacheRequest:
+    TreeFilter = None
+
+
+def test_cached_strategy_fetches_children_in_one_call_per_element():
+    live_calls = Counter()
+    control = build_fake_tree(depth=4, fanout=3, calls=live_calls)
+    per_property = get_element_info(control)
+    per_property_calls = sum(live_calls.values())
+
+    cached_calls = Counter()
+    control = build_fake_tree(depth=4, fanout=3, calls=cached_calls)
+    provider = CachedUIAProvider(FakeCacheRequest(), FAKE_CONTROL_TYPES)
+    cached = get_element_info_cached(control, provider)
+
+    assert count_nodes(cached) == count_nodes(per_property) == 40
+    assert per_property_calls >= 40 * 4
+    assert cached_calls['BuildUpdatedCache'] == 1 and cached_calls['FindAllBuildCache'] == 40
+    assert set(cached_calls) == {'BuildUpdatedCache', 'FindAllBuildCache', 'GetCachedPropertyValue'}
+    assert cached['children'][0]['name'] == per_property['children'][0]['name'] == 'node.0'
+    assert cached['role'] == per_property['role'] == 'Pane'
+    assert cached['bbox'] == per_property['bbox']
+
+    # The node budget stops the fetches too, not just the walk over fetched elements
+    cached_calls.clear()
+    stats = WalkStats()
+    truncated = get_element_info_cached(control, provider, max_nodes=5, stats=stats)
+    assert truncated['truncated'] and stats.nodes == 5
+    assert cached_calls['FindAllBuildCache'] == 5
+
+
+def test_fields_limit_the_attributes_read():
+    provider = SyntheticProvider(depth=3, fanout=2)
+    provider.fields = parse_fields('bbox, name')
+    counting = CountingProvider(provider)
+    tree = walk_tree(counting, provider.root)
+
+    assert list(tree) == ['name', 'bbox', 'children'] and count_nodes(tree) == 7
+    assert set(counting.calls) == {'name', 'bounds', 'children'}
+    assert set(counting.report()) == set(counting.calls)
+    assert sum(entry['calls'] for entry in counting.report(reset=True).values()) == 21
+    assert counting.report() == {}
+
+
+class ToggleControl(FakeControl):
+    def is_checked(self):
+        self.calls['is_checked'] += 1
+        if UIA_IsTogglePatternAvailablePropertyId not in self.patterns:
+            raise RuntimeError('toggle pattern not supported')
+        return True
+
+
+def test_capabilities_skip_getters_whose_pattern_the_control_type_lacks():
+    calls = Counter()
+    panes = [ToggleControl(f'pane {i}', 'Pane', calls=calls, patterns=set()) for i in range(20)]
+    boxes = [ToggleControl(f'box {i}', 'CheckBox', calls=calls, patterns={UIA_IsTogglePatternAvailablePropertyId})
+             for i in range(5)]
+    window = ToggleControl('window', 'Window', calls=calls, children=panes + boxes, patterns=set())
+    capabilities = ControlCapabilities(probe=2)
+    tree = walk_tree(UIAProvider(capabilities=capabilities), window)
+
+    assert calls['is_checked'] == 5  # the checkboxes only
+    assert calls['GetCurrentPropertyValue'] == 7 * (1 + 2 + 2)  # probed controls of 3 types
+    assert tree['children'][0]['states'] == get_control_states(panes[0]) == {'enabled': True, 'visible': True}
+    assert tree['children'][-1]['states'] == get_control_states(boxes[0], STATE_CHECKS)
+    assert capabilities.report()['CheckBox/ToggleControl'] == ['enabled', 'visible', 'checked']
+
+    # Controls that cannot report patterns get every getter
+    assert ControlCapabilities().getters(FakeControl())[0] == STATE_CHECKS
+
+
+def test_session_reports_calls_and_time_per_field():
+    calls = Counter()
+    window = build_fake_tree(depth=3, fanout=3, calls=calls)
+    session = TreeSession(FakeDesktop([window]), lambda: window, lambda x, y: window,
+                          fields=parse_fields('name,role,bbox'), field_stats=True)
+    try:
+        [tree] = session.windows_tree()
+    finally:
+        session.close()
+
+    assert list(tree) == ['name', 'role', 'bbox', 'children']
+    assert calls['get_value'] == calls['is_enabled'] == 0
+    assert set(session.last_fields) == {'name', 'role', 'bbox', 'children'}
+    assert session.last_fields['bbox']['calls'] == 13 and session.last_fields['bbox']['ms'] >= 0
+
+
+def test_strings_are_cleaned_as_nodes_are_read():
+    window = FakeControl('Résumé \ud83d 文件\x00', 'Window', value='line\tone\nline two\x1b')
+    node = walk_tree(UIAProvider(), window)
+    assert (node['name'], node['value']) == ('Résumé  文件', 'line\tone\nline two')
+    node.pop('children')
+    json.dumps(node, ensure_ascii=False).encode('utf-8')
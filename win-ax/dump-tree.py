@@ -1,106 +1,34 @@
 import argparse
+import ctypes
+import multiprocessing
+import os
 import sys
 import time
 import pywinauto
 from pywinauto.application import Application
 from pywinauto import Desktop
-import json
-import threading
-from functools import wraps
-import atexit
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import win32gui
 import win32api
+import win32con
 from ctypes.wintypes import tagPOINT
 
-# Track active threads for cleanup
-active_threads = []
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-def cleanup_threads():
-    """Clean up any active threads on program exit"""
-    for thread in active_threads:
-        if thread.is_alive():
-            thread.join(0)  # Non-blocking join
-
-atexit.register(cleanup_threads)
-
-def timeout(seconds):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            result = [TimeoutError('Timed out')]
-            def worker():
-                try:
-                    result[0] = func(*args, **kwargs)
-                except Exception as e:
-                    result[0] = e
-            thread = threading.Thread(target=worker)
-            thread.daemon = True
-            active_threads.append(thread)
-            thread.start()
-            thread.join(seconds)
-            if thread in active_threads:
-                active_threads.remove(thread)
-            if isinstance(result[0], Exception):
-                raise result[0]
-            return result[0]
-        return wrapper
-    return decorator
-
-def get_control_value(control):
-    """Get control value trying multiple methods"""
-    value = ''
-    
-    # Try different value getters
-    value_getters = [
-        lambda: control.get_value(),
-        lambda: control.value(),
-        lambda: control.get_position(),
-        lambda: control.window_text() if control.window_text() != control.element_info.name else ''
-    ]
-    
-    for getter in value_getters:
-        try:
-            val = getter()
-            if val:
-                value = str(val)
-                break
-        except:
-            continue
-            
-    return value
-
-def get_control_states(control):
-    """Get all available control states"""
-    states = {}
-    
-    state_checks = [
-        ("enabled", "is_enabled"),
-        ("visible", "is_visible"),
-        ("focused", "is_focused"),
-        ("minimized", "is_minimized"),
-        ("maximized", "is_maximized"),
-        ("collapsed", "is_collapsed"),
-        ("expanded", "is_expanded"),
-        ("selected", "is_selected"),
-        ("checked", "is_checked"),
-        ("checkable", "is_checkable"),
-        ("editable", "is_editable"),
-        ("pressable", "is_pressable"),
-        ("pressed", "is_pressed"),
-        ("keyboard_focusable", "is_keyboard_focusable"),
-        ("keyboard_focused", "is_keyboard_focused"),
-        ("selection_required", "is_selection_required")
-    ]
-    
-    for state_name, func_name in state_checks:
-        try:
-            if hasattr(control, func_name):
-                states[state_name] = getattr(control, func_name)()
-        except:
-            continue
-            
-    return states
+from axcore.coalesce import EventCoalescer
+from axcore.columnar import save_columns, to_columns
+from axcore.compact import write_compact
+from axcore.events import UIEvent
+from axcore.jsonstream import COMPACT_SEPARATORS, write_json
+from axcore.metrics import Metrics, profiled, write_metrics
+from axcore.serve import serve
+from axcore.store import SnapshotStore
+from axcore.patch import EventLogWriter
+from axcore.procwalk import ProcessWalker
+from axcore.scheduler import SizeHistory
+from axcore.walker import FIELDS
+from uia_extractors import (TreeSession, CachedUIAProvider, UIAProvider, UIA_PROVIDER, WATCHED_PROPERTIES,
+                            create_cache_request, get_element_info, get_element_info_cached, parse_fields,
+                            property_event)
 
 # warning: this seems to modify window focus
 def get_control_properties(control):
@@ -163,140 +91,121 @@ def get_control_properties(control):
             
     return props
 
-def get_element_info(control, executor=None, path=''):
-    """Get comprehensive element information using a queue-based approach"""
-    from collections import deque
-    
-    try:
-        # Initialize queue and result tree
-        queue = deque([(control, None)])  # (control, parent_id) pairs
-        elements = {}
-        next_id = 0
-        
-        while queue:
-            current_control, parent_id = queue.popleft()
-            current_id = next_id
-            next_id += 1
-            
-            try:
-                # Get basic info
-                try:
-                    rect = current_control.rectangle()
-                    bbox = {
-                        "x": rect.left,
-                        "y": rect.top,
-                        "width": rect.width(),
-                        "height": rect.height()
-                    }
-                except Exception as e:
-                    print(f"Error getting rectangle: {e}", file=sys.stderr)
-                    bbox = {"x": 0, "y": 0, "width": 0, "height": 0}
-                
-                # Build element info
-                element = {
-                    "name": current_control.element_info.name or '',
-                    "role": current_control.element_info.control_type or '',
-                    "description": getattr(current_control.element_info, 'description', ''),
-                    "value": get_control_value(current_control),
-                    "bbox": bbox,
-                    "states": get_control_states(current_control),
-                    "children": []
-                }
-                
-                # Store element and update parent's children list
-                elements[current_id] = element
-                if parent_id is not None:
-                    elements[parent_id]["children"].append(element)
-                
-                # Add children to queue
-                try:
-                    children = current_control.children()
-                    for child in children:
-                        queue.append((child, current_id))
-                except Exception as e:
-                    print(f"Error processing children: {e}", file=sys.stderr)
-                    
-            except Exception as e:
-                print(f"Error processing control: {e}", file=sys.stderr)
-                continue
-        
-        # Return root element if we processed anything
-        return elements[0] if elements else None
-        
-    except Exception as e:
-        print(f"Error in get_element_info: {e}", file=sys.stderr)
-        return None
+def wrap_element(element):
+    """Wrap a raw IUIAutomationElement"""
+    element_info = pywinauto.uia_element_info.UIAElementInfo(element)
+    return pywinauto.controls.uiawrapper.UIAWrapper(element_info)
 
-def get_all_windows_accessibility_tree(timeout_seconds=5, max_workers=None):
-    """Get accessibility tree using Desktop to enumerate windows"""
-    try:
-        desktop = Desktop(backend="uia")
-        tree = []
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
-            for window in desktop.windows():
-                if not window.is_visible():
-                    continue
-                    
-                @timeout(timeout_seconds)
-                def process_window(w):
-                    return get_element_info(w)
-                
-                try:
-                    futures.append(executor.submit(process_window, window))
-                except Exception as e:
-                    print(f"Error submitting window task: {e}", file=sys.stderr)
-            
-            for future in as_completed(futures):
-                try:
-                    window_info = future.result()
-                    if window_info:
-                        tree.append(window_info)
-                except TimeoutError:
-                    print(f"Timeout processing window after {timeout_seconds} seconds", file=sys.stderr)
-                except Exception as e:
-                    print(f"Error processing window: {e}", file=sys.stderr)
-        
-        return tree
-    except Exception as e:
-        print(f"Error getting desktop windows: {e}", file=sys.stderr)
-        return []
+def get_focused_wrapper():
+    """Wrap the currently focused UIA element"""
+    return wrap_element(pywinauto.uia_defines.IUIA().iuia.GetFocusedElement())
 
-def get_focused_element():
-    """Get the currently focused element"""
-    try:
-        focused = pywinauto.uia_defines.IUIA().iuia.GetFocusedElement()
-        element_info = pywinauto.uia_element_info.UIAElementInfo(focused)
-        wrapper = pywinauto.controls.uiawrapper.UIAWrapper(element_info)
-        return get_element_info(wrapper)
-    except:
-        print("Failed to get focused element", file=sys.stderr)
-        return None
+def get_wrapper_at_position(x, y):
+    """Wrap the UIA element at specific screen coordinates"""
+    return wrap_element(pywinauto.uia_defines.IUIA().iuia.ElementFromPoint(tagPOINT(x, y)))
 
-def get_element_at_position(x, y):
-    """Get element at specific screen coordinates"""
-    try:
-        elem = pywinauto.uia_defines.IUIA().iuia.ElementFromPoint(tagPOINT(x, y))
-        element_info = pywinauto.uia_element_info.UIAElementInfo(elem)
-        wrapper = pywinauto.controls.uiawrapper.UIAWrapper(element_info)
-        return {
-            "position": {"x": x, "y": y},
-            "element": get_element_info(wrapper)
-        }
-    except:
-        print(f"Failed to get element at ({x}, {y})", file=sys.stderr)
-        return {
-            "position": {"x": x, "y": y},
-            "element": None
-        }
+def subscribe_uia_events(callback):
+    """
+    Register structure, property and focus changed handlers on the desktop and
+    pass every event to callback as a UIEvent (on UIA's event threads).
+    Returns a callable removing the handlers.
+    """
+    import comtypes
+
+    iuia = pywinauto.uia_defines.IUIA()
+    uia = iuia.UIA_dll
+
+    class EventHandler(comtypes.COMObject):
+        _com_interfaces_ = [uia.IUIAutomationStructureChangedEventHandler,
+                            uia.IUIAutomationPropertyChangedEventHandler,
+                            uia.IUIAutomationFocusChangedEventHandler]
+
+        def HandleStructureChangedEvent(self, sender, change_type, runtime_id):
+            callback(UIEvent(UIEvent.STRUCTURE, wrap_element(sender)))
+
+        def HandlePropertyChangedEvent(self, sender, property_id, new_value):
+            callback(property_event(wrap_element(sender), property_id, new_value))
+
+        def HandleFocusChangedEvent(self, sender):
+            callback(UIEvent(UIEvent.FOCUS, wrap_element(sender)))
+
+    handler = EventHandler()
+    properties = (ctypes.c_int * len(WATCHED_PROPERTIES))(*WATCHED_PROPERTIES)
+    iuia.iuia.AddStructureChangedEventHandler(iuia.root, uia.TreeScope_Subtree, None, handler)
+    iuia.iuia.AddPropertyChangedEventHandlerNativeArray(iuia.root, uia.TreeScope_Subtree, None, handler,
+                                                        properties, len(WATCHED_PROPERTIES))
+    iuia.iuia.AddFocusChangedEventHandler(None, handler)
+    return iuia.iuia.RemoveAllEventHandlers
 
-def get_cursor_element():
+class UIAWindowWalker:
+    """
+    Worker-process side of --processes: its own UIA client walking
+    top-level windows by native handle (see axcore/procwalk.py)
+    """
+
+    def __init__(self, fields=None, cached=False):
+        self.iuia = pywinauto.uia_defines.IUIA()
+        self.provider = UIAProvider(fields, UIA_PROVIDER.capabilities)
+        self.cached_provider = None
+        if cached:
+            self.cached_provider = CachedUIAProvider(create_cache_request(self.iuia.iuia),
+                                                     self.iuia.known_control_type_ids, fields)
+
+    def walk(self, key, deadline=None, max_nodes=None, stats=None, prune=None):
+        try:
+            control = wrap_element(self.iuia.iuia.ElementFromHandle(int(key)))
+        except Exception as e:
+            print(f"Failed to resolve window {key}: {e}", file=sys.stderr)
+            return None
+        if self.cached_provider is not None:
+            return get_element_info_cached(control, self.cached_provider, deadline, max_nodes, stats, prune=prune)
+        return get_element_info(control, deadline, max_nodes, stats, provider=self.provider, prune=prune)
+
+def get_priority_handles():
+    """Handles of the foreground window and the top-level window under the cursor"""
+    handles = {win32gui.GetForegroundWindow()}
+    hwnd = win32gui.WindowFromPoint(win32api.GetCursorPos())
+    if hwnd:
+        handles.add(win32gui.GetAncestor(hwnd, win32con.GA_ROOT))
+    return handles
+
+def get_display_rects():
+    """(x, y, width, height) of every monitor on the virtual screen"""
+    rects = []
+    for _, _, (left, top, right, bottom) in win32api.EnumDisplayMonitors():
+        rects.append((left, top, right - left, bottom - top))
+    return rects
+
+def is_opaque_window(window):
+    """Whether a top-level window hides what is behind it (not click-through or layered)"""
+    ex_style = win32gui.GetWindowLong(window.handle, win32con.GWL_EXSTYLE)
+    return not ex_style & (win32con.WS_EX_TRANSPARENT | win32con.WS_EX_LAYERED)
+
+def create_session(timeout=5, max_workers=None, cached=False, budget=None, stats_file=None, incremental=False,
+                   spatial=False, query_depth=1, query_nodes=None, query_ancestors=True, fields=None,
+                   field_stats=False, processes=None, prune=False, prune_stubs=False):
+    """Create the UIA desktop and worker pool used for extraction"""
+    cached_provider = process_walker = None
+    if processes:
+        process_walker = ProcessWalker(UIAWindowWalker, (fields, cached), processes)
+    if cached:
+        iuia = pywinauto.uia_defines.IUIA()
+        cached_provider = CachedUIAProvider(create_cache_request(iuia.iuia), iuia.known_control_type_ids, fields)
+    return TreeSession(Desktop(backend="uia"), get_focused_wrapper, get_wrapper_at_position,
+                       timeout_seconds=timeout, max_workers=max_workers, cached_provider=cached_provider,
+                       budget_seconds=budget, history=SizeHistory(stats_file),
+                       priority_windows=get_priority_handles, incremental=incremental, spatial=spatial,
+                       query_depth=query_depth, query_nodes=query_nodes, query_ancestors=query_ancestors,
+                       fields=fields, field_stats=field_stats, process_walker=process_walker,
+                       displays=get_display_rects if prune or prune_stubs else None, opaque=is_opaque_window,
+                       prune_stubs=prune_stubs)
+
+def get_cursor_element(point):
     """Get element under the cursor"""
     x, y = win32api.GetCursorPos()
-    return get_element_at_position(x, y)
+    return point(x, y)
 
-def get_random_screen_points():
+def get_random_screen_points(point):
     """Get two random points on the primary monitor"""
     monitor = win32api.GetMonitorInfo(win32api.MonitorFromPoint((0,0)))
     monitor_area = monitor.get("Monitor")
@@ -308,18 +217,37 @@ def get_random_screen_points():
     for _ in range(2):
         x = random.randint(0, width-1)
         y = random.randint(0, height-1)
-        points.append(get_element_at_position(x, y))
+        points.append(point(x, y))
     return points
 
-def save_accessibility_tree(output_file=None, timeout=5, max_workers=None, event_format=False):
+def build_snapshot(session, event_format=False, stream=False, offline_queries=False, metrics=None):
+    """
+    Collect the focused element, point queries and full window tree.
+
+    With stream=True the plain-format tree is a generator that walks windows
+    while the output is being written. Event output keeps a materialised
+    tree because its duration is serialised before the tree. With
+    offline_queries the tree is walked first and point queries are answered
+    from its spatial index (the session must have spatial=True). Phases are
+    timed into metrics (axcore.metrics.Metrics), which event output includes.
+    """
     start_time = int(time.time() * 1000)  # JS equivalent of timestamp_millis
+    metrics = metrics if metrics is not None else Metrics()
     
     # Get focused element
-    focused = get_focused_element()
+    with metrics.phase('focus'):
+        focused = session.focused(metrics=metrics)
+
+    point = lambda x, y: session.point(x, y, metrics=metrics)
+    if offline_queries:
+        with metrics.phase('walk'):
+            tree = session.windows_tree(metrics)
+        point = session.indexed_point
     
     # Get element queries
-    cursor = get_cursor_element()
-    random_points = get_random_screen_points()
+    with metrics.phase('points'):
+        cursor = get_cursor_element(point)
+        random_points = get_random_screen_points(point)
     
     # Combine all queries with enumerated random points
     queries = {
@@ -328,71 +256,168 @@ def save_accessibility_tree(output_file=None, timeout=5, max_workers=None, event
         "random2": random_points[1]
     }
 
-    # Get main tree last (slowest)
-    tree = get_all_windows_accessibility_tree(timeout, max_workers)
+    # Get main tree last (slowest), unless the queries were answered from it
+    if not offline_queries:
+        if stream and not event_format:
+            tree = metrics.timed('walk', session.iter_windows_tree(metrics))
+        else:
+            with metrics.phase('walk'):
+                tree = session.windows_tree(metrics)
     
     end_time = int(time.time() * 1000)
     duration = end_time - start_time
     
     if event_format:
-        output = {
+        event = {
             "time": start_time,
             "data": {
                 "duration": duration,
                 "tree": tree,
                 "focused_element": focused,
-                "queries": queries
+                "queries": queries,
+                "windows": session.last_report,
+                "metrics": metrics.as_dict()
             }
         }
-    else:
-        output = {
-            "tree": tree,
-            "focused_element": focused,
-            "queries": queries
-        }
-    
-    # Ensure all strings are properly encoded
-    def clean_string(s):
-        if isinstance(s, str):
-            return s.encode('utf-8', errors='ignore').decode('utf-8')
-        return s
-
-    def clean_dict(d):
-        if isinstance(d, dict):
-            return {k: clean_value(v) for k, v in d.items()}
-        return d
-
-    def clean_list(l):
-        if isinstance(l, list):
-            return [clean_value(v) for v in l]
-        return l
-
-    def clean_value(v):
-        if isinstance(v, str):
-            return clean_string(v)
-        elif isinstance(v, dict):
-            return clean_dict(v)
-        elif isinstance(v, list):
-            return clean_list(v)
-        return v
-
-    # Clean the output data
-    output = clean_value(output)
-    
-    # Convert to JSON with ASCII-only encoding
-    json_output = json.dumps(output, ensure_ascii=True)
-    
-    if output_file:
-        try:
-            with open(output_file, 'w', encoding='ascii') as f:
-                f.write(json_output)
-        except IOError as e:
-            print(f"Error writing to file {output_file}: {e}", file=sys.stderr)
-            sys.exit(1)
-    else:
-        print(json_output)
-    
-    return output
+        return event
+    return {
+        "tree": tree,
+        "focused_element": focused,
+        "queries": queries
+    }
+
+def write_output(output, output_file=None, output_format='json', metrics=None, utf8=False):
+    """
+    Stream output as ASCII-only JSON (or compact binary, or .npz columns) to
+    the output file or stdout, timing the serialize and write phases into
+    metrics. Strings were sanitised as nodes were read, so they are written
+    as they are; with utf8, JSON is written as compact UTF-8 instead.
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    options = dict(ensure_ascii=False, separators=COMPACT_SEPARATORS) if utf8 else {}
+    with metrics.phase('serialize'):
+        if output_format == 'npz':
+            columns = to_columns(output)
+            with metrics.phase('write'):
+                save_columns(output_file or sys.stdout.buffer, columns)
+            return
+
+        if output_format == 'compact':
+            if output_file:
+                try:
+                    with open(output_file, 'wb') as f:
+                        write_compact(output, metrics.timed_call('write', f.write))
+                except IOError as e:
+                    print(f"Error writing to file {output_file}: {e}", file=sys.stderr)
+                    sys.exit(1)
+            else:
+                write_compact(output, metrics.timed_call('write', sys.stdout.buffer.write))
+                sys.stdout.buffer.flush()
+            return
+
+        if output_file:
+            try:
+                with open(output_file, 'w', encoding='utf-8' if utf8 else 'ascii') as f:
+                    write_json(output, metrics.timed_call('write', f.write), **options)
+            except IOError as e:
+                print(f"Error writing to file {output_file}: {e}", file=sys.stderr)
+                sys.exit(1)
+        elif utf8:
+            # The console code page may not cover the text; write the bytes
+            write_json(output, metrics.timed_call('write', lambda text: sys.stdout.buffer.write(text.encode('utf-8'))),
+                       **options)
+            sys.stdout.buffer.write(b'\n')
+            sys.stdout.buffer.flush()
+        else:
+            write_json(output, metrics.timed_call('write', sys.stdout.write))
+            sys.stdout.write('\n')
+
+def save_accessibility_tree(output_file=None, event_format=False, patch_log=None, keyframe_interval=60,
+                            output_format='json', offline_queries=False, metrics_file=None, profile=None,
+                            profile_interval=0.005, utf8=False, store=None, **session_options):
+    """
+    Take one snapshot. With metrics_file, its metrics (including serialize
+    and write) are appended there as a JSON line; with profile, it is
+    profiled into that file (see axcore.metrics.profiled). With store, the
+    output is archived in that axcore.store.SnapshotStore instead of printed.
+    """
+    session = create_session(spatial=offline_queries, **session_options)
+    metrics = Metrics()
+    start_time = int(time.time() * 1000)
+    try:
+        with profiled(profile, profile_interval):
+            if patch_log:
+                # Append as keyframe/delta instead of printing the full event
+                output = build_snapshot(session, True, offline_queries=offline_queries, metrics=metrics)
+                with metrics.phase('write'):
+                    EventLogWriter(patch_log, keyframe_interval).write(output)
+            elif store:
+                output = build_snapshot(session, event_format, offline_queries=offline_queries, metrics=metrics)
+                with metrics.phase('write'), SnapshotStore(store) as snapshots:
+                    snapshots.add(output, start_time)
+            else:
+                # Windows are serialised as their walks complete (columns need the whole tree)
+                output = build_snapshot(session, event_format, stream=output_format != 'npz',
+                                        offline_queries=offline_queries, metrics=metrics)
+                write_output(output, output_file, output_format, metrics, utf8)
+        session.history.save()
+    finally:
+        session.close()
+    if metrics_file:
+        write_metrics(metrics_file, {"time": start_time, "duration": int(time.time() * 1000) - start_time,
+                                     **metrics.as_dict()})
+
+def serve_accessibility_tree(patch_log=None, keyframe_interval=60, offline_queries=False, watch=False,
+                             event_window=0.05, event_max_delay=0.5, event_rate=None, **session_options):
+    """
+    Answer snapshot/focused/point/hit/rect requests over stdin/stdout until EOF.
+
+    With watch, the windows are mirrored from UIA events and the live and
+    changes commands answer from the mirror without UIA calls. Events are
+    coalesced per element (see axcore/coalesce.py) with the event_* options.
+    """
+    session = create_session(spatial=True, **session_options)
+    writer = EventLogWriter(patch_log, keyframe_interval) if patch_log else None
+
+    def snapshot(event=False):
+        if writer is None:
+            return build_snapshot(session, event, offline_queries=offline_queries)
+        # Log the event and answer with the keyframe/delta record
+        return writer.write(build_snapshot(session, True, offline_queries=offline_queries))
+
+    handlers = {
+        "snapshot": snapshot,
+        "focused": session.focused,
+        "point": session.point,
+        # Answered from the last snapshot without touching the live desktop
+        "hit": session.indexed_point,
+        "rect": session.rect,
+    }
+    unsubscribe = coalescer = None
+    try:
+        if watch:
+            # Handlers only queue events; UIA must not be called back from its event threads
+            live = session.watch()
+            coalescer = EventCoalescer(live, event_window, event_max_delay, event_rate)
+            unsubscribe = subscribe_uia_events(coalescer.put)
+            coalescer.start()
+            handlers.update({"live": live.snapshot, "changes": live.changes,
+                             "watch_stats": lambda: dict(live.stats(), events=coalescer.stats())})
+        serve(handlers)
+    finally:
+        if unsubscribe is not None:
+            unsubscribe()
+        if coalescer is not None:
+            coalescer.stop()
+        session.history.save()
+        session.close()
+
+def fields_argument(text):
+    """argparse type for --fields"""
+    try:
+        return parse_fields(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 def main():
     parser = argparse.ArgumentParser(description='Generate accessibility tree for all windows')
@@ -408,17 +433,133 @@ def main():
                       help='Maximum number of parallel workers (default: number of CPUs * 5)',
                       type=int,
                       default=None)
+    parser.add_argument('--processes',
+                      help='Walk windows in N worker processes, each with its own UIA client, instead of threads '
+                           '(windows are identified by handle; --incremental does not apply)',
+                      type=int,
+                      default=None)
     parser.add_argument('-e', '--event',
                       help='Output in event format with timing data',
                       action='store_true')
+    parser.add_argument('--serve',
+                      help='Stay resident and answer JSON-lines requests on stdin (snapshot, focused, point x,y)',
+                      action='store_true')
+    parser.add_argument('--watch',
+                      help='With --serve, mirror the windows from UIA structure/property/focus events and answer '
+                           'live (current tree) and changes since=N (change feed) requests from the mirror',
+                      action='store_true')
+    parser.add_argument('--event-window',
+                      help='With --watch, seconds an element must be quiet before its events are applied (default: 0.05)',
+                      type=float,
+                      default=0.05)
+    parser.add_argument('--event-max-delay',
+                      help='With --watch, apply a continuously changing element at least every N seconds (default: 0.5)',
+                      type=float,
+                      default=0.5)
+    parser.add_argument('--event-rate',
+                      help='With --watch, maximum coalesced element updates applied per second (default: unlimited)',
+                      type=float,
+                      default=None)
+    parser.add_argument('--cached',
+                      help='Fetch element properties with a UIA CacheRequest, one call per element\'s children, instead of per-property calls',
+                      action='store_true')
+    parser.add_argument('-b', '--budget',
+                      help='Global snapshot budget in seconds; windows get adaptive budgets, '
+                           'foreground and cursor windows first (overrides --timeout)',
+                      type=float,
+                      default=None)
+    parser.add_argument('--stats-file',
+                      help='JSON file remembering window sizes between runs for --budget scheduling',
+                      type=str,
+                      default=None)
+    parser.add_argument('--incremental',
+                      help='With --serve, reuse the attributes of unchanged elements from the previous snapshot',
+                      action='store_true')
+    parser.add_argument('--format',
+                      help='Output format: json (default), compact binary (see axcore/compact.py) '
+                           'or npz columns (see axcore/columnar.py)',
+                      choices=['json', 'compact', 'npz'],
+                      default='json')
+    parser.add_argument('--utf8',
+                      help='Write JSON as compact UTF-8 (no escapes for non-ASCII text, no whitespace) '
+                           'instead of ASCII-only',
+                      action='store_true')
+    parser.add_argument('--offline-queries',
+                      help='Answer the cursor/random point queries from the captured tree instead of live UIA calls',
+                      action='store_true')
+    parser.add_argument('--query-depth',
+                      help='Levels of the focused/point elements to read (default: 1, the element alone; '
+                           '0: whole subtree as before)',
+                      type=int,
+                      default=1)
+    parser.add_argument('--query-nodes',
+                      help='Maximum number of nodes read per focused/point query (default: unlimited)',
+                      type=int,
+                      default=None)
+    parser.add_argument('--no-ancestors',
+                      help='Do not attach the ancestor chain (window down to parent) to focused/point elements',
+                      action='store_true')
+    parser.add_argument('--patch-log',
+                      help='Append the event to this keyframe/delta log instead of printing it',
+                      type=str,
+                      default=None)
+    parser.add_argument('--store',
+                      help='Archive the snapshot in this SQLite store, sharing identical subtrees with the '
+                           'snapshots already in it (see axcore/store.py), instead of printing it',
+                      type=str,
+                      default=None)
+    parser.add_argument('--fields',
+                      help='Comma-separated element fields to read (default: all of '
+                           f"{','.join(FIELDS)}); e.g. name,role,bbox skips the value and state getters",
+                      type=fields_argument,
+                      default=None)
+    parser.add_argument('--keyframe-interval',
+                      help='Write a full keyframe to --patch-log at least every N events (default: 60)',
+                      type=int,
+                      default=60)
+    parser.add_argument('--prune',
+                      help='Skip elements with empty bounds, off every monitor or hidden behind other windows '
+                           '(and their subtrees)',
+                      action='store_true')
+    parser.add_argument('--prune-stubs',
+                      help='Like --prune, but keep skipped elements as stubs with "pruned" and "child_count"',
+                      action='store_true')
+    parser.add_argument('--metrics',
+                      help='Append per-phase timings, per-window node counts, provider calls and error counts '
+                           'of the snapshot to this JSON-lines file',
+                      type=str,
+                      default=None)
+    parser.add_argument('--profile',
+                      help='Profile the snapshot into this file: cProfile stats for a .prof path, '
+                           'sampled collapsed stacks of all threads otherwise',
+                      type=str,
+                      default=None)
+    parser.add_argument('--profile-interval',
+                      help='Seconds between stack samples for --profile (default: 0.005)',
+                      type=float,
+                      default=0.005)
     
     args = parser.parse_args()
+    session_options = dict(timeout=args.timeout, max_workers=args.workers, cached=args.cached,
+                           budget=args.budget, stats_file=args.stats_file, query_depth=args.query_depth,
+                           query_nodes=args.query_nodes, query_ancestors=not args.no_ancestors,
+                           fields=args.fields, field_stats=args.event or bool(args.metrics),
+                           processes=args.processes, prune=args.prune, prune_stubs=args.prune_stubs)
     
     try:
-        save_accessibility_tree(args.out, args.timeout, args.workers, args.event)
+        if args.serve:
+            serve_accessibility_tree(args.patch_log, args.keyframe_interval, args.offline_queries, args.watch,
+                                     args.event_window, args.event_max_delay, args.event_rate,
+                                     incremental=args.incremental, **session_options)
+        else:
+            save_accessibility_tree(args.out, args.event, args.patch_log, args.keyframe_interval,
+                                    args.format, args.offline_queries, args.metrics, args.profile,
+                                    args.profile_interval, args.utf8, store=args.store, **session_options)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == "__main__":
+    # --processes workers of the PyInstaller exe re-run it; this hands them to multiprocessing
+    multiprocessing.freeze_support()
     main()
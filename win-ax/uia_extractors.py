@@ -0,0 +1,761 @@
+"""
+UIA tree extraction helpers shared by the one-shot and serve modes of dump-tree.py.
+
+Everything here works on pywinauto wrapper objects by duck typing only
+(element_info, rectangle(), children(), is_*() ...), so it can be exercised
+off-Windows against fake controls.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+from axcore.events import LiveTree, UIEvent
+from axcore.scheduler import SizeHistory, fixed_budgets, plan_budgets
+from axcore.spatial import SpatialIndex
+from axcore.visibility import ScreenLayout
+from axcore.walker import (FIELDS, CountingProvider, Deadline, Provider, SubtreeCache, WalkStats, ancestor_chain,
+                           clean_text, walk_tree)
+
+def get_control_value(control, getters=None):
+    """Get control value trying multiple methods (default: all of VALUE_GETTERS)"""
+    value = ''
+
+    for func_name, _ in getters if getters is not None else VALUE_GETTERS:
+        try:
+            if func_name == "window_text":
+                val = control.window_text()
+                val = val if val != control.element_info.name else ''
+            else:
+                val = getattr(control, func_name)()
+            if val:
+                value = str(val)
+                break
+        except:
+            continue
+
+    return value
+
+def get_control_states(control, checks=None):
+    """Get all available control states (default: all of STATE_CHECKS)"""
+    states = {}
+
+    for state_name, func_name, _ in checks if checks is not None else STATE_CHECKS:
+        try:
+            if hasattr(control, func_name):
+                states[state_name] = getattr(control, func_name)()
+        except:
+            continue
+
+    return states
+
+class ControlCapabilities:
+    """
+    Memoised table of the value getters and state checks that can apply to
+    each control type.
+
+    Most checks need a UIA control pattern (is_checked needs Toggle,
+    is_collapsed ExpandCollapse...) and raise on controls without it. The
+    first `probe` controls of each control type and wrapper class are asked
+    which patterns they support (one property read per pattern); later
+    controls of that type only get the getters for patterns seen on them.
+
+    Args:
+        probe: Controls of each type whose patterns are read before the
+            entry is frozen
+    """
+
+    def __init__(self, probe=8):
+        self.probe = probe
+        self.table = {}  # (control type, wrapper class) -> [patterns seen, ids of controls probed, (checks, getters)]
+        self._lock = threading.Lock()
+
+    def getters(self, control):
+        """(state checks, value getters) to use for a control"""
+        key = (control.element_info.control_type, type(control))
+        entry = self.table.get(key)
+        if entry is not None and (len(entry[1]) >= self.probe or id(control) in entry[1]):
+            return entry[2]
+
+        patterns = available_patterns(control)
+        if patterns is None:
+            # Patterns unknown (not a UIA element): every getter may apply
+            return STATE_CHECKS, VALUE_GETTERS
+        with self._lock:
+            entry = self.table.setdefault(key, [set(), set(), None])
+            entry[0] |= patterns
+            seen = entry[0]
+            entry[2] = (
+                tuple(c for c in STATE_CHECKS if hasattr(control, c[1]) and c[2] in seen),
+                tuple(g for g in VALUE_GETTERS if hasattr(control, g[0]) and g[1] in seen),
+            )
+            entry[1].add(id(control))  # after entry[2] is set: readers do not take the lock
+            return entry[2]
+
+    def report(self):
+        """{control type: applicable state names} for the types seen so far"""
+        with self._lock:
+            return {f"{control_type}/{cls.__name__}": [check[0] for check in entry[2][0]]
+                    for (control_type, cls), entry in self.table.items() if entry[2] is not None}
+
+def available_patterns(control):
+    """Pattern availability property ids a control supports (and None), or None if it cannot tell"""
+    try:
+        get = control.element_info.element.GetCurrentPropertyValue
+        return {None} | {pid for pid in PATTERN_AVAILABLE_PROPERTY_IDS if get(pid)}
+    except Exception:
+        return None
+
+class UIAProvider(Provider):
+    """
+    Walker provider reading pywinauto UIA wrappers one property at a time
+
+    Args:
+        fields: Subset of axcore.walker.FIELDS to read (None = all)
+        capabilities: ControlCapabilities limiting the value getters and
+            state checks tried per control (None = try all of them)
+    """
+
+    def __init__(self, fields=None, capabilities=None):
+        self.fields = fields
+        self.capabilities = capabilities
+
+    def children(self, control):
+        return control.children()
+
+    def parent(self, control):
+        return control.parent()
+
+    def role(self, control):
+        return control.element_info.control_type
+
+    def name(self, control):
+        return control.element_info.name
+
+    def description(self, control):
+        return getattr(control.element_info, 'description', '')
+
+    def value(self, control):
+        if self.capabilities is None:
+            return get_control_value(control)
+        return get_control_value(control, self.capabilities.getters(control)[1])
+
+    def bounds(self, control):
+        rect = control.rectangle()
+        return (rect.left, rect.top, rect.width(), rect.height())
+
+    def states(self, control):
+        if self.capabilities is None:
+            return get_control_states(control)
+        return get_control_states(control, self.capabilities.getters(control)[0])
+
+    def identity(self, control):
+        runtime_id = control.element_info.runtime_id
+        return tuple(runtime_id) if runtime_id else None
+
+UIA_PROVIDER = UIAProvider(capabilities=ControlCapabilities())
+
+# Provider methods reported under another output field name
+FIELD_METHODS = {'bounds': 'bbox'}
+
+def parse_fields(text):
+    """Parse a comma-separated field list (e.g. for --fields) into FIELDS order"""
+    fields = [field.strip() for field in text.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (choose from {', '.join(FIELDS)})")
+    return tuple(field for field in FIELDS if field in fields)
+
+# UIA property ids watched in watch mode (Name, ValueValue, BoundingRectangle,
+# IsEnabled, IsOffscreen, ToggleToggleState, ExpandCollapseExpandCollapseState,
+# SelectionItemIsSelected) and the output field of those whose new value is usable as is
+WATCHED_PROPERTIES = (30005, 30045, 30001, 30010, 30022, 30086, 30070, 30079)
+EVENT_FIELDS = {30005: 'name', 30045: 'value'}
+
+def property_event(control, property_id, new_value):
+    """UIEvent for a UIA property-changed event; other than text fields, the element is re-read"""
+    field = EVENT_FIELDS.get(property_id)
+    if field is not None and isinstance(new_value, str) and (new_value or field == 'name'):
+        return UIEvent(UIEvent.PROPERTY, control, {field: clean_text(new_value)})
+    return UIEvent(UIEvent.PROPERTY, control)
+
+def get_element_info(control, deadline=None, max_nodes=None, stats=None, cache=None, provider=UIA_PROVIDER,
+                     prune=None):
+    """Get comprehensive element information using the shared tree walker"""
+    try:
+        return walk_tree(provider, control, deadline=deadline, max_nodes=max_nodes, stats=stats, cache=cache,
+                         prune=prune)
+    except Exception as e:
+        print(f"Error in get_element_info: {e}", file=sys.stderr)
+        if stats is not None:
+            stats.errors[type(e).__name__] += 1
+        return None
+
+# UIA property ids fetched in bulk by the cached strategy
+UIA_RuntimeIdPropertyId = 30000
+UIA_BoundingRectanglePropertyId = 30001
+UIA_ControlTypePropertyId = 30003
+UIA_NamePropertyId = 30005
+UIA_HasKeyboardFocusPropertyId = 30008
+UIA_IsKeyboardFocusablePropertyId = 30009
+UIA_IsEnabledPropertyId = 30010
+UIA_HelpTextPropertyId = 30013
+UIA_IsOffscreenPropertyId = 30022
+UIA_IsExpandCollapsePatternAvailablePropertyId = 30028
+UIA_IsRangeValuePatternAvailablePropertyId = 30033
+UIA_IsSelectionItemPatternAvailablePropertyId = 30036
+UIA_IsSelectionPatternAvailablePropertyId = 30037
+UIA_IsTogglePatternAvailablePropertyId = 30041
+UIA_IsValuePatternAvailablePropertyId = 30043
+UIA_IsWindowPatternAvailablePropertyId = 30044
+UIA_ValueValuePropertyId = 30045
+UIA_ValueIsReadOnlyPropertyId = 30046
+UIA_RangeValueValuePropertyId = 30047
+UIA_SelectionIsSelectionRequiredPropertyId = 30061
+UIA_ExpandCollapseExpandCollapseStatePropertyId = 30070
+UIA_WindowWindowVisualStatePropertyId = 30075
+UIA_SelectionItemIsSelectedPropertyId = 30079
+UIA_ToggleToggleStatePropertyId = 30086
+
+PATTERN_AVAILABLE_PROPERTY_IDS = (
+    UIA_IsExpandCollapsePatternAvailablePropertyId,
+    UIA_IsRangeValuePatternAvailablePropertyId,
+    UIA_IsSelectionItemPatternAvailablePropertyId,
+    UIA_IsSelectionPatternAvailablePropertyId,
+    UIA_IsTogglePatternAvailablePropertyId,
+    UIA_IsValuePatternAvailablePropertyId,
+    UIA_IsWindowPatternAvailablePropertyId,
+)
+
+# (state, wrapper method, pattern availability property it needs or None)
+STATE_CHECKS = (
+    ("enabled", "is_enabled", None),
+    ("visible", "is_visible", None),
+    ("focused", "is_focused", None),
+    ("minimized", "is_minimized", UIA_IsWindowPatternAvailablePropertyId),
+    ("maximized", "is_maximized", UIA_IsWindowPatternAvailablePropertyId),
+    ("collapsed", "is_collapsed", UIA_IsExpandCollapsePatternAvailablePropertyId),
+    ("expanded", "is_expanded", UIA_IsExpandCollapsePatternAvailablePropertyId),
+    ("selected", "is_selected", UIA_IsSelectionItemPatternAvailablePropertyId),
+    ("checked", "is_checked", UIA_IsTogglePatternAvailablePropertyId),
+    ("checkable", "is_checkable", UIA_IsTogglePatternAvailablePropertyId),
+    ("editable", "is_editable", UIA_IsValuePatternAvailablePropertyId),
+    ("pressable", "is_pressable", None),
+    ("pressed", "is_pressed", None),
+    ("keyboard_focusable", "is_keyboard_focusable", None),
+    ("keyboard_focused", "is_keyboard_focused", None),
+    ("selection_required", "is_selection_required", UIA_IsSelectionPatternAvailablePropertyId),
+)
+
+# (wrapper method, pattern availability property it needs or None), tried in order
+VALUE_GETTERS = (
+    ("get_value", UIA_IsValuePatternAvailablePropertyId),
+    ("value", UIA_IsRangeValuePatternAvailablePropertyId),
+    ("get_position", UIA_IsRangeValuePatternAvailablePropertyId),
+    ("window_text", None),
+)
+
+CACHED_PROPERTY_IDS = [
+    UIA_RuntimeIdPropertyId,
+    UIA_BoundingRectanglePropertyId,
+    UIA_ControlTypePropertyId,
+    UIA_NamePropertyId,
+    UIA_HasKeyboardFocusPropertyId,
+    UIA_IsKeyboardFocusablePropertyId,
+    UIA_IsEnabledPropertyId,
+    UIA_HelpTextPropertyId,
+    UIA_IsOffscreenPropertyId,
+    UIA_IsExpandCollapsePatternAvailablePropertyId,
+    UIA_IsRangeValuePatternAvailablePropertyId,
+    UIA_IsSelectionItemPatternAvailablePropertyId,
+    UIA_IsSelectionPatternAvailablePropertyId,
+    UIA_IsTogglePatternAvailablePropertyId,
+    UIA_IsValuePatternAvailablePropertyId,
+    UIA_IsWindowPatternAvailablePropertyId,
+    UIA_ValueValuePropertyId,
+    UIA_ValueIsReadOnlyPropertyId,
+    UIA_RangeValueValuePropertyId,
+    UIA_SelectionIsSelectionRequiredPropertyId,
+    UIA_ExpandCollapseExpandCollapseStatePropertyId,
+    UIA_WindowWindowVisualStatePropertyId,
+    UIA_SelectionItemIsSelectedPropertyId,
+    UIA_ToggleToggleStatePropertyId,
+]
+
+TreeScope_Element = 1
+TreeScope_Children = 2
+ExpandCollapseState_Collapsed = 0
+ExpandCollapseState_Expanded = 1
+ToggleState_On = 1
+WindowVisualState_Maximized = 1
+WindowVisualState_Minimized = 2
+
+def create_cache_request(iuia):
+    """Build a CacheRequest for every property we serialise, element by element in the raw view"""
+    request = iuia.CreateCacheRequest()
+    for property_id in CACHED_PROPERTY_IDS:
+        request.AddProperty(property_id)
+    request.TreeScope = TreeScope_Element
+    request.TreeFilter = iuia.CreateTrueCondition()  # raw view, same as children()
+    return request
+
+
+class CachedUIAProvider(Provider):
+    """
+    Walker provider over raw UIA elements whose properties are fetched in
+    bulk with a CacheRequest: prefetch() fetches the window element and
+    children() all children of one element in a single FindAllBuildCache
+    call. Every attribute read is served from the client-side cache, and
+    the walk checks its deadline and node budget between fetches, so large
+    windows are truncated instead of blocking on one whole-subtree fetch.
+
+    Args:
+        cache_request: IUIAutomationCacheRequest from create_cache_request
+        control_types: Mapping of UIA control type id to name
+        fields: Subset of axcore.walker.FIELDS to read (None = all)
+    """
+
+    def __init__(self, cache_request, control_types, fields=None):
+        self.cache_request = cache_request
+        self.control_types = control_types
+        self.fields = fields
+
+    def prefetch(self, element):
+        return element.BuildUpdatedCache(self.cache_request)
+
+    def children(self, element):
+        found = element.FindAllBuildCache(TreeScope_Children, self.cache_request.TreeFilter, self.cache_request)
+        if not found:
+            return []
+        return [found.GetElement(i) for i in range(found.Length)]
+
+    def role(self, element):
+        return self.control_types.get(element.CachedControlType, '')
+
+    def name(self, element):
+        return element.CachedName
+
+    def description(self, element):
+        return element.CachedHelpText
+
+    def value(self, element):
+        prop = element.GetCachedPropertyValue
+        if prop(UIA_IsValuePatternAvailablePropertyId):
+            value = prop(UIA_ValueValuePropertyId)
+        elif prop(UIA_IsRangeValuePatternAvailablePropertyId):
+            value = prop(UIA_RangeValueValuePropertyId)
+        else:
+            value = ''
+        return str(value) if value else ''
+
+    def bounds(self, element):
+        rect = element.CachedBoundingRectangle
+        return (rect.left, rect.top, rect.right - rect.left, rect.bottom - rect.top)
+
+    def states(self, element):
+        prop = element.GetCachedPropertyValue
+        states = {
+            "enabled": bool(element.CachedIsEnabled),
+            "visible": not element.CachedIsOffscreen,
+            "focused": bool(element.CachedHasKeyboardFocus),
+            "keyboard_focusable": bool(element.CachedIsKeyboardFocusable),
+            "keyboard_focused": bool(element.CachedHasKeyboardFocus),
+        }
+        if prop(UIA_IsWindowPatternAvailablePropertyId):
+            visual_state = prop(UIA_WindowWindowVisualStatePropertyId)
+            states["minimized"] = visual_state == WindowVisualState_Minimized
+            states["maximized"] = visual_state == WindowVisualState_Maximized
+        if prop(UIA_IsExpandCollapsePatternAvailablePropertyId):
+            expand_state = prop(UIA_ExpandCollapseExpandCollapseStatePropertyId)
+            states["collapsed"] = expand_state == ExpandCollapseState_Collapsed
+            states["expanded"] = expand_state == ExpandCollapseState_Expanded
+        if prop(UIA_IsSelectionItemPatternAvailablePropertyId):
+            states["selected"] = bool(prop(UIA_SelectionItemIsSelectedPropertyId))
+        if prop(UIA_IsTogglePatternAvailablePropertyId):
+            states["checked"] = prop(UIA_ToggleToggleStatePropertyId) == ToggleState_On
+            states["checkable"] = True
+        if prop(UIA_IsValuePatternAvailablePropertyId):
+            states["editable"] = not prop(UIA_ValueIsReadOnlyPropertyId)
+        if prop(UIA_IsSelectionPatternAvailablePropertyId):
+            states["selection_required"] = bool(prop(UIA_SelectionIsSelectionRequiredPropertyId))
+        return states
+
+    def identity(self, element):
+        runtime_id = element.GetCachedPropertyValue(UIA_RuntimeIdPropertyId)
+        return tuple(runtime_id) if runtime_id else None
+
+
+def get_element_info_cached(control, provider, deadline=None, max_nodes=None, stats=None, cache=None, prune=None):
+    """Get element information with one bulk fetch of the control and one per element's children"""
+    try:
+        element = provider.prefetch(control.element_info.element)
+        return walk_tree(provider, element, deadline=deadline, max_nodes=max_nodes, stats=stats, cache=cache,
+                         prune=prune)
+    except Exception as e:
+        print(f"Error in get_element_info_cached: {e}", file=sys.stderr)
+        if stats is not None:
+            stats.errors[type(e).__name__] += 1
+        return None
+
+def prune_tree(node, max_depth=None, max_nodes=None):
+    """Copy of a captured node limited like walk_tree to max_depth levels and max_nodes nodes"""
+    root = dict(node, children=[])
+    queue = [(node, root, 1)]
+    count = 1
+    for source, copy, depth in queue:
+        if max_depth is not None and depth >= max_depth:
+            continue
+        for child in source.get("children") or []:
+            if max_nodes is not None and count >= max_nodes:
+                root["truncated"] = True
+                root["node_count"] = count
+                return root
+            child_copy = dict(child, children=[])
+            copy["children"].append(child_copy)
+            queue.append((child, child_copy, depth + 1))
+            count += 1
+    return root
+
+def window_key(window):
+    """Stable key for a top-level window: its native handle, else its name"""
+    try:
+        handle = window.handle
+    except:
+        handle = None
+    return str(handle) if handle else clean_text(window.element_info.name)
+
+def iter_windows_tree(plan, executor, element_info=get_element_info, snapshot_deadline=None, caches=None,
+                      rank=None):
+    """
+    Walk the planned windows (WindowBudgets) on the given executor, yielding
+    each window's tree as soon as its walk completes, or with rank (budget ->
+    sort key) in rank order, each as soon as every window before it is done.
+
+    Each window's Deadline starts when a worker picks it up and also ends
+    with the snapshot deadline; windows that run out of budget come back as
+    partial trees marked truncated. Each budget is filled in with the nodes
+    and time its walk actually used. With `caches` (window key ->
+    SubtreeCache) unchanged nodes are reused from the previous snapshot.
+    Budgets with a VisibilityFilter (budget.prune) pass it to element_info
+    as its prune keyword.
+    """
+    futures = {}
+
+    def process_window(budget):
+        stats = WalkStats()
+        deadline = Deadline(budget.seconds, parent=snapshot_deadline)
+        cache = caches.get(budget.key) if caches is not None else None
+        if budget.prune is None:
+            info = element_info(budget.window, deadline, budget.max_nodes, stats, cache)
+        else:
+            info = element_info(budget.window, deadline, budget.max_nodes, stats, cache, prune=budget.prune)
+        budget.nodes, budget.truncated, budget.elapsed = stats.nodes, stats.truncated, stats.elapsed
+        budget.reused, budget.errors, budget.pruned = stats.reused, dict(stats.errors), stats.pruned
+        budget.tree = info
+        return info
+
+    for budget in plan:
+        try:
+            futures[executor.submit(process_window, budget)] = budget
+        except Exception as e:
+            print(f"Error submitting window task: {e}", file=sys.stderr)
+
+    if rank is None:
+        ordered = as_completed(futures)
+    else:
+        ordered = sorted(futures, key=lambda future: rank(futures[future]))
+    for future in ordered:
+        try:
+            window_info = future.result()
+            if window_info:
+                if window_info.get("truncated"):
+                    print(f"Truncated window after {window_info['elapsed_ms']} ms "
+                          f"({window_info['node_count']} nodes)", file=sys.stderr)
+                yield window_info
+        except Exception as e:
+            print(f"Error processing window: {e}", file=sys.stderr)
+
+def get_windows_tree(plan, executor, element_info=get_element_info, snapshot_deadline=None, caches=None,
+                     rank=None):
+    """Walk the planned windows and return the list of window trees in completion (or rank) order"""
+    return list(iter_windows_tree(plan, executor, element_info, snapshot_deadline, caches, rank))
+
+class TreeSession:
+    """
+    Long-lived extraction state: the desktop root, the UIA element locators,
+    the worker pool and the window size history are created once and reused
+    for every request.
+
+    Args:
+        desktop: Object exposing windows() (pywinauto Desktop or a fake)
+        focused_element: Callable returning the focused control wrapper
+        element_from_point: Callable (x, y) returning the control wrapper at that point
+        timeout_seconds: Maximum time to spend processing each window
+        max_workers: Maximum number of parallel workers
+        cached_provider: CachedUIAProvider to fetch each subtree in bulk
+            instead of reading wrappers one property at a time
+        budget_seconds: Global snapshot budget; when set, windows are
+            scheduled with plan_budgets instead of a fixed per-window timeout
+        history: SizeHistory of previous window walks
+        priority_windows: Callable returning the keys of windows to walk first
+        incremental: Reuse the attributes of unchanged nodes from the previous snapshot
+        spatial: Keep the last snapshot's windows in z-order to answer point
+            and rect queries from a SpatialIndex instead of live UIA calls
+        query_depth: Levels of the focused/point element to read (1: the
+            element alone, 0 or None: its whole subtree)
+        query_nodes: Maximum number of nodes read per focused/point query
+        query_ancestors: Attach the ancestor chain up to the window to
+            focused/point elements
+        fields: Subset of axcore.walker.FIELDS read per element (None = all)
+        field_stats: Count calls and time per provider method during
+            snapshot walks into last_fields (per-property strategy only)
+        process_walker: axcore.procwalk.ProcessWalker walking the windows
+            in worker processes (by window key) instead of on the thread
+            pool; incremental reuse and field_stats do not apply to it
+        displays: Callable returning the display rectangles (x, y, width,
+            height); when set, elements that are empty, off every display or
+            hidden behind the windows in front are pruned from snapshot
+            walks (see axcore/visibility.py)
+        opaque: Predicate for the windows that hide what is behind them
+            (default: every visible window)
+        prune_stubs: Keep pruned elements as stubs with their child count
+
+    After watch(), `live` mirrors the visible windows and is kept current
+    by applying UIA events to it instead of re-walking.
+    """
+
+    def __init__(self, desktop, focused_element, element_from_point, timeout_seconds=5, max_workers=None,
+                 cached_provider=None, budget_seconds=None, history=None, priority_windows=None,
+                 incremental=False, spatial=False, query_depth=1, query_nodes=None, query_ancestors=True,
+                 fields=None, field_stats=False, process_walker=None, displays=None, opaque=None,
+                 prune_stubs=False):
+        self.desktop = desktop
+        self.focused_element = focused_element
+        self.element_from_point = element_from_point
+        self.timeout_seconds = timeout_seconds
+        self.workers = max_workers or min(32, (os.cpu_count() or 1) + 4)  # ThreadPoolExecutor default
+        self.process_walker = process_walker
+        if process_walker is not None:
+            self.workers = process_walker.workers
+            incremental = field_stats = False
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.cached_provider = cached_provider
+        self.budget_seconds = budget_seconds
+        self.history = history if history is not None else SizeHistory()
+        self.priority_windows = priority_windows
+        self.subtree_caches = {} if incremental else None
+        self.last_report = []
+        self.spatial = spatial
+        self.last_windows = None
+        self._spatial_index = None
+        self.query_depth = query_depth
+        self.query_nodes = query_nodes
+        self.query_ancestors = query_ancestors
+        self.live = None
+        # Capabilities learned per control type are shared with UIA_PROVIDER
+        self.provider = UIAProvider(fields, UIA_PROVIDER.capabilities)
+        self.field_counter = CountingProvider(self.provider) if field_stats and cached_provider is None else None
+        self.last_fields = None
+        self.displays = displays
+        self.opaque = opaque
+        self.prune_stubs = prune_stubs
+
+    def element_info(self, control, deadline=None, max_nodes=None, stats=None, cache=None, prune=None):
+        """Get element information with the session's traversal strategy"""
+        if self.cached_provider is not None:
+            return get_element_info_cached(control, self.cached_provider, deadline, max_nodes, stats, cache, prune)
+        return get_element_info(control, deadline, max_nodes, stats, cache, self.field_counter or self.provider,
+                                prune)
+
+    def plan(self, windows):
+        """Plan window budgets and the snapshot deadline for one snapshot"""
+        if self.budget_seconds is None:
+            return fixed_budgets(windows, self.timeout_seconds, window_key), None
+
+        priority = set()
+        if self.priority_windows is not None:
+            try:
+                priority = {str(k) for k in self.priority_windows()}
+            except Exception as e:
+                print(f"Error getting priority windows: {e}", file=sys.stderr)
+        plan = plan_budgets(windows, self.budget_seconds, self.history, window_key, priority, self.workers)
+        return plan, Deadline(self.budget_seconds)
+
+    def layout(self, windows):
+        """ScreenLayout of the displays and the opaque windows (front to back), or None if not pruning"""
+        if self.displays is None:
+            return None
+        try:
+            displays = self.displays()
+        except Exception as e:
+            print(f"Error getting displays: {e}", file=sys.stderr)
+            displays = []
+        opaque = []
+        # Desktop.windows() enumerates top-level windows front to back
+        for window in windows:
+            try:
+                if self.opaque is None or self.opaque(window):
+                    opaque.append((window_key(window), UIA_PROVIDER.bounds(window)))
+            except Exception as e:
+                print(f"Error getting window bounds: {e}", file=sys.stderr)
+        return ScreenLayout(displays, opaque, self.prune_stubs)
+
+    def iter_windows_tree(self, metrics=None):
+        """
+        Yield the accessibility tree of each visible window in z-order (front to
+        back), each as soon as its walk and those of the windows above it complete.
+
+        The size history and last_report are updated once the generator is
+        exhausted. With `metrics` (axcore.metrics.Metrics), enumerating and
+        planning the windows is timed as its enumerate phase and its windows,
+        calls and errors are filled in from the walks.
+        """
+        try:
+            with metrics.phase('enumerate') if metrics is not None else nullcontext():
+                windows = [w for w in self.desktop.windows() if w.is_visible()]
+                plan, deadline = self.plan(windows)
+                self.history.begin(budget.key for budget in plan)
+                layout = self.layout(windows)
+                if layout is not None:
+                    for budget in plan:
+                        budget.prune = layout.filter(budget.key)
+            if self.subtree_caches is not None:
+                # Keep caches of windows that still exist, start new ones empty
+                self.subtree_caches = {budget.key: self.subtree_caches.get(budget.key) or SubtreeCache()
+                                       for budget in plan}
+        except Exception as e:
+            print(f"Error getting desktop windows: {e}", file=sys.stderr)
+            if metrics is not None:
+                metrics.error(e)
+            return
+
+        # Desktop.windows() enumerates top-level windows front to back; trees are yielded in that
+        # order so that saved snapshots keep the stacking that axcore.spatial hit-tests against
+        z_order = {id(window): z for z, window in enumerate(windows)}
+
+        def rank(budget):
+            return z_order[id(budget.window)]
+
+        if self.process_walker is not None:
+            yield from self.process_walker.iter_windows_tree(plan, deadline, rank)
+        else:
+            if self.field_counter is not None:
+                self.field_counter.report(reset=True)
+            yield from iter_windows_tree(plan, self.executor, self.element_info, deadline, self.subtree_caches,
+                                         rank)
+
+        if self.field_counter is not None:
+            self.last_fields = {FIELD_METHODS.get(method, method): entry
+                                for method, entry in self.field_counter.report(reset=True).items()}
+        for budget in plan:
+            self.history.record(budget.key, budget.nodes, budget.elapsed, budget.truncated)
+        self.last_report = [budget.report() for budget in plan]
+        if self.spatial:
+            ordered = sorted(plan, key=rank)
+            self.last_windows = [budget.tree for budget in ordered if budget.tree]
+            self._spatial_index = None
+        if metrics is not None:
+            metrics.windows = {budget.key: budget.nodes for budget in plan}
+            metrics.calls = self.last_fields
+            for budget in plan:
+                for kind, count in budget.errors.items():
+                    metrics.error(kind, count)
+
+    def windows_tree(self, metrics=None):
+        """Get the accessibility tree of all visible windows"""
+        return list(self.iter_windows_tree(metrics))
+
+    def query_limits(self, max_depth=None, max_nodes=None, ancestors=None):
+        """Resolve per-query limits against the session defaults (0 means unlimited)"""
+        max_depth = self.query_depth if max_depth is None else max_depth
+        max_nodes = self.query_nodes if max_nodes is None else max_nodes
+        ancestors = self.query_ancestors if ancestors is None else ancestors
+        return max_depth or None, max_nodes or None, ancestors
+
+    def query(self, control, max_depth=None, max_nodes=None, ancestors=None):
+        """
+        Read a queried element with bounded descendants.
+
+        Reads go through the live per-property provider (a bulk subtree
+        prefetch would defeat the bounds). The node gets "ancestors" (window
+        down to parent, without children) and "provider_calls" (calls per
+        provider method, including the ancestor reads).
+        """
+        max_depth, max_nodes, ancestors = self.query_limits(max_depth, max_nodes, ancestors)
+        provider = CountingProvider(self.provider)
+        node = walk_tree(provider, control, max_depth=max_depth, max_nodes=max_nodes)
+        if ancestors:
+            node["ancestors"] = ancestor_chain(provider, control)
+        node["provider_calls"] = dict(provider.calls)
+        return node
+
+    def focused(self, max_depth=None, max_nodes=None, ancestors=None, metrics=None):
+        """Get the currently focused element (failures are counted in metrics)"""
+        try:
+            return self.query(self.focused_element(), max_depth, max_nodes, ancestors)
+        except Exception as e:
+            print("Failed to get focused element", file=sys.stderr)
+            if metrics is not None:
+                metrics.error(e)
+            return None
+
+    def point(self, x, y, max_depth=None, max_nodes=None, ancestors=None, metrics=None):
+        """Get element at specific screen coordinates (failures are counted in metrics)"""
+        try:
+            element = self.query(self.element_from_point(x, y), max_depth, max_nodes, ancestors)
+        except Exception as e:
+            print(f"Failed to get element at ({x}, {y})", file=sys.stderr)
+            if metrics is not None:
+                metrics.error(e)
+            element = None
+        return {
+            "position": {"x": x, "y": y},
+            "element": element
+        }
+
+    def spatial_index(self):
+        """SpatialIndex of the last snapshot's windows (requires spatial=True)"""
+        if self.last_windows is None:
+            raise RuntimeError("No snapshot taken with spatial indexing enabled")
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(self.last_windows)
+        return self._spatial_index
+
+    def indexed_point(self, x, y, max_depth=None, max_nodes=None, ancestors=None):
+        """Get the element at specific screen coordinates from the last snapshot"""
+        max_depth, max_nodes, ancestors = self.query_limits(max_depth, max_nodes, ancestors)
+        index = self.spatial_index()
+        hit = index.hit_index(x, y)
+        element = None
+        if hit >= 0:
+            element = prune_tree(index.nodes[hit], max_depth, max_nodes)
+            if ancestors:
+                element["ancestors"] = [
+                    {k: v for k, v in index.nodes[i].items() if k != "children"}
+                    for i in index.ancestors(hit)[:-1]
+                ]
+        return {
+            "position": {"x": x, "y": y},
+            "element": element
+        }
+
+    def rect(self, x, y, width, height):
+        """Elements of the last snapshot intersecting a rectangle, without their children"""
+        return [
+            {k: v for k, v in node.items() if k != "children"}
+            for node in self.spatial_index().intersecting(x, y, width, height)
+        ]
+
+    def watch(self, feed_size=10000):
+        """Walk the visible windows into a LiveTree (self.live) to be updated from UI events"""
+        self.live = LiveTree(self.provider, lambda: [w for w in self.desktop.windows() if w.is_visible()],
+                             feed_size)
+        self.live.load()
+        return self.live
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.process_walker is not None:
+            self.process_walker.close()